@@ -1,29 +1,274 @@
 import argparse
 import os
-from src.utils.io import load_profiles, load_client_files, write_results, write_missing_report
-from src.pipeline.preprocess import build_clients_agg
-from src.pipeline.features import compute_all_signals
-from src.pipeline.scorer import compute_scores_and_select
-from src.pipeline.generator import generate_pushes_batch
-from src.eval.evaluate import evaluate_results
+from src.utils.io import load_profiles, scan_client_files, load_client_files, load_client_tables, write_result_columns, write_missing_report, write_date_format_report, write_paraphrase_report, write_fx_report, write_client_cache_report, write_allocation_report
+from src.utils.client_cache import ClientFileCache, CLIENT_CACHE_MB
+from src.pipeline.preprocess import build_clients_agg, DATE_FORMAT_HITS
+from src.pipeline.features import compute_all_signals, compute_signals_frame
+from src.pipeline.ir import ClientTable
+from src.pipeline.scorer import score_table
+from src.pipeline.generator import generate_pushes_table, make_paraphrase_engine
+from src.pipeline.paraphrase import AI_CONCURRENCY, AI_RATE
+from src.pipeline.stream import run_stream, STREAM_CHUNK_SIZE
+from src.pipeline.fx import load_fx_rates, FX_STATS
+from src.pipeline.ranking import make_rank_engine, load_rank_engine, RANK_MODES, SKETCH_K
+from src.pipeline.incremental import run_incremental, WINDOW_MONTHS
+from src.pipeline.allocation import load_product_caps, ALLOCATION_MODES, ALLOCATION_REPORT
+from src.pipeline.simulate import load_grid, run_simulation, varying_columns
+from src.pipeline.service import ScoringService, fit_service_ranks, serve, BATCH_MAX, BATCH_WAIT_MS
+from src.pipeline.parallel import compute_signals_parallel, generate_pushes_parallel
+from src.eval.evaluate import evaluate_columns
+from src.utils.debug_sink import open_debug_sink, DEBUG_LEVELS
+from src.utils.metrics import start_run, finish_run, stage, parse_profile_stages, format_stages, PROFILE_KINDS
+
+def report_paraphrase(engine, debug_dir):
+    if engine is None:
+        return
+    stats = engine.stats()
+    engine.close()
+    write_paraphrase_report(stats, debug_dir)
+    latency = f", p50 {stats['latency_p50_ms']:.0f} ms, p99 {stats['latency_p99_ms']:.0f} ms" if stats["requests"] else ""
+    print(f"AI: {stats['requests']} requests{latency}, cache hit rate {stats['cache_hit_rate']:.0%}")
+
+def save_ranks(ranks, path):
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        ranks.save(path)
+
+def report_allocation(caps, debug_dir):
+    if caps is None:
+        return
+    write_allocation_report(ALLOCATION_REPORT, debug_dir)
+    r = ALLOCATION_REPORT
+    print(f"Allocation ({r['method']}): {r['moved']} clients moved off their top product, {r['unassigned']} without a product, "
+          f"score {r['score_total']:.1f} of {r['score_total_uncapped']:.1f} uncapped")
+
+def report_archive(archive, run, suppressed):
+    if archive is None:
+        return
+    stats = archive.stats()
+    count = archive.meta["runs"][run]["count"]
+    archive.close()
+    repeats = f", {suppressed} repeats suppressed" if suppressed is not None else ""
+    print(f"Archive: {count} pushes added as run {archive.meta['runs'][run]['run_id']}{repeats}; "
+          f"{stats['records']} records for {stats['clients']} clients in total")
+
+def finish_report(args, mode, clients, engine):
+    extra = {"ai": engine.stats()} if engine is not None else {}
+    report = finish_run(args.debug_dir, mode, textfile=args.metrics_textfile, clients=clients, **extra)
+    print(f"Stages: {format_stages(report)}")
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--data-dir", required=True)
-    parser.add_argument("--output", required=True)
+    parser.add_argument("--output", default=None)
     parser.add_argument("--use-ai", choices=["true","false"], default="false")
+    parser.add_argument("--ai-concurrency", type=int, default=AI_CONCURRENCY)
+    parser.add_argument("--ai-rate", type=float, default=AI_RATE)
+    parser.add_argument("--ai-cache", default=None)
     parser.add_argument("--debug-dir", default="debug")
+    parser.add_argument("--debug-level", choices=DEBUG_LEVELS, default="none")
+    parser.add_argument("--bulk-load", choices=["true","false"], default="false")
+    parser.add_argument("--table-cache", default=None)
+    parser.add_argument("--client-cache", metavar="DIR", default=None)
+    parser.add_argument("--client-cache-mb", type=int, default=CLIENT_CACHE_MB)
+    parser.add_argument("--fx-rates", metavar="PATH", default=None)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--rank-mode", choices=RANK_MODES, default="exact")
+    parser.add_argument("--rank-sketch-k", type=int, default=SKETCH_K)
+    parser.add_argument("--rank-load", metavar="PATH", default=None)
+    parser.add_argument("--rank-save", metavar="PATH", default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--incremental", metavar="STATE_DIR", default=None)
+    parser.add_argument("--window-months", type=int, default=WINDOW_MONTHS)
+    parser.add_argument("--as-of", default=None)
+    parser.add_argument("--profile", metavar="STAGES", default=None)
+    parser.add_argument("--profile-kind", choices=PROFILE_KINDS, default="cpu")
+    parser.add_argument("--metrics-textfile", default=None)
+    parser.add_argument("--product-caps", metavar="PATH", default=None)
+    parser.add_argument("--allocation", choices=ALLOCATION_MODES, default="auto")
+    parser.add_argument("--archive", metavar="DIR", default=None)
+    parser.add_argument("--run-id", default=None)
+    parser.add_argument("--suppress-repeats", metavar="DAYS", type=float, default=None)
+    parser.add_argument("--archive-export", metavar="PATH", default=None)
+    parser.add_argument("--simulate", metavar="GRID", default=None)
+    parser.add_argument("--serve", metavar="ADDRESS", default=None)
+    parser.add_argument("--batch-max", type=int, default=BATCH_MAX)
+    parser.add_argument("--batch-wait-ms", type=float, default=BATCH_WAIT_MS)
     args = parser.parse_args()
+    if args.archive_export:
+        if not args.archive:
+            parser.error("--archive-export needs --archive")
+        from src.utils.archive import PushArchive
+        archive = PushArchive(args.archive, readonly=True)
+        try:
+            archive.export(args.archive_export, run_id=args.run_id)
+        except (RuntimeError, ValueError) as e:
+            parser.error(str(e))
+        print("Archive exported:", args.archive_export)
+        return
+    if not args.output and not args.serve and not args.simulate:
+        parser.error("--output is required unless --serve or --simulate is given")
+    if args.simulate and (args.serve or args.stream or args.incremental or args.product_caps or args.archive):
+        parser.error("--simulate can't be combined with --serve, --stream, --incremental, --product-caps or --archive")
+    configs = None
+    if args.simulate:
+        try:
+            configs = load_grid(args.simulate)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if (args.archive or args.suppress_repeats is not None) and args.serve:
+        parser.error("--archive and --suppress-repeats can't be combined with --serve")
+    if args.suppress_repeats is not None and not args.archive:
+        parser.error("--suppress-repeats needs --archive")
+    try:
+        profile = parse_profile_stages(args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+    caps = None
+    if args.product_caps:
+        if args.stream or args.serve:
+            parser.error("--product-caps needs the whole population; it can't be combined with --stream or --serve")
+        try:
+            caps = load_product_caps(args.product_caps)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    archive = run = None
+    if args.archive:
+        from src.utils.archive import PushArchive
+        try:
+            archive = PushArchive(args.archive)
+            run = archive.begin_run(args.run_id)
+        except (RuntimeError, ValueError) as e:
+            parser.error(str(e))
     os.makedirs(args.debug_dir, exist_ok=True)
-    profiles = load_profiles(os.path.join(args.data_dir, "clients.csv"))
-    clients_raw, missing = load_client_files(args.data_dir, profiles)
-    write_missing_report(missing, args.debug_dir)
-    clients_agg = build_clients_agg(clients_raw, profiles)
-    signals = compute_all_signals(clients_agg)
-    scores, per_client_product_benefits = compute_scores_and_select(signals, args.debug_dir)
-    results = generate_pushes_batch(scores, per_client_product_benefits, profiles, use_ai=(args.use_ai=="true"))
-    write_results(results, args.output)
-    eval_report = evaluate_results(results, args.debug_dir)
+    start_run(profile, args.profile_kind, os.path.join(args.debug_dir, "profile"))
+    profiles_path = os.path.join(args.data_dir, "clients.csv")
+    with stage("load") as rec:
+        profiles = load_profiles(profiles_path)
+        rec["clients"] = len(profiles)
+        rates = load_fx_rates(args.fx_rates, args.table_cache) if args.fx_rates else None
+    debug_sink = open_debug_sink(args.debug_dir, args.debug_level)
+    use_ai = args.use_ai == "true"
+    engine = None
+    if use_ai:
+        engine = make_paraphrase_engine(args.ai_cache or os.path.join(args.debug_dir, "paraphrase_cache.jsonl"),
+                                        concurrency=args.ai_concurrency, rate=args.ai_rate)
+    # a loaded rank engine scores this population against the one it was fitted on, without refitting
+    ranks = load_rank_engine(args.rank_load) if args.rank_load else make_rank_engine(args.rank_mode, args.rank_sketch_k)
+    fit_ranks = not args.rank_load
+    if args.serve:
+        # profiles, ranks and rates stay loaded; each request is ranked against this population without refitting
+        found = scan_client_files(args.data_dir)
+        with stage("features", clients=len(profiles)):
+            if fit_ranks:
+                fit_service_ranks(args.data_dir, profiles, ranks, rates, found, args.chunk_size)
+        save_ranks(ranks, args.rank_save)
+        service = ScoringService(args.data_dir, profiles, ranks, rates, found, use_ai=use_ai, engine=engine)
+        serve(service, args.serve, args.batch_max, args.batch_wait_ms)
+        if debug_sink is not None:
+            debug_sink.close()
+        report_paraphrase(engine, args.debug_dir)
+        return
+    if args.stream:
+        report = run_stream(args.data_dir, profiles, args.output, args.debug_dir, use_ai=use_ai,
+                            chunk_size=args.chunk_size, debug_sink=debug_sink, engine=engine, ranks=ranks, fit_ranks=fit_ranks, rates=rates,
+                            archive=archive, run=run, suppress_days=args.suppress_repeats)
+        save_ranks(ranks, args.rank_save)
+        report_archive(archive, run, report.get("suppressed_repeats"))
+        if debug_sink is not None:
+            debug_sink.close()
+        report_paraphrase(engine, args.debug_dir)
+        finish_report(args, "stream", report["clients"], engine)
+        rss = f", peak RSS {report['peak_rss_mb']:.0f} MB" if report["peak_rss_mb"] is not None else ""
+        print(f"Stream: {report['clients']} clients in {report['chunks']} chunks, {report['clients_per_second']:.0f} clients/s{rss}")
+        print("Pipeline finished. Results:", args.output)
+        return
+    if args.incremental:
+        report, _ = run_incremental(args.data_dir, profiles, args.incremental, args.output, args.debug_dir, as_of=args.as_of,
+                                    window_months=args.window_months, use_ai=use_ai, engine=engine, debug_sink=debug_sink,
+                                    ranks=ranks, fit_ranks=fit_ranks, rates=rates, caps=caps, allocation=args.allocation,
+                                    archive=archive, run=run, suppress_days=args.suppress_repeats)
+        save_ranks(ranks, args.rank_save)
+        report_allocation(caps, args.debug_dir)
+        report_archive(archive, run, report["suppressed_repeats"] if args.suppress_repeats is not None else None)
+        if debug_sink is not None:
+            debug_sink.close()
+        report_paraphrase(engine, args.debug_dir)
+        finish_report(args, "incremental", report["clients_scored"], engine)
+        print(f"Incremental: as of {report['as_of']}, {report['new_transactions']} new transactions, {report['new_transfers']} new transfers, "
+              f"{report['clients_changed']} of {report['clients_scored']} clients changed product")
+        print("Pipeline finished. Results:", args.output)
+        return
+    if args.workers > 1:
+        # workers load and aggregate in one pass, so load time is part of features here
+        with stage("features", clients=len(profiles)):
+            signals_frame, spend, first_seen, missing = compute_signals_parallel(args.data_dir, profiles_path, args.workers, args.fx_rates, args.table_cache)
+            write_missing_report(missing, args.debug_dir)
+            table = ClientTable.from_frames(signals_frame, spend, first_seen)
+        mode = "workers"
+    elif args.bulk_load == "true":
+        with stage("load") as rec:
+            transactions, transfers, missing = load_client_tables(args.data_dir, profiles, cache_dir=args.table_cache)
+            write_missing_report(missing, args.debug_dir)
+            rec["rows"] = len(transactions) + len(transfers)
+        with stage("features", clients=len(profiles)):
+            table = ClientTable.from_frames(*compute_signals_frame(transactions, transfers, profiles, missing, rates))
+        mode = "bulk"
+    else:
+        with stage("load") as rec:
+            cache = ClientFileCache(args.client_cache, args.client_cache_mb << 20) if args.client_cache else None
+            clients_raw, missing = load_client_files(args.data_dir, profiles, cache)
+            write_missing_report(missing, args.debug_dir)
+            if cache is not None:
+                cache_stats = cache.close()
+                write_client_cache_report(cache_stats, args.debug_dir)
+                print(f"Client cache: {cache_stats['hits'] + cache_stats['hash_hits']} hits, {cache_stats['misses']} misses, "
+                      f"{cache_stats['evicted']} evicted, {cache_stats['bytes'] / 2**20:.1f} MB")
+            rec["rows"] = sum(len(t) for tables in clients_raw.values() for t in tables.values())
+        with stage("preprocess", clients=len(profiles)):
+            clients_agg = build_clients_agg(clients_raw, profiles, rates)
+        with stage("features", clients=len(profiles)):
+            table = ClientTable.from_signal_dicts(compute_all_signals(clients_agg))
+            del clients_agg
+        mode = "legacy"
+    write_date_format_report(DATE_FORMAT_HITS, args.debug_dir)
+    if rates is not None:
+        write_fx_report(FX_STATS, args.debug_dir)
+    if configs is not None:
+        with stage("scoring", clients=len(table)):
+            frame, seconds = run_simulation(table, configs, os.path.join(args.debug_dir, "simulation.csv"), ranks, fit_ranks)
+        save_ranks(ranks, args.rank_save)
+        if debug_sink is not None:
+            debug_sink.close()
+        finish_report(args, f"{mode}+simulate", len(table), engine)
+        print(f"Simulation: {len(frame)} configurations x {len(table)} clients in {seconds:.2f}s -> {os.path.join(args.debug_dir, 'simulation.csv')}")
+        print(frame[varying_columns(frame) + ["flips", "avg_benefit"]].to_string(index=False, max_rows=20))
+        return
+    with stage("scoring", clients=len(table)):
+        table = score_table(table, debug_sink, ranks=ranks, fit_ranks=fit_ranks, caps=caps, allocation=args.allocation)
+    save_ranks(ranks, args.rank_save)
+    report_allocation(caps, args.debug_dir)
+    suppressed = 0
+    if archive is not None:
+        from src.utils.archive import suppress_repeats
+        table, suppressed = suppress_repeats(table, archive, args.suppress_repeats)
+    with stage("generation", clients=len(table)):
+        if args.workers > 1:
+            products, pushes = generate_pushes_parallel(table, args.workers, use_ai=use_ai, engine=engine)
+        else:
+            products, pushes = generate_pushes_table(table, use_ai=use_ai, engine=engine)
+    with stage("write", clients=len(table)):
+        write_result_columns(table.client_code, products, pushes, args.output)
+        if archive is not None:
+            archive.append(run, table.client_code, products, pushes, table.chosen_score())
+    with stage("evaluation", clients=len(table)):
+        eval_report = evaluate_columns(table.client_code.tolist(), products, pushes, table.column("name").tolist(), args.debug_dir)
+    if debug_sink is not None:
+        debug_sink.close()
+    report_paraphrase(engine, args.debug_dir)
+    report_archive(archive, run, suppressed if args.suppress_repeats is not None else None)
+    finish_report(args, mode, len(table), engine)
     print("Pipeline finished. Results:", args.output)
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+import time
+import argparse
+import numpy as np
+from src.bench.synthetic import make_tables
+from src.pipeline.features import compute_signals_frame
+from src.pipeline.scorer import score_matrix, PRODUCTS
+from src.pipeline.allocation import allocate_greedy, allocate_exact, allocation_totals, exact_variables, EXACT_MAX_VARIABLES
+
+def population_scores(n, base=20_000, seed=0):
+    # score rows of a real scoring pass, resampled with a little noise up to n clients
+    profiles, transactions, transfers = make_tables(base, tx_per_client=5, tr_per_client=3, seed=seed)
+    score = score_matrix(compute_signals_frame(transactions, transfers, profiles)[0])["score"]
+    rng = np.random.default_rng(seed)
+    return np.clip(score[rng.integers(0, base, n)] + rng.normal(0, 0.02, (n, len(PRODUCTS))), 0, 1)
+
+def make_caps(score, share, capped):
+    # each capped product gets `share` of the clients that rank it first
+    demand = np.bincount(score.argmax(axis=1), minlength=score.shape[1])
+    caps = np.full(score.shape[1], np.inf)
+    caps[capped] = np.floor(demand[capped] * share)
+    return caps
+
+def check(score, caps, allocated):
+    placed = allocated[allocated >= 0]
+    counts = np.bincount(placed, minlength=len(caps))
+    assert np.all(counts <= caps), "cap exceeded"
+    assert (allocated < 0).sum() == max(0, len(score) - int(np.minimum(caps, len(score)).sum()))
+
+def timed(fn, *args):
+    t = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t
+
+def run(sizes, large, share, exact_limit):
+    cases = {
+        "premium+loan": [PRODUCTS.index("Премиальная карта"), PRODUCTS.index("Кредит наличными")],
+        "all but one": [j for j, p in enumerate(PRODUCTS) if p != "Депозит Накопительный"],
+        "all capped": list(range(len(PRODUCTS))),
+    }
+    for n in sizes:
+        score = population_scores(n)
+        top = score.argmax(axis=1)
+        for name, capped in cases.items():
+            caps = make_caps(score, share, capped)
+            greedy, dt_g = timed(allocate_greedy, score, caps)
+            check(score, caps, greedy)
+            g, u = allocation_totals(score, greedy), allocation_totals(score, top)
+            size = exact_variables(score, caps)
+            if size > exact_limit:
+                print(f"clients={n:>8} {name:<13} greedy {dt_g:6.2f}s  greedy/uncapped {g / u:.4f}  (exact skipped: {size:,} variables)")
+                continue
+            exact, dt_e = timed(allocate_exact, score, caps)
+            check(score, caps, exact)
+            e = allocation_totals(score, exact)
+            print(f"clients={n:>8} {name:<13} greedy {dt_g:6.2f}s  exact {dt_e:6.2f}s  "
+                  f"greedy/optimum {g / e:.4f}  optimum/uncapped {e / u:.4f}  unassigned {(exact < 0).sum()}")
+    if large:
+        score = population_scores(large)
+        for name, capped in cases.items():
+            caps = make_caps(score, share, capped)
+            greedy, dt_g = timed(allocate_greedy, score, caps)
+            check(score, caps, greedy)
+            print(f"clients={large:>8} {name:<13} greedy {dt_g:6.2f}s  {large / dt_g:>12,.0f} clients/s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,50000,200000")
+    parser.add_argument("--large", type=int, default=2_000_000)
+    parser.add_argument("--share", type=float, default=0.6)
+    parser.add_argument("--exact-limit", type=int, default=2 * EXACT_MAX_VARIABLES)
+    args = parser.parse_args()
+    run([int(x) for x in args.sizes.split(",")], args.large, args.share, args.exact_limit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from src.pipeline.scorer import PRODUCTS
+from src.utils.archive import PushArchive, RECORDS_FILE
+
+def make_run(rng, clients, n):
+    codes = rng.choice(clients, n, replace=False)
+    products = [PRODUCTS[j] for j in rng.integers(0, len(PRODUCTS), n).tolist()]
+    pushes = [f"Клиент {c}, у нас для вас {p}. Открыть" for c, p in zip(codes.tolist(), products)]
+    return codes, products, pushes, rng.random(n).astype(np.float32)
+
+def run(n_clients, runs, per_run, lookups):
+    work = tempfile.mkdtemp(prefix="bench_archive_")
+    rng = np.random.default_rng(0)
+    clients = rng.choice(10 * n_clients, n_clients, replace=False) + 1
+    expected = {}
+    try:
+        archive = PushArchive(work)
+        t_append = 0.0
+        for r in range(runs):
+            codes, products, pushes, scores = make_run(rng, clients, per_run)
+            run_no = archive.begin_run(f"run{r}")
+            t = time.perf_counter()
+            archive.append(run_no, codes, products, pushes, scores)
+            t_append += time.perf_counter() - t
+            expected.update(zip(codes.tolist(), zip(products, pushes)))
+        stats = archive.stats()
+        archive.close()
+        print(f"{stats['records']:,} records for {stats['clients']:,} clients in {runs} runs; "
+              f"append {stats['records'] / t_append:,.0f} records/s, archive {sum(os.path.getsize(os.path.join(work, f)) for f in os.listdir(work)) / 2**20:.1f} MB")
+
+        # a fresh reader maps the files; nothing is loaded up front
+        t = time.perf_counter()
+        reader = PushArchive(work, readonly=True)
+        dt_open = time.perf_counter() - t
+        sample = rng.choice(clients, lookups)
+        t = time.perf_counter()
+        found = [reader.last(int(c)) for c in sample]
+        dt_one = (time.perf_counter() - t) / lookups
+        for c, hit in zip(sample.tolist(), found):
+            want = expected.get(c)
+            assert (hit is None) == (want is None), c
+            assert hit is None or (hit["product"], hit["push"]) == want, c
+        t = time.perf_counter()
+        reader.last_records(clients)
+        dt_all = time.perf_counter() - t
+        print(f"open {dt_open * 1e3:.1f} ms; last() {dt_one * 1e6:.0f} us per client; "
+              f"last_records for all {n_clients:,} clients {dt_all:.2f}s; lookups match")
+
+        out = os.path.join(work, "export.csv")
+        t = time.perf_counter()
+        reader.export(out)
+        dt = time.perf_counter() - t
+        reader.close()
+        print(f"export {stats['records'] / dt:,.0f} records/s")
+
+        # an append that died before committing is rolled back on the next open
+        with open(os.path.join(work, RECORDS_FILE), "ab") as f:
+            f.write(b"\0" * 1000)
+        archive = PushArchive(work)
+        assert archive.stats()["records"] == stats["records"]
+        c = int(sample[0])
+        assert (archive.last(c) or {}).get("push") == (expected.get(c) or (None, None))[1]
+        archive.close()
+        print("uncommitted tail rolled back")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--per-run", type=int, default=400_000)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    args = parser.parse_args()
+    run(args.clients, args.runs, args.per_run, args.lookups)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+from src.bench.synthetic import write_synthetic_dataset
+from src.utils.io import load_profiles, load_client_files
+from src.utils.client_cache import ClientFileCache
+from src.pipeline.preprocess import build_clients_agg, DATE_FORMAT_HITS
+
+def load(data_dir, profiles, cache=None):
+    DATE_FORMAT_HITS.clear()
+    t = time.perf_counter()
+    clients_raw, _ = load_client_files(data_dir, profiles, cache)
+    agg = build_clients_agg(clients_raw, profiles)
+    dt = time.perf_counter() - t
+    stats = cache.close() if cache is not None else {}
+    return agg, dict(DATE_FORMAT_HITS), dt, stats
+
+def same(a, b):
+    assert list(a) == list(b)
+    for cid in a:
+        for kind in ("transactions", "transfers"):
+            x, y = a[cid][kind], b[cid][kind]
+            assert (x is None) == (y is None), (cid, kind)
+            if x is not None:
+                pd.testing.assert_frame_equal(x, y)
+        assert a[cid]["monthly_spend"] == b[cid]["monthly_spend"]
+
+def run(n_clients, rows, changed_share):
+    work = tempfile.mkdtemp(prefix="bench_client_cache_")
+    try:
+        data_dir = os.path.join(work, "data")
+        write_synthetic_dataset(data_dir, n_clients, tx_per_client=rows, tr_per_client=rows)
+        profiles = load_profiles(os.path.join(data_dir, "clients.csv"))
+        cache_dir = os.path.join(work, "cache")
+        ref, ref_hits, dt_plain, _ = load(data_dir, profiles)
+        print(f"{n_clients} clients, {rows} rows per file")
+        print(f"no cache        {dt_plain:6.2f}s")
+        for label in ("cold cache", "warm cache"):
+            agg, hits, dt, stats = load(data_dir, profiles, ClientFileCache(cache_dir))
+            same(ref, agg)
+            assert hits == ref_hits
+            print(f"{label:<15} {dt:6.2f}s  {stats}")
+
+        # touch every file (same bytes) and rewrite a share of them with one row dropped
+        names = sorted(f for f in os.listdir(data_dir) if f.startswith("client_"))
+        for name in names:
+            os.utime(os.path.join(data_dir, name))
+        for name in names[:int(len(names) * changed_share)]:
+            path = os.path.join(data_dir, name)
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(lines[:-1])
+        ref, ref_hits, _, _ = load(data_dir, profiles)
+        agg, hits, dt, stats = load(data_dir, profiles, ClientFileCache(cache_dir))
+        same(ref, agg)
+        assert hits == ref_hits and stats["misses"] == int(len(names) * changed_share)
+        print(f"{changed_share:.0%} changed    {dt:6.2f}s  {stats}")
+
+        budget = stats["bytes"] // 2
+        _, _, _, stats = load(data_dir, profiles, ClientFileCache(cache_dir, budget))
+        assert stats["bytes"] <= budget and stats["evicted"] > 0
+        print(f"budget {budget >> 10} KB    {stats}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--changed", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.clients, args.rows, args.changed)
+
+if __name__ == "__main__":
+    main()
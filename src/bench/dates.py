@@ -0,0 +1,38 @@
+import argparse
+import random
+import time
+import pandas as pd
+from src.pipeline.preprocess import try_parsers, parse_date_column
+
+MIXED_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y", "%d/%m/%Y", "%Y/%m/%d"]
+
+def make_dates(n, mixed_share=0.05, seed=0):
+    rnd = random.Random(seed)
+    start = pd.Timestamp("2025-06-01").value // 10**9
+    out = []
+    for _ in range(n):
+        ts = pd.Timestamp(start + rnd.randint(0, 90 * 86400), unit="s")
+        fmt = rnd.choice(MIXED_FORMATS) if rnd.random() < mixed_share else MIXED_FORMATS[0]
+        out.append(ts.strftime(fmt))
+    return pd.Series(out, name="date")
+
+def run(n, mixed_share):
+    s = make_dates(n, mixed_share)
+    t = time.perf_counter()
+    a = s.apply(try_parsers)
+    t_apply = time.perf_counter() - t
+    t = time.perf_counter()
+    b = parse_date_column(s)
+    t_vec = time.perf_counter() - t
+    pd.testing.assert_series_equal(a, b)
+    print(f"rows={n} mixed={mixed_share:.0%} try_parsers={n/t_apply:,.0f} rows/s parse_date_column={n/t_vec:,.0f} rows/s speedup=x{t_apply/t_vec:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--mixed-share", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.rows, args.mixed_share)
+
+if __name__ == "__main__":
+    main()
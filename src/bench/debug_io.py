@@ -0,0 +1,49 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from src.bench.synthetic import make_tables
+from src.pipeline.features import compute_all_signals_from_tables
+from src.pipeline.scorer import compute_scores_and_select
+from src.utils.debug_sink import DebugSink
+
+def per_client_roundtrip(scores, debug_dir):
+    # what the pipeline used to do: scorer writes, generator and evaluator each re-read
+    for cid, out in scores.items():
+        with open(os.path.join(debug_dir, f"client_{cid}_scores.json"), "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+    for _ in range(2):
+        for cid in scores:
+            with open(os.path.join(debug_dir, f"client_{cid}_scores.json"), "r", encoding="utf-8") as f:
+                json.load(f)
+
+def sink_dump(scores, debug_dir, level):
+    with DebugSink(debug_dir, level) as sink:
+        for out in scores.values():
+            sink.write(out)
+
+def run(n_clients):
+    profiles, transactions, transfers = make_tables(n_clients, tx_per_client=5, tr_per_client=3)
+    scores, _ = compute_scores_and_select(compute_all_signals_from_tables(transactions, transfers, profiles))
+    scale = 100_000 / n_clients
+    for label, fn in (("per-client JSON round-trip", per_client_roundtrip),
+                      ("JSONL sink, level=full", lambda s, d: sink_dump(s, d, "full")),
+                      ("JSONL sink, level=summary", lambda s, d: sink_dump(s, d, "summary"))):
+        debug_dir = tempfile.mkdtemp(prefix="bench_debug_")
+        t = time.perf_counter()
+        fn(scores, debug_dir)
+        dt = time.perf_counter() - t
+        shutil.rmtree(debug_dir)
+        print(f"{label:<28} {dt:7.2f}s  ({dt * scale:7.2f}s per 100k clients)")
+    print(f"{'level=none (in memory)':<28} {0:7.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.clients)
+
+if __name__ == "__main__":
+    main()
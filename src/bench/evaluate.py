@@ -0,0 +1,56 @@
+import time
+import argparse
+import numpy as np
+from src.bench.templates import random_columns
+from src.pipeline.generator import render_templates
+from src.eval.evaluate import score_push_quality, score_push_columns, quality_counts, quality_summary, CTA_WORDS
+
+NAMES = ["Айгерим", "Данияр", "Рустем", "", None]
+PIECES = ["Айгерим", "Данияр", ", ", "₸", "!", "Открыть", "Оформить карту", "Настроить", "посмотреть", "Посмотрет",
+          "¹²", "Ⅻ", "٣", "7", "Нужно", "ⅰ", "x", "ß", "ǅ", "𝐀", "😀", " ", "в августе ", "выгода 12 300 ₸"]
+
+def random_texts(n, rng):
+    lengths = rng.integers(0, 60, n)
+    picks = rng.integers(0, len(PIECES), lengths.sum())
+    texts, pos = [], 0
+    for l in lengths:
+        texts.append("".join(PIECES[i] for i in picks[pos:pos + l]))
+        pos += l
+    return texts
+
+def check_parity(n=200_000, seed=0):
+    rng = np.random.default_rng(seed)
+    texts = random_texts(n, rng) + ["", "О", "Открыт", "x" * 180, "x" * 221] + [w + "!" for w in CTA_WORDS]
+    names = [NAMES[i] for i in rng.integers(0, len(NAMES), len(texts))]
+    scored = score_push_columns(texts, names)
+    expected = [score_push_quality(t, nm) for t, nm in zip(texts, names)]
+    assert scored["push_points"].tolist() == expected
+    return len(texts)
+
+def run(n_rows, seed=0):
+    cols, products = random_columns(n_rows, np.random.default_rng(seed))
+    texts = render_templates(products, cols).tolist()
+    names = cols["name"].tolist()
+    score_push_columns(texts[:10], names[:10])
+    t = time.perf_counter()
+    scored = score_push_columns(texts, names)
+    summary = quality_summary(quality_counts(products, scored))
+    dt_bulk = time.perf_counter() - t
+    m = min(n_rows, 200_000)
+    t = time.perf_counter()
+    legacy = [score_push_quality(texts[i], names[i]) for i in range(m)]
+    dt_legacy = (time.perf_counter() - t) * n_rows / m
+    assert legacy == scored["push_points"][:m].tolist()
+    print(f"score_push_columns + summary  {n_rows:>10} rows  {dt_bulk:7.2f}s  ({n_rows / dt_bulk:,.0f} rows/s)")
+    print(f"score_push_quality per row    {n_rows:>10} rows  {dt_legacy:7.2f}s  (extrapolated from {m})")
+    print(f"average {summary['average_push_quality']:.3f}  pass rates {summary['criteria_pass_rate']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    print(f"parity: {check_parity()} texts match score_push_quality")
+    run(args.rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from src.pipeline.fx import load_fx_rates, read_rate_table, _read_compiled, _file_signature, FX_STATS, BASE_CURRENCY
+
+CURRENCIES = {"USD": 520.0, "EUR": 600.0, "RUB": 6.5, "CNY": 72.0}
+
+def make_rate_table(days, rng, currencies=CURRENCIES, gap_share=0.3):
+    # a random walk per currency with random missing days (weekends, holidays), shuffled rows and a few duplicate days
+    frames = []
+    for cur, base in currencies.items():
+        d = days[rng.random(len(days)) >= gap_share]
+        rate = base * np.exp(np.cumsum(rng.normal(0, 0.004, len(d))))
+        frames.append(pd.DataFrame({"date": d.strftime("%Y-%m-%d"), "currency": cur, "rate": np.round(rate, 4)}))
+    table = pd.concat(frames, ignore_index=True)
+    dup = table.sample(frac=0.01, random_state=int(rng.integers(1 << 31)))
+    table = pd.concat([table, dup.assign(rate=dup["rate"] * 1.01)], ignore_index=True)
+    return table.sample(frac=1, random_state=int(rng.integers(1 << 31))).reset_index(drop=True)
+
+def write_rate_table(path, days, rng, currencies=CURRENCIES):
+    make_rate_table(days, rng, currencies).to_csv(path, index=False)
+    return path
+
+def make_rows(n, days, rng):
+    currency = rng.choice(list(CURRENCIES) + [BASE_CURRENCY, "GBP", None], n, p=[0.1, 0.1, 0.05, 0.05, 0.6, 0.05, 0.05])
+    span = (days[-1] - days[0]).days + 60
+    dates = pd.Series(days[0] - pd.Timedelta(days=30) + pd.to_timedelta(rng.integers(0, span * 86400, n), unit="s"))
+    dates[rng.random(n) < 0.01] = pd.NaT
+    return currency.astype(object), dates
+
+def reference_rates(table, currency, dates):
+    # pandas merge_asof per currency, last row of a repeated day wins, first rate before the table starts, latest for NaT
+    table = table.assign(date=pd.to_datetime(table["date"]))
+    table = table.iloc[::-1].drop_duplicates(["currency", "date"]).sort_values("date")
+    out = np.ones(len(currency))
+    day = dates.dt.normalize()
+    for cur, t in table.groupby("currency"):
+        idx = np.flatnonzero(currency == cur)
+        rows = pd.DataFrame({"i": idx, "date": day.iloc[idx].to_numpy()})
+        dated = rows[rows["date"].notna()].sort_values("date")
+        m = pd.merge_asof(dated, t[["date", "rate"]], on="date", direction="backward")
+        out[m["i"].to_numpy()] = m["rate"].fillna(t["rate"].iloc[0]).to_numpy()
+        out[rows.loc[rows["date"].isna(), "i"].to_numpy()] = t["rate"].iloc[-1]
+    return out
+
+def run(n_rows, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2015-01-01", periods=n_days, freq="D")
+    work = tempfile.mkdtemp(prefix="bench_fx_")
+    path = write_rate_table(os.path.join(work, "rates.csv"), days, rng)
+    table = pd.read_csv(path)
+    currency, dates = make_rows(n_rows, days, rng)
+
+    rates = read_rate_table(path)
+    expected = reference_rates(table, currency, dates)
+    rate, cur = rates.lookup(currency, dates)
+    assert np.array_equal(rate, expected)
+    assert ((cur >= 0) == np.isin(currency, list(CURRENCIES))).all()
+    print(f"as-of lookup matches merge_asof on {n_rows} rows against {len(rates)} rates; {dict(FX_STATS)}")
+
+    t = time.perf_counter()
+    read_rate_table(path)
+    dt_parse = time.perf_counter() - t
+    cache_dir = os.path.join(work, "cache")
+    load_fx_rates(path, cache_dir)
+    t = time.perf_counter()
+    mapped = _read_compiled(cache_dir, _file_signature(path))
+    dt_map = time.perf_counter() - t
+    assert isinstance(mapped.keys, np.memmap) and np.array_equal(mapped.lookup(currency, dates)[0], expected)
+    t = time.perf_counter()
+    rates.lookup(currency, dates)
+    dt_lookup = time.perf_counter() - t
+    t = time.perf_counter()
+    reference_rates(table, currency, dates)
+    dt_ref = time.perf_counter() - t
+    print(f"parse {len(table)} rate rows {dt_parse:.2f}s, open memory-mapped {dt_map * 1000:.1f} ms")
+    print(f"lookup {n_rows} rows {dt_lookup:.2f}s ({n_rows / dt_lookup:,.0f} rows/s), merge_asof per currency {dt_ref:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--days", type=int, default=3650)
+    args = parser.parse_args()
+    run(args.rows, args.days)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import gc
+import math
+import time
+import argparse
+import tracemalloc
+from src.bench.synthetic import make_tables
+from src.pipeline.features import compute_signals_frame, iter_signal_dicts
+from src.pipeline.ir import ClientTable
+from src.pipeline.scorer import compute_scores_and_select, score_table
+
+def allocated(build):
+    # bytes still held by what build() returns, measured with tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    t = time.perf_counter()
+    out = build()
+    dt = time.perf_counter() - t
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return out, size, dt
+
+def check_rows(table, scores):
+    for cid, record in scores.items():
+        row = table.row(table.position(cid)).score_record()
+        assert row["product_scores"] == record["product_scores"] and row["top4"] == record["top4"], cid
+        a, b = row["raw_signals"], record["raw_signals"]
+        assert list(a["spend_by_category"]) == list(b["spend_by_category"])
+        # spend is kept as float32
+        assert all(math.isclose(a["spend_by_category"][k], v, rel_tol=1e-6, abs_tol=0.01) for k, v in b["spend_by_category"].items())
+        assert {k: v for k, v in a.items() if k != "spend_by_category"} == {k: v for k, v in b.items() if k != "spend_by_category"}, cid
+
+def run(n_clients):
+    profiles, transactions, transfers = make_tables(n_clients, tx_per_client=60, tr_per_client=30)
+    frame = compute_signals_frame(transactions, transfers, profiles)
+    (scores, benefits), dict_bytes, dict_dt = allocated(lambda: compute_scores_and_select(dict(iter_signal_dicts(*frame))))
+    table, table_bytes, table_dt = allocated(lambda: score_table(ClientTable.from_frames(*frame)))
+    check_rows(table, scores)
+    print(f"clients={n_clients} categories={len(table.categories)}; row views match the dict records")
+    print(f"dicts (signals, scores, benefits)  {dict_bytes / n_clients:>8,.0f} bytes/client  {dict_dt:.2f}s")
+    print(f"ClientTable                         {table_bytes / n_clients:>8,.0f} bytes/client  {table_dt:.2f}s  (nbytes {table.nbytes() / n_clients:,.0f})")
+    print(f"reduction x{dict_bytes / table_bytes:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50_000)
+    args = parser.parse_args()
+    run(args.clients)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import os
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.pipeline.paraphrase import ParaphraseEngine
+from src.pipeline.generator import SYSTEM_PROMPT
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI-style /chat/completions stub: echoes the template after a delay, fails a share of calls with 503."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.calls += 1
+            server.connections.add(self.client_address)
+            fail = server.rng.random() < server.fail_rate
+        time.sleep(server.latency)
+        if fail:
+            payload, status = b"{}", 503
+        else:
+            text = body["input"].split("\n\n", 1)[1]
+            payload, status = json.dumps({"choices": [{"message": {"content": text}}]}).encode("utf-8"), 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub(latency=0.05, fail_rate=0.0, seed=0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def serial_baseline(url, templates):
+    # what call_ai_paraphrase used to do: one blocking post per client on a fresh connection
+    for t in templates:
+        requests.post(f"{url}/chat/completions", json={"model": "stub", "input": f"{SYSTEM_PROMPT}\n\n{t}"}, timeout=15)
+
+def run(n_clients, n_unique, latency, fail_rate, concurrency, rate):
+    rng = random.Random(0)
+    templates = [f"Клиент {rng.randrange(n_unique)}, шаблон пуша для проверки перефразирования" for _ in range(n_clients)]
+    server, url = start_stub(latency, fail_rate)
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="bench_ai_"), "paraphrase_cache.jsonl")
+    t = time.perf_counter()
+    serial_baseline(url, templates)
+    print(f"{'serial, no cache':<24} {time.perf_counter() - t:7.2f}s  calls={server.calls}")
+    for label in ("engine, cold cache", "engine, warm cache"):
+        server.calls = 0
+        server.connections = set()
+        engine = ParaphraseEngine(url, "stub", "key", cache_path=cache_path, concurrency=concurrency, rate=rate, backoff=0.05)
+        t = time.perf_counter()
+        out = engine.paraphrase_many(SYSTEM_PROMPT, templates)
+        dt = time.perf_counter() - t
+        s = engine.stats()
+        engine.close()
+        p50 = f"{s['latency_p50_ms']:.0f}" if s["latency_p50_ms"] is not None else "-"
+        p99 = f"{s['latency_p99_ms']:.0f}" if s["latency_p99_ms"] is not None else "-"
+        print(f"{label:<24} {dt:7.2f}s  calls={server.calls} connections={len(server.connections)} retries={s['retries']} "
+              f"failures={s['failures']} hit_rate={s['cache_hit_rate']:.0%} p50={p50}ms p99={p99}ms")
+        assert sum(v is not None for v in out.values()) == len(set(templates)) - s["failures"]
+    server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--unique", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=100.0)
+    args = parser.parse_args()
+    run(args.clients, args.unique, args.latency, args.fail_rate, args.concurrency, args.rate)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from scipy.stats import rankdata
+from src.pipeline.ranking import ExactRanks, QuantileSketch, load_rank_engine, N_RANK_COLUMNS, SKETCH_K
+
+# rank error of a KLL sketch is about 1.7/k at high probability; allow some headroom
+ERROR_BOUND_FACTOR = 4.0
+
+def make_signals(n, rng):
+    # heavy ties (zeros, small integer counts) next to continuous amounts, as in the real signal columns
+    cols = [
+        np.where(rng.random(n) < 0.4, 0.0, np.round(rng.lognormal(11, 1.5, n), 2)),
+        np.round(rng.lognormal(12, 1.2, n)),
+        np.round(rng.lognormal(12.5, 0.7, n), 2),
+        rng.poisson(0.3, n).astype(float),
+        np.where(rng.random(n) < 0.7, 0.0, np.round(rng.lognormal(12, 1.0, n), 2)),
+        np.maximum(0.0, np.round(rng.normal(3e5, 2e5, n), 2)),
+    ]
+    out = np.column_stack(cols)
+    out[rng.random(n) < 0.001, 2] = np.inf
+    return out
+
+def exact_reference(values):
+    n = len(values)
+    return (rankdata(values, method="min", axis=0) - 1) / (n - 1)
+
+def check_exact(values):
+    expected = exact_reference(values)
+    assert np.array_equal(ExactRanks().fit_normalize(values), expected)
+    half = len(values) // 2
+    merged = ExactRanks().update(values[:half]).merge(ExactRanks().update(values[half:]))
+    assert np.array_equal(merged.normalize(values), expected)
+
+def check_sketch(values, k, n_parts, seed=0):
+    exact = exact_reference(values)
+    whole = QuantileSketch(k=k, seed=seed).update(values)
+    merged = QuantileSketch(k=k, seed=seed)
+    for i, part in enumerate(np.array_split(values, n_parts)):
+        # built per chunk or per worker, then merged
+        merged.merge(QuantileSketch(k=k, seed=seed + i + 1).update(part))
+    bound = ERROR_BOUND_FACTOR / k
+    errors = {}
+    for name, sketch in (("single", whole), ("merged", merged)):
+        assert sketch.n == len(values)
+        err = np.abs(sketch.normalize(values) - exact).max(axis=0)
+        assert (err <= bound).all(), (name, err, bound)
+        errors[name] = err.max()
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_ranking_"), "sketch.npz")
+    merged.save(path)
+    loaded = load_rank_engine(path)
+    assert np.array_equal(loaded.normalize(values), merged.normalize(values))
+    return errors, bound, merged.size()
+
+def run(n, k, n_parts, seed=0):
+    rng = np.random.default_rng(seed)
+    values = make_signals(n, rng)
+    check_exact(values[:200_000])
+    errors, bound, size = check_sketch(values, k, n_parts, seed)
+    print(f"exact ranks match rankdata(method='min'); sketch k={k} holds {size} of {n} values x {N_RANK_COLUMNS} columns")
+    print(f"max normalized rank error: single {errors['single']:.5f}, merged from {n_parts} parts {errors['merged']:.5f} (bound {bound:.5f})")
+
+    raw = np.column_stack([values, values[:, 5:6].repeat(4, axis=1)])
+    t = time.perf_counter()
+    rankdata(raw, method="ordinal", axis=0)
+    dt_old = time.perf_counter() - t
+    t = time.perf_counter()
+    ExactRanks().fit_normalize(values)
+    dt_exact = time.perf_counter() - t
+    t = time.perf_counter()
+    ExactRanks().update(values).normalize(values)
+    dt_query = time.perf_counter() - t
+    t = time.perf_counter()
+    sketch = QuantileSketch(k=k)
+    for part in np.array_split(values, 20):
+        sketch.update(part)
+    sketch.normalize(values)
+    dt_sketch = time.perf_counter() - t
+    print(f"n={n}: double argsort over 10 columns {dt_old:.2f}s, exact single sort {dt_exact:.2f}s, exact fit then query {dt_query:.2f}s, sketch in 20 chunks {dt_sketch:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2_000_000)
+    parser.add_argument("--k", type=int, default=SKETCH_K)
+    parser.add_argument("--parts", type=int, default=8)
+    args = parser.parse_args()
+    run(args.clients, args.k, args.parts)
+
+if __name__ == "__main__":
+    main()
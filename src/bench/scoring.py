@@ -0,0 +1,30 @@
+import argparse
+import time
+import numpy as np
+from src.bench.synthetic import make_tables
+from src.pipeline.features import compute_signals_frame, iter_signal_dicts
+from src.pipeline.scorer import score_matrix, score_inputs_from_dicts, SCORE_CHUNK_SIZE
+
+def run(sizes, chunk_size):
+    for n in sizes:
+        profiles, transactions, transfers = make_tables(n, tx_per_client=5, tr_per_client=3, seed=n)
+        frame = compute_signals_frame(transactions, transfers, profiles)
+        del transactions, transfers
+        signals = frame[0]
+        t = time.perf_counter()
+        m = score_matrix(signals, chunk_size)
+        dt = time.perf_counter() - t
+        if n <= 100_000:
+            ref = score_matrix(score_inputs_from_dicts(dict(iter_signal_dicts(*frame))), chunk_size)
+            assert np.array_equal(ref["top4"], m["top4"]) and np.array_equal(ref["score"], m["score"])
+        print(f"clients={n:>9} score_matrix {dt:6.2f}s  {n/dt:>12,.0f} clients/s  chunk={chunk_size}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--chunk-size", type=int, default=SCORE_CHUNK_SIZE)
+    args = parser.parse_args()
+    run([int(x) for x in args.sizes.split(",")], args.chunk_size)
+
+if __name__ == "__main__":
+    main()
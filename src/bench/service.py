@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from src.bench.synthetic import make_tables, write_dataset
+from src.utils.io import load_profiles
+from src.pipeline.ranking import make_rank_engine
+from src.pipeline.service import ScoringService, Batcher, fit_service_ranks, make_server
+
+def start_service(data_dir, max_batch, max_wait_ms):
+    profiles = load_profiles(os.path.join(data_dir, "clients.csv"))
+    ranks = fit_service_ranks(data_dir, profiles, make_rank_engine())
+    batcher = Batcher(ScoringService(data_dir, profiles, ranks), max_batch, max_wait_ms)
+    server = make_server("127.0.0.1:0", batcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, batcher
+
+def post(conn, body):
+    conn.request("POST", "/score", json.dumps(body, ensure_ascii=False).encode("utf-8"), {"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read())
+
+def timed_requests(port, bodies):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    out = []
+    for body in bodies:
+        t = time.perf_counter()
+        status, _ = post(conn, body)
+        assert status == 200
+        out.append(time.perf_counter() - t)
+    conn.close()
+    return out
+
+def run(n_clients, n_requests, concurrency, max_batch, max_wait_ms):
+    work = tempfile.mkdtemp(prefix="bench_service_")
+    data_dir = os.path.join(work, "data")
+    profiles, transactions, transfers = make_tables(n_clients, tx_per_client=60, tr_per_client=30)
+    write_dataset(data_dir, profiles, transactions, transfers)
+    output = os.path.join(work, "results.csv")
+    subprocess.run([sys.executable, "-m", "src.app", "--data-dir", data_dir, "--output", output, "--debug-dir", os.path.join(work, "debug")],
+                   check=True, stdout=subprocess.DEVNULL)
+    expected = pd.read_csv(output).set_index("client_code")
+
+    t = time.perf_counter()
+    server, batcher = start_service(data_dir, max_batch, max_wait_ms)
+    print(f"startup (profiles, ranks over {n_clients} clients) {time.perf_counter() - t:.2f}s")
+    port = server.server_address[1]
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        codes = expected.index.tolist()
+        status, body = post(conn, {"requests": [{"client_code": c} for c in codes]})
+        assert status == 200
+        got = pd.DataFrame(body["results"]).set_index("client_code")
+        assert (got["product"] == expected["product"]).all() and (got["push"] == expected["push_notification"]).all()
+        print(f"batch of {len(codes)} file-backed requests matches the batch CLI")
+
+        cid = codes[0]
+        rows = {kind: pd.read_csv(os.path.join(data_dir, f"client_{cid}_{kind}_3m.csv")).to_dict("records") for kind in ("transactions", "transfers")}
+        status, one = post(conn, {"client_code": cid, **rows})
+        assert status == 200 and one["push"] == expected.loc[cid, "push_notification"], one
+        status, bad = post(conn, {"requests": [{"client_code": -1}, {"client_code": cid, "transactions": "x"}, {"client_code": cid}]})
+        assert status == 200 and "error" in bad["results"][0] and "error" in bad["results"][1] and "push" in bad["results"][2], bad
+        for body in ({"client_code": -1}, {"client_code": cid, "transactions": "x"}, {"requests": [1, "a"]}):
+            status, bad = post(conn, body)
+            assert status == 200 and all("error" in r for r in bad.get("results", [bad])), bad
+        poisoned = {"client_code": cid, "transactions": [{"date": 10 ** 18, "category": "Такси", "amount": 1, "currency": "KZT"}]}
+        with ThreadPoolExecutor(2) as pool:
+            outcomes = list(pool.map(lambda body: post(http.client.HTTPConnection("127.0.0.1", port), body), [poisoned, {"client_code": cid}]))
+        assert outcomes[1] == (200, one), outcomes
+        conn.close()
+        print("request rows match file rows; bad items fail alone")
+
+        rng = np.random.default_rng(0)
+        bodies = [{"client_code": int(c)} for c in rng.choice(codes, n_requests)]
+        lat = np.array(timed_requests(port, bodies)) * 1000
+        print(f"sequential {n_requests} requests: p50 {np.percentile(lat, 50):.1f} ms, p99 {np.percentile(lat, 99):.1f} ms")
+        shards = [bodies[i::concurrency] for i in range(concurrency)]
+        t = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            lat = np.concatenate([np.array(part) for part in pool.map(lambda b: timed_requests(port, b), shards)]) * 1000
+        dt = time.perf_counter() - t
+        print(f"{concurrency} concurrent clients: {n_requests / dt:,.0f} requests/s, p50 {np.percentile(lat, 50):.1f} ms, p99 {np.percentile(lat, 99):.1f} ms")
+        stats = batcher.service.stats()
+        print(f"batch sizes {stats['batch_sizes']}")
+        print("server side: " + ", ".join(f"{k} p50 {v['p50_ms']:.2f} ms p99 {v['p99_ms']:.2f} ms" for k, v in stats["latency"].items() if v["count"]))
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-max", type=int, default=256)
+    parser.add_argument("--batch-wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    run(args.clients, args.requests, args.concurrency, args.batch_max, args.batch_wait_ms)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import argparse
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from src.bench.synthetic import make_tables
+from src.bench.fx import write_rate_table
+from src.pipeline.fx import load_fx_rates
+from src.pipeline.preprocess import build_clients_agg
+from src.pipeline.features import compute_all_signals, compute_signals_frame, iter_signal_dicts
+
+def legacy_signals(profiles, transactions, transfers, rates=None):
+    tx = {int(cid): g.reset_index(drop=True) for cid, g in transactions.groupby("client_code", sort=False)}
+    tr = {int(cid): g.reset_index(drop=True) for cid, g in transfers.groupby("client_code", sort=False)}
+    raw = {cid: {"transactions": tx[cid], "transfers": tr[cid]} for cid in profiles["client_code"]}
+    return compute_all_signals(build_clients_agg(raw, profiles, rates))
+
+def run(n_clients, legacy_sample, fx=False):
+    profiles, transactions, transfers = make_tables(n_clients)
+    rates = None
+    if fx:
+        # rates start a week after the first rows, so the before-first-rate fallback is exercised too
+        days = pd.date_range(transactions["date"].min().normalize() + pd.Timedelta(days=7), periods=120)
+        rates = load_fx_rates(write_rate_table(os.path.join(tempfile.mkdtemp(prefix="bench_signals_"), "rates.csv"), days, np.random.default_rng(0)))
+    t = time.perf_counter()
+    frame = compute_signals_frame(transactions, transfers, profiles, rates=rates)
+    t_batch = time.perf_counter() - t
+    t = time.perf_counter()
+    batch = dict(iter_signal_dicts(*frame))
+    t_dicts = time.perf_counter() - t
+
+    sample = profiles.iloc[:legacy_sample]
+    codes = set(sample["client_code"])
+    tx = transactions[transactions["client_code"].isin(codes)]
+    tr = transfers[transfers["client_code"].isin(codes)]
+    t = time.perf_counter()
+    legacy = legacy_signals(sample, tx, tr, rates)
+    t_legacy = (time.perf_counter() - t) * n_clients / legacy_sample
+    for cid, s in legacy.items():
+        assert s == batch[cid], cid
+    print(f"clients={n_clients} rows={len(transactions) + len(transfers)}")
+    print(f"compute_signals_frame {t_batch:.2f}s  + dict adapter {t_dicts:.2f}s")
+    print(f"compute_all_signals (extrapolated from {legacy_sample} clients) {t_legacy:.1f}s")
+    print(f"speedup x{t_legacy / t_batch:.0f} (x{t_legacy / (t_batch + t_dicts):.0f} incl. adapter)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100_000)
+    parser.add_argument("--legacy-sample", type=int, default=500)
+    parser.add_argument("--fx", action="store_true", help="convert amounts with a synthetic rate table")
+    args = parser.parse_args()
+    run(args.clients, args.legacy_sample, args.fx)
+
+if __name__ == "__main__":
+    main()
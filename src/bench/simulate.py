@@ -0,0 +1,61 @@
+import time
+import argparse
+import numpy as np
+from src.bench.synthetic import make_tables
+from src.pipeline.features import compute_signals_frame
+from src.pipeline.ir import ClientTable
+from src.pipeline.scorer import (score_table, SCORE_INPUTS, raw_signal_matrix, norm_signal_matrix, benefit_matrix,
+                                 normalize_benefit, PRODUCTS)
+from src.pipeline.simulate import simulate, complete_config, SIM_PARAMS
+
+def random_configs(n, rng):
+    # weights and every rate jittered around the production values
+    configs = []
+    for _ in range(n):
+        w = float(rng.uniform(0.4, 0.9))
+        c = {k: v * float(rng.uniform(0.7, 1.3)) for k, v in SIM_PARAMS.items() if k not in ("signal_weight", "benefit_weight")}
+        configs.append(complete_config({"signal_weight": w, **c}))
+    return configs
+
+def one_config(table, config):
+    # the same configuration through the row-at-a-time scoring code path, for comparison
+    inputs = table.frame(SCORE_INPUTS + ["status"])
+    rates = {k: v for k, v in config.items() if k not in ("signal_weight", "benefit_weight")}
+    benefit = benefit_matrix(inputs, rates)
+    score = config["signal_weight"] * norm_signal_matrix(raw_signal_matrix(inputs)) + config["benefit_weight"] * normalize_benefit(benefit)
+    chosen = score.argmax(axis=1)
+    return np.bincount(chosen, minlength=len(PRODUCTS)), benefit[np.arange(len(chosen)), chosen].mean()
+
+def run(n_clients, n_configs, n_checked):
+    profiles, transactions, transfers = make_tables(n_clients, tx_per_client=5, tr_per_client=3, seed=1)
+    table = ClientTable.from_frames(*compute_signals_frame(transactions, transfers, profiles))
+    del transactions, transfers
+    rng = np.random.default_rng(0)
+    configs = [complete_config({})] + random_configs(n_configs - 1, rng)
+    t = time.perf_counter()
+    frame = simulate(table, configs)
+    dt = time.perf_counter() - t
+    print(f"clients={n_clients:,} configs={n_configs}: {dt:.1f}s, {n_configs * n_clients / dt:,.0f} client-configs/s")
+
+    # the production configuration reproduces the pipeline's chosen products
+    score_table(table)
+    mix = frame.filter(like="mix:").to_numpy()
+    assert frame["flips"][0] == 0
+    assert np.array_equal(mix[0], np.bincount(table.chosen, minlength=len(PRODUCTS)))
+    for i in rng.choice(np.arange(1, n_configs), min(n_checked, n_configs - 1), replace=False):
+        expected_mix, expected_benefit = one_config(table, configs[i])
+        assert np.array_equal(mix[i], expected_mix), i
+        assert np.isclose(frame["avg_benefit"][i], expected_benefit), i
+    print(f"baseline matches the pipeline; {n_checked} random configurations match a one-at-a-time run")
+    print(f"flip share: min {frame['flip_share'].min():.3f}, median {frame['flip_share'].median():.3f}, max {frame['flip_share'].max():.3f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1_000_000)
+    parser.add_argument("--configs", type=int, default=200)
+    parser.add_argument("--checked", type=int, default=3)
+    args = parser.parse_args()
+    run(args.clients, args.configs, args.checked)
+
+if __name__ == "__main__":
+    main()
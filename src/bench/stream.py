@@ -0,0 +1,31 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from src.bench.synthetic import make_tables, write_dataset
+
+def run(n_clients, chunk_sizes, rank_mode):
+    work = tempfile.mkdtemp(prefix="bench_stream_")
+    data_dir = os.path.join(work, "data")
+    write_dataset(data_dir, *make_tables(n_clients, tx_per_client=60, tr_per_client=30))
+    for chunk_size in chunk_sizes:
+        debug_dir = os.path.join(work, f"debug_{chunk_size}")
+        subprocess.run([sys.executable, "-m", "src.app", "--data-dir", data_dir, "--output", os.path.join(work, f"results_{chunk_size}.csv"),
+                        "--debug-dir", debug_dir, "--stream", "--chunk-size", str(chunk_size), "--rank-mode", rank_mode],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(debug_dir, "stream_report.json"), encoding="utf-8") as f:
+            r = json.load(f)
+        print(f"chunk={chunk_size:>7} clients={r['clients']} {r['clients_per_second']:>8,.0f} clients/s  peak RSS {r['peak_rss_mb']:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=20_000)
+    parser.add_argument("--chunk-sizes", default="1000,5000,20000")
+    parser.add_argument("--rank-mode", choices=["exact","approx"], default="exact")
+    args = parser.parse_args()
+    run(args.clients, [int(x) for x in args.chunk_sizes.split(",")], args.rank_mode)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+from src.bench.synthetic import ensure_synthetic_dataset
+from src.utils.io import load_profiles, load_client_files, load_client_tables
+from src.utils.metrics import RunMetrics
+from src.pipeline.preprocess import build_clients_agg
+from src.pipeline.features import compute_all_signals, compute_all_signals_from_tables
+from src.pipeline.scorer import compute_scores_and_select
+from src.pipeline.generator import generate_pushes_batch
+from src.eval.evaluate import evaluate_results
+
+# size -> (clients, transactions per client, transfers per client); larger sets keep fewer rows so they fit on disk
+PRESETS = {"1k": (1_000, 300, 300), "100k": (100_000, 100, 60), "1m": (1_000_000, 30, 20)}
+PATHS = ["legacy", "bulk"]
+DEFAULT_CASES = "1k:legacy,1k:bulk"
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+THRESHOLD = 0.25
+# stages shorter than this are reported but not compared, timer noise dominates them
+MIN_COMPARE_SECONDS = 0.2
+
+def run_case(data_dir, path, debug_dir):
+    run = RunMetrics()
+    profiles = load_profiles(os.path.join(data_dir, "clients.csv"))
+    n = len(profiles)
+    if path == "legacy":
+        with run.stage("load_client_files", clients=n) as rec:
+            clients_raw, missing = load_client_files(data_dir, profiles)
+            rec["rows"] = sum(len(t) for tables in clients_raw.values() for t in tables.values())
+        with run.stage("build_clients_agg", clients=n):
+            clients_agg = build_clients_agg(clients_raw, profiles)
+        del clients_raw
+        with run.stage("compute_all_signals", clients=n):
+            signals = compute_all_signals(clients_agg)
+        del clients_agg
+    else:
+        with run.stage("load_client_tables", clients=n) as rec:
+            transactions, transfers, missing = load_client_tables(data_dir, profiles)
+            rec["rows"] = len(transactions) + len(transfers)
+        with run.stage("compute_all_signals_from_tables", clients=n):
+            signals = compute_all_signals_from_tables(transactions, transfers, profiles, missing)
+        del transactions, transfers
+    with run.stage("compute_scores_and_select", clients=len(signals)):
+        scores, benefits = compute_scores_and_select(signals)
+    with run.stage("generate_pushes_batch", clients=len(scores)):
+        results = generate_pushes_batch(scores, benefits, profiles)
+    with run.stage("evaluate_results", clients=len(results)):
+        evaluate_results(results, debug_dir, {cid: s.get("name") for cid, s in signals.items()})
+    return run.report()["stages"]
+
+def best_of(runs):
+    # per stage, the fastest repetition
+    return {name: min((r[name] for r in runs), key=lambda s: s["seconds"]) for name in runs[0]}
+
+def compare(stages, baseline, threshold):
+    rows = []
+    for name, s in stages.items():
+        base = baseline.get(name)
+        ratio = s["clients_per_second"] / base["clients_per_second"] if base else None
+        status = "new" if base is None else "short" if base["seconds"] < MIN_COMPARE_SECONDS else \
+            "REGRESSED" if ratio < 1 - threshold else "ok"
+        rows.append((name, s, ratio, status))
+    return rows
+
+def machine_info():
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", default=DEFAULT_CASES, help=f"comma separated size:path, sizes {list(PRESETS)}, paths {PATHS}")
+    parser.add_argument("--data-root", default=os.path.join(tempfile.gettempdir(), "push_bench"))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=None, help=f"allowed throughput drop (default from baseline, else {THRESHOLD})")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--report", default=None)
+    args = parser.parse_args()
+    cases = [tuple(c.split(":")) for c in args.cases.split(",")]
+    for size, path in cases:
+        if size not in PRESETS or path not in PATHS:
+            parser.error(f"unknown case {size}:{path}")
+    baseline = {"threshold": THRESHOLD, "cases": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    threshold = args.threshold if args.threshold is not None else baseline.get("threshold", THRESHOLD)
+
+    results = {}
+    regressed = []
+    for size, path in cases:
+        n, tx, tr = PRESETS[size]
+        data_dir = os.path.join(args.data_root, size)
+        print(f"== {size}:{path}  ({n} clients, ~{tx}/{tr} rows per client, data in {data_dir})")
+        ensure_synthetic_dataset(data_dir, n, tx_per_client=tx, tr_per_client=tr)
+        debug_dir = os.path.join(args.data_root, "debug", f"{size}_{path}")
+        stages = best_of([run_case(data_dir, path, debug_dir) for _ in range(max(args.repeat, 1))])
+        key = f"{size}:{path}"
+        results[key] = stages
+        for name, s, ratio, status in compare(stages, baseline["cases"].get(key, {}), threshold):
+            vs = f"x{ratio:.2f} vs baseline" if ratio is not None else ""
+            print(f"  {name:<32} {s['seconds']:8.2f}s  {s['clients_per_second']:>12,.0f} clients/s  {vs:<18} {status}")
+            if status == "REGRESSED":
+                regressed.append(f"{key} {name}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine_info(), "threshold": threshold, "cases": results}, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        baseline["threshold"] = threshold
+        baseline["machine"] = machine_info()
+        baseline["cases"].update({k: {name: {"seconds": s["seconds"], "clients_per_second": s["clients_per_second"]}
+                                      for name, s in v.items()} for k, v in results.items()})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"baseline written to {args.baseline}")
+    elif regressed:
+        print(f"throughput dropped more than {threshold:.0%} below baseline: {', '.join(regressed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from src.bench.dates import MIXED_FORMATS
+from src.pipeline.scorer import PRODUCTS
+
+CATEGORIES = [
+    "Продукты питания", "Кафе и рестораны", "Такси", "АЗС", "Путешествия", "Отели", "Кино", "Развлечения",
+    "Едим дома", "Смотрим дома", "Играем дома", "Одежда и обувь", "Медицина", "Косметика и Парфюмерия",
+    "Ювелирные украшения", "Ремонт дома", "Мебель", "Спорт", "Подарки", "Авто", "Питомцы",
+]
+TRANSFER_TYPES = {
+    "card_out": "out", "p2p_out": "out", "atm_withdrawal": "out", "utilities_out": "out", "loan_payment_out": "out",
+    "invest_out": "out", "deposit_topup_out": "out", "cc_repayment_out": "out", "installment_payment_out": "out",
+    "gold_buy_out": "out", "fx_buy": "out", "fx_sell": "in", "card_in": "in", "salary_in": "in", "stipend_in": "in",
+    "family_in": "in", "refund_in": "in", "cashback_in": "in", "invest_in": "in", "gold_sell_in": "in",
+}
+STATUSES = ["Зарплатный клиент", "Премиальный клиент", "Стандартный клиент", "Студент"]
+NAMES = ["Айгерим", "Данияр", "Санжар", "Алия", "Ерлан", "Мадина", "Асем", "Тимур"]
+CITIES = ["Алматы", "Астана", "Шымкент", "Караганда"]
+
+def make_profiles(n_clients, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "client_code": np.arange(1, n_clients + 1),
+        "name": rng.choice(NAMES, n_clients),
+        "status": rng.choice(STATUSES, n_clients, p=[0.45, 0.15, 0.3, 0.1]),
+        "age": rng.integers(18, 70, n_clients),
+        "city": rng.choice(CITIES, n_clients),
+        "avg_monthly_balance_KZT": np.round(rng.lognormal(13, 1.3, n_clients)).astype(np.int64),
+    })
+
+def _dates(rng, n):
+    start = np.datetime64("2025-06-01T00:00:00", "s")
+    return pd.Series(start + rng.integers(0, 92 * 86400, n).astype("timedelta64[s]"))
+
+def make_tables(n_clients, tx_per_client=100, tr_per_client=60, seed=0):
+    rng = np.random.default_rng(seed)
+    profiles = make_profiles(n_clients, seed)
+    n_tx = n_clients * tx_per_client
+    weights = rng.dirichlet(np.ones(len(CATEGORIES)) * 0.5)
+    transactions = pd.DataFrame({
+        "client_code": np.repeat(profiles["client_code"].to_numpy(), tx_per_client),
+        "date": _dates(rng, n_tx),
+        "category": rng.choice(CATEGORIES, n_tx, p=weights),
+        "amount": np.round(rng.lognormal(8.5, 1.2, n_tx), 2),
+        "currency": rng.choice(["KZT", "USD", "EUR"], n_tx, p=[0.97, 0.02, 0.01]),
+    })
+    n_tr = n_clients * tr_per_client
+    types = rng.choice(list(TRANSFER_TYPES), n_tr)
+    transfers = pd.DataFrame({
+        "client_code": np.repeat(profiles["client_code"].to_numpy(), tr_per_client),
+        "date": _dates(rng, n_tr),
+        "type": types,
+        "direction": pd.Series(types).map(TRANSFER_TYPES).to_numpy(),
+        "amount": np.round(rng.lognormal(10, 1.3, n_tr), 2),
+        "currency": rng.choice(["KZT", "USD", "EUR"], n_tr, p=[0.95, 0.03, 0.02]),
+    })
+    return profiles, transactions, transfers
+
+def write_dataset(out_dir, profiles, transactions, transfers):
+    os.makedirs(out_dir, exist_ok=True)
+    profiles.to_csv(os.path.join(out_dir, "clients.csv"), index=False)
+    for kind, table in (("transactions", transactions), ("transfers", transfers)):
+        table = table.assign(date=table["date"].dt.strftime("%Y-%m-%d %H:%M:%S"))
+        for cid, g in table.groupby("client_code", sort=False):
+            g.to_csv(os.path.join(out_dir, f"client_{cid}_{kind}_3m.csv"), index=False)
+
+# shares observed in the sample data/ set; USD/EUR/RUB are added so FX paths are exercised
+SAMPLE_CATEGORY_WEIGHTS = {
+    "Кафе и рестораны": 0.2102, "Продукты питания": 0.1691, "Такси": 0.1639, "Едим дома": 0.1095, "Смотрим дома": 0.1057,
+    "Играем дома": 0.1022, "Кино": 0.0932, "АЗС": 0.0244, "Косметика и Парфюмерия": 0.0077, "Отели": 0.0033,
+    "Путешествия": 0.002, "Спорт": 0.0019, "Подарки": 0.0018, "Развлечения": 0.0014, "Ремонт дома": 0.0013,
+    "Мебель": 0.0011, "Одежда и обувь": 0.0011, "Ювелирные украшения": 0.0002, "Авто": 0.0001, "Медицина": 0.0001,
+    "Питомцы": 0.0001,
+}
+SAMPLE_TRANSFER_WEIGHTS = {
+    "card_out": 0.4905, "p2p_out": 0.2, "atm_withdrawal": 0.064, "card_in": 0.0545, "utilities_out": 0.051,
+    "loan_payment_out": 0.034, "cashback_in": 0.03, "refund_in": 0.02, "fx_buy": 0.012, "salary_in": 0.0095,
+    "invest_out": 0.008, "installment_payment_out": 0.006, "cc_repayment_out": 0.006, "deposit_topup_out": 0.006,
+    "fx_sell": 0.003, "invest_in": 0.002, "family_in": 0.001, "gold_buy_out": 0.001, "gold_sell_in": 0.001,
+    "stipend_in": 0.0005,
+}
+SAMPLE_CURRENCY_WEIGHTS = {"KZT": 0.985, "USD": 0.008, "EUR": 0.005, "RUB": 0.002}
+SAMPLE_CITIES = {"Алматы": 18, "Астана": 10, "Караганда": 7, "Шымкент": 6, "Павлодар": 6, "Усть-Каменогорск": 4,
+                 "Кызылорда": 4, "Тараз": 3, "Костанай": 2}
+SAMPLE_STATUSES = {"Зарплатный клиент": 0.47, "Премиальный клиент": 0.27, "Стандартный клиент": 0.21, "Студент": 0.05}
+# how the status is spelled inside the per-client files of the sample set
+FILE_STATUS = {"Зарплатный клиент": "зп", "Премиальный клиент": "вип", "Стандартный клиент": "обычный", "Студент": "студент"}
+WRITE_CHUNK_CLIENTS = 1_000
+MANIFEST = "synthetic.json"
+
+def _weights(d):
+    w = np.array(list(d.values()), dtype=np.float64)
+    return list(d), w / w.sum()
+
+def _pick_per_client(rng, weights, counts, concentration):
+    # every client draws its own mix around the population shares, then rows are drawn from that mix
+    mix = rng.dirichlet(weights * concentration, size=len(counts))
+    cum = np.cumsum(np.repeat(mix, counts, axis=0), axis=1)
+    u = rng.random(int(counts.sum()))[:, None]
+    return np.minimum((u > cum).sum(axis=1), len(weights) - 1)
+
+def _format_dates(rng, seconds, mixed_share):
+    out = np.char.replace(np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s"), "T", " ").astype(object)
+    mixed = np.flatnonzero(rng.random(len(seconds)) < mixed_share)
+    if len(mixed):
+        fmts = rng.integers(1, len(MIXED_FORMATS), len(mixed))
+        stamps = pd.to_datetime(seconds[mixed], unit="s")
+        for k in np.unique(fmts):
+            sel = fmts == k
+            out[mixed[sel]] = stamps[sel].strftime(MIXED_FORMATS[k]).to_numpy()
+    return out
+
+def make_client_rows(profiles, kind, rows_per_client, rng, mixed_share=0.05):
+    n = len(profiles)
+    counts = rng.poisson(rows_per_client, n).clip(1)
+    start = np.datetime64("2025-06-01T00:00:00", "s").astype(np.int64)
+    seconds = start + rng.integers(0, 92 * 86400, int(counts.sum()))
+    owner = np.repeat(np.arange(n), counts)
+    order = np.lexsort((seconds, owner))
+    seconds = seconds[order]
+    table = {
+        "client_code": profiles["client_code"].to_numpy()[owner],
+        "name": profiles["name"].to_numpy()[owner],
+        "product": np.asarray(PRODUCTS, dtype=object)[profiles["client_code"].to_numpy() % len(PRODUCTS)][owner],
+        "status": profiles["status"].map(FILE_STATUS).to_numpy()[owner],
+        "city": profiles["city"].to_numpy()[owner],
+        "date": _format_dates(rng, seconds, mixed_share),
+    }
+    currencies, currency_w = _weights(SAMPLE_CURRENCY_WEIGHTS)
+    if kind == "transactions":
+        cats, w = _weights(SAMPLE_CATEGORY_WEIGHTS)
+        table["category"] = np.asarray(cats, dtype=object)[_pick_per_client(rng, w, counts, 30.0)]
+        table["amount"] = np.round(rng.lognormal(8.7, 0.8, len(owner)), 2)
+    else:
+        types, w = _weights(SAMPLE_TRANSFER_WEIGHTS)
+        picked = np.asarray(types, dtype=object)[_pick_per_client(rng, w, counts, 30.0)]
+        table["type"] = picked
+        table["direction"] = pd.Series(picked).map(TRANSFER_TYPES).to_numpy()
+        table["amount"] = np.round(rng.lognormal(10.0, 0.9, len(owner)), 2)
+    table["currency"] = np.asarray(currencies, dtype=object)[rng.choice(len(currencies), len(owner), p=currency_w)]
+    return pd.DataFrame(table), counts
+
+def make_sample_profiles(n_clients, rng):
+    statuses, status_w = _weights(SAMPLE_STATUSES)
+    cities, city_w = _weights(SAMPLE_CITIES)
+    status = np.asarray(statuses, dtype=object)[rng.choice(len(statuses), n_clients, p=status_w)]
+    balance = rng.lognormal(12.2, 1.1, n_clients) * np.where(status == "Премиальный клиент", 8.0, 1.0)
+    return pd.DataFrame({
+        "client_code": np.arange(1, n_clients + 1),
+        "name": rng.choice(NAMES, n_clients),
+        "status": status,
+        "age": np.where(status == "Студент", rng.integers(18, 25, n_clients), rng.integers(20, 60, n_clients)),
+        "city": np.asarray(cities, dtype=object)[rng.choice(len(cities), n_clients, p=city_w)],
+        "avg_monthly_balance_KZT": np.round(balance).astype(np.int64),
+    })
+
+def _write_per_client(out_dir, kind, table, counts, skip):
+    header = "\ufeff" + ",".join(table.columns) + "\n"
+    lines = table.to_csv(index=False, header=False, lineterminator="\n").split("\n")
+    ends = np.cumsum(counts)
+    for cid, end, count, missing in zip(table["client_code"].to_numpy()[ends - 1], ends, counts, skip):
+        if not missing:
+            with open(os.path.join(out_dir, f"client_{cid}_{kind}_3m.csv"), "w", encoding="utf-8", newline="") as f:
+                f.write(header + "\n".join(lines[end - count:end]) + "\n")
+
+def synthetic_params(n_clients, tx_per_client=300, tr_per_client=300, seed=0, mixed_share=0.05, missing_share=0.002):
+    return {"clients": n_clients, "tx_per_client": tx_per_client, "tr_per_client": tr_per_client, "seed": seed,
+            "mixed_share": mixed_share, "missing_share": missing_share}
+
+def write_synthetic_dataset(out_dir, n_clients, chunk_clients=WRITE_CHUNK_CLIENTS, **kwargs):
+    """Seeded dataset in the layout and value mix of the sample data/ set, written chunk by chunk."""
+    params = synthetic_params(n_clients, **kwargs)
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(params["seed"])
+    profiles = make_sample_profiles(n_clients, rng)
+    profiles.to_csv(os.path.join(out_dir, "clients.csv"), index=False, encoding="utf-8-sig")
+    for start in range(0, n_clients, chunk_clients):
+        chunk = profiles.iloc[start:start + chunk_clients]
+        for kind, per_client in (("transactions", params["tx_per_client"]), ("transfers", params["tr_per_client"])):
+            table, counts = make_client_rows(chunk, kind, per_client, rng, params["mixed_share"])
+            _write_per_client(out_dir, kind, table, counts, rng.random(len(chunk)) < params["missing_share"])
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    return params
+
+def ensure_synthetic_dataset(out_dir, n_clients, **kwargs):
+    # regenerates only when the directory was written with different parameters
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            if json.load(f) == synthetic_params(n_clients, **kwargs):
+                return synthetic_params(n_clients, **kwargs)
+        shutil.rmtree(out_dir)
+    return write_synthetic_dataset(out_dir, n_clients, **kwargs)
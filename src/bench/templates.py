@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from src.pipeline.scorer import PRODUCTS
+from src.pipeline.generator import make_template, render_templates, template_columns, validate_push_text, validate_push_texts
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden_templates.json")
+
+def check_golden(path=GOLDEN_PATH):
+    # expected texts were produced by the original per-client if-chain make_template
+    with open(path, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    products = [c["product"] for c in cases]
+    missing = set(PRODUCTS) - set(products)
+    assert not missing, f"golden file does not cover {missing}"
+    bulk = render_templates(products, template_columns([c["signals"] for c in cases], [c["benefit"] for c in cases]))
+    for c, text in zip(cases, bulk):
+        assert text == c["text"], (c["product"], text, c["text"])
+        assert make_template(c["product"], c["signals"], c["benefit"]) == c["text"]
+    texts = [c["text"] for c in cases] + [None, "x" * 200, "!" * 2 + "x" * 198, "a:" + "x" * 190]
+    assert validate_push_texts(texts).tolist() == [validate_push_text(t) for t in texts]
+    return len(cases)
+
+def random_columns(n_rows, rng):
+    cols = {
+        "name": rng.choice(["Айгерим", "Данияр", "Рустем"], n_rows).astype(object),
+        "month_reference": rng.choice(["06.2025", "07.2025", "08.2025"], n_rows).astype(object),
+        "trips_count": rng.integers(0, 30, n_rows),
+        "benefit": rng.gamma(2.0, 5_000.0, n_rows),
+    }
+    for c in ("trips_sum", "taxi_sum", "avg_monthly_balance_KZT", "restaurant_sum", "spare_cash"):
+        cols[c] = np.round(rng.gamma(2.0, 50_000.0, n_rows), 2)
+    for k in range(3):
+        cols[f"top3_cat_{k+1}"] = rng.choice(["Такси", "Отели", "Продукты питания", None], n_rows).astype(object)
+    return cols, rng.choice(PRODUCTS, n_rows).astype(object)
+
+def run(n_rows, seed=0):
+    cols, products = random_columns(n_rows, np.random.default_rng(seed))
+    t = time.perf_counter()
+    texts = render_templates(products, cols)
+    dt_bulk = time.perf_counter() - t
+    m = min(n_rows, 20_000)
+    signals = [{"name": cols["name"][i], "month_reference": cols["month_reference"][i], "trips_count": cols["trips_count"][i],
+                "trips_sum": cols["trips_sum"][i], "taxi_sum": cols["taxi_sum"][i],
+                "avg_monthly_balance_KZT": cols["avg_monthly_balance_KZT"][i], "restaurant_sum": cols["restaurant_sum"][i],
+                "spare_cash": cols["spare_cash"][i], "top3_cats": [cols[f"top3_cat_{k+1}"][i] for k in range(3)]} for i in range(m)]
+    t = time.perf_counter()
+    single = [make_template(products[i], signals[i], cols["benefit"][i]) for i in range(m)]
+    dt_single = (time.perf_counter() - t) * n_rows / m
+    assert single == texts[:m].tolist()
+    t = time.perf_counter()
+    validate_push_texts(texts)
+    dt_validate = time.perf_counter() - t
+    print(f"render_templates        {n_rows:>9} rows  {dt_bulk:7.2f}s  ({n_rows / dt_bulk:,.0f} rows/s)")
+    print(f"make_template per row   {n_rows:>9} rows  {dt_single:7.2f}s  (extrapolated from {m})")
+    print(f"validate_push_texts     {n_rows:>9} rows  {dt_validate:7.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    print(f"golden: {check_golden()} cases match")
+    run(args.rows)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
 import os
 import json
+import numpy as np
 import pandas as pd
 
+CTA_WORDS = ['Открыть','Оформить','Настроить','Посмотреть']
+# criterion -> points, as in score_push_quality
+QUALITY_CRITERIA = {"name": 2, "digit": 1, "length": 2, "tone": 1, "cta": 2, "currency": 2}
+POINTS_BINS = list(range(0, 21, 2))
+EVAL_CHUNK_SIZE = 200_000
+_DIGIT, _UPPER, _ASTRAL, _TENGE, _COMMA, _RARE = 1, 2, 4, 8, 16, 128
+_LUT = None
+
 def score_push_quality(text, name):
     pts = 0
     if name and name in text:
@@ -19,27 +28,128 @@ def score_push_quality(text, name):
         pts += 2
     return min(20, pts*2)
 
-def evaluate_results(results, debug_dir):
-    os.makedirs(debug_dir, exist_ok=True)
-    rows = []
-    total = 0
-    count = 0
-    for cid, r in results.items():
-        product = r['product']
-        push = r['push']
-        name = None
-        try:
-            debug = json.load(open(os.path.join(debug_dir, f"client_{cid}_scores.json"), encoding='utf-8'))
-            name = debug.get('raw_signals',{}).get('name')
-        except Exception:
-            pass
-        push_pts = score_push_quality(push, name)
-        rows.append({"client_code": cid, "product": product, "push_points": push_pts})
-        total += push_pts
-        count += 1
-    avg = total/count if count else 0
-    summary = {"average_push_quality": avg, "clients_evaluated": count}
+def _char_lut():
+    # flags per UTF-16 code unit, from the same str predicates score_push_quality uses;
+    # _RARE marks '!' and CTA first letters, which are located individually
+    global _LUT
+    if _LUT is None:
+        lut = np.zeros(1 << 16, dtype=np.uint8)
+        for i in range(1 << 16):
+            c = chr(i)
+            lut[i] = _DIGIT * c.isdigit() | _UPPER * (c.isupper() and c.isalpha())
+        lut[0xD800:0xE000] |= _ASTRAL
+        lut[ord("₸")] |= _TENGE
+        lut[ord(",")] |= _COMMA
+        lut[[ord("!")] + [ord(w[0]) for w in CTA_WORDS]] |= _RARE
+        _LUT = lut
+    return _LUT
+
+def _score_chunk(texts, lengths):
+    # the chunk as one NUL separated UTF-16 buffer; per-text flags are OR-reduced between start offsets
+    n = len(texts)
+    units = np.frombuffer(("\x00".join(texts) + "\x00").encode("utf-16-le", "surrogatepass"), dtype=np.uint16)
+    if len(units) != lengths.sum() + n:
+        lengths = np.fromiter((len(t.encode("utf-16-le", "surrogatepass")) // 2 for t in texts), dtype=np.int64, count=n)
+    starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(lengths[:-1] + 1, out=starts[1:])
+    flags = _char_lut()[units]
+    seen = np.bitwise_or.reduceat(flags, starts) if n else np.zeros(0, dtype=np.uint8)
+    pos = np.flatnonzero(flags & _RARE)
+    unit = units[pos]
+    bangs = np.bincount(np.searchsorted(starts, pos[unit == ord("!")], side="right") - 1, minlength=n)
+    cta = np.zeros(n, dtype=bool)
+    for w in CTA_WORDS:
+        p = pos[unit == ord(w[0])]
+        for k in range(1, len(w)):
+            p = p[units[p + k] == ord(w[k])]
+        cta[np.searchsorted(starts, p, side="right") - 1] = True
+    digit = (seen & _DIGIT) > 0
+    upper = (seen & _UPPER) > 0
+    for i in np.flatnonzero(seen & _ASTRAL).tolist():
+        # surrogate pairs are not classified by the table
+        digit[i] = any(c.isdigit() for c in texts[i])
+        upper[i] = any(c.isupper() for c in texts[i] if c.isalpha())
+    return digit, upper, bangs, cta, ((seen & _TENGE) > 0) & ((seen & _COMMA) > 0)
+
+def score_push_columns(texts, names, chunk_size=EVAL_CHUNK_SIZE):
+    texts = [t if isinstance(t, str) else str(t) for t in texts]
+    n = len(texts)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    digit, upper, cta, currency = (np.zeros(n, dtype=bool) for _ in range(4))
+    bangs = np.zeros(n, dtype=np.int64)
+    for start in range(0, n, chunk_size):
+        sl = slice(start, start + chunk_size)
+        digit[sl], upper[sl], bangs[sl], cta[sl], currency[sl] = _score_chunk(texts[sl], lengths[sl])
+    has_name = np.zeros(n, dtype=bool)
+    sel = [i for i, x in enumerate(names) if isinstance(x, str) and x]
+    has_name[sel] = list(map(str.__contains__, [texts[i] for i in sel], [names[i] for i in sel]))
+    out = pd.DataFrame({
+        "name": has_name,
+        "digit": digit,
+        "length": (lengths >= 180) & (lengths <= 220),
+        "tone": (bangs <= 1) & ~upper,
+        "cta": cta,
+        "currency": currency,
+    })
+    pts = sum(out[c].to_numpy().astype(np.int64) * w for c, w in QUALITY_CRITERIA.items())
+    out["push_points"] = np.minimum(20, pts * 2)
+    return out
+
+def quality_counts(products, scored):
+    # additive per-product totals, so chunked runs can sum them before summarizing
+    frame = scored.assign(product=np.asarray(products, dtype=object))
+    counts = frame.groupby("product", sort=False).agg(clients=("push_points", "size"), points=("push_points", "sum"),
+                                                      **{c: (c, "sum") for c in QUALITY_CRITERIA})
+    hist = pd.crosstab(frame["product"], frame["push_points"]).reindex(columns=POINTS_BINS, fill_value=0)
+    hist.columns = [f"points_{p}" for p in POINTS_BINS]
+    return pd.concat([counts, hist], axis=1).astype(np.int64)
+
+def add_quality_counts(total, counts):
+    if total is None:
+        return counts
+    return pd.concat([total, counts]).groupby(level=0, sort=False).sum()
+
+def _summary_block(row):
+    n = int(row["clients"])
+    return {
+        "clients": n,
+        "average_push_quality": int(row["points"]) / n if n else 0,
+        "criteria_pass_rate": {c: int(row[c]) / n if n else 0 for c in QUALITY_CRITERIA},
+        "points_histogram": {str(p): int(row[f"points_{p}"]) for p in POINTS_BINS},
+    }
+
+def quality_summary(counts):
+    columns = ["clients", "points", *QUALITY_CRITERIA, *(f"points_{p}" for p in POINTS_BINS)]
+    total = counts.sum() if counts is not None else pd.Series(0, index=columns)
+    overall = _summary_block(total)
+    return {
+        "average_push_quality": overall["average_push_quality"],
+        "clients_evaluated": overall["clients"],
+        "criteria_pass_rate": overall["criteria_pass_rate"],
+        "points_histogram": overall["points_histogram"],
+        "by_product": {p: _summary_block(row) for p, row in counts.iterrows()} if counts is not None else {},
+    }
+
+def write_quality_summary(summary, debug_dir):
     with open(os.path.join(debug_dir, "evaluation_summary.json"), "w", encoding="utf-8") as f:
         json.dump(summary, f, ensure_ascii=False, indent=2)
-    pd.DataFrame(rows).to_csv(os.path.join(debug_dir, "evaluation_per_client.csv"), index=False)
+
+def per_client_frame(client_codes, products, scored):
+    frame = pd.DataFrame({"client_code": client_codes, "product": products, "push_points": scored["push_points"].to_numpy()})
+    for c in QUALITY_CRITERIA:
+        frame[f"pass_{c}"] = scored[c].to_numpy().astype(np.int8)
+    return frame
+
+def evaluate_columns(client_codes, products, texts, names, debug_dir):
+    os.makedirs(debug_dir, exist_ok=True)
+    scored = score_push_columns(texts, names)
+    summary = quality_summary(quality_counts(products, scored) if len(scored) else None)
+    write_quality_summary(summary, debug_dir)
+    per_client_frame(client_codes, products, scored).to_csv(os.path.join(debug_dir, "evaluation_per_client.csv"), index=False)
     return summary
+
+def evaluate_results(results, debug_dir, names=None):
+    names = names or {}
+    cids = list(results)
+    return evaluate_columns(cids, [results[c]["product"] for c in cids], [results[c]["push"] for c in cids],
+                            [names.get(c) for c in cids], debug_dir)
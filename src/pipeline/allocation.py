@@ -0,0 +1,179 @@
+import json
+import time
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+from src.pipeline.scorer import PRODUCTS, top_k_products
+
+ALLOCATION_MODES = ["auto", "greedy", "exact"]
+# auto solves exactly while the LP stays small (contested clients x (capped products + 1)); HiGHS needs a few seconds there
+EXACT_MAX_VARIABLES = 200_000
+EXCHANGE_PASSES = 4
+ALLOCATION_REPORT = {}
+
+def load_product_caps(path):
+    with open(path, "r", encoding="utf-8") as f:
+        caps = json.load(f)
+    if not isinstance(caps, dict):
+        raise ValueError(f"{path}: expected an object of product caps")
+    unknown = [p for p in caps if p not in PRODUCTS]
+    if unknown:
+        raise ValueError(f"unknown products in {path}: {', '.join(unknown)}")
+    if any(not isinstance(v, int) or isinstance(v, bool) or v < 0 for v in caps.values()):
+        raise ValueError(f"caps in {path} must be non-negative integers")
+    return caps
+
+def cap_array(caps):
+    # inf for products without a cap
+    return np.array([caps.get(p, np.inf) for p in PRODUCTS], dtype=float)
+
+def _contested(score, caps):
+    # clients whose best product is uncapped keep it; only the others compete for capacity
+    best = score.argmax(axis=1)
+    return best, np.flatnonzero(np.isfinite(caps)[best])
+
+def allocate_greedy(score, caps):
+    # regret-ordered deferred acceptance: clients propose down their score order, an oversubscribed product
+    # keeps the clients that lose most by moving to their next open product and closes to everyone else
+    best, rows = _contested(score, caps)
+    out = best.copy()
+    n, m = len(rows), score.shape[1]
+    if not n:
+        return out
+    # full preference order; the first four columns are the client's top4
+    order = np.argsort(-score[rows], axis=1, kind="stable")
+    ranked = np.take_along_axis(score[rows], order, axis=1)
+    closed = np.zeros(m, dtype=bool)
+    ptr = np.zeros(n, dtype=np.int64)
+    idx = np.arange(n)
+    after = np.arange(m)[None, :]
+    while True:
+        active = ptr < m
+        product = np.where(active, order[idx, np.minimum(ptr, m - 1)], -1)
+        counts = np.bincount(product[active], minlength=m)
+        over = np.isfinite(caps) & (counts > caps)
+        if not over.any():
+            break
+        closed |= over
+        claim = np.flatnonzero(active & over[np.maximum(product, 0)])
+        at = ptr[claim]
+        opened = ~closed[order[claim]] & (after > at[:, None])
+        has_next = opened.any(axis=1)
+        nxt = np.where(has_next, opened.argmax(axis=1), m)
+        current = ranked[claim, at]
+        regret = np.where(has_next, current - ranked[claim, np.minimum(nxt, m - 1)], np.inf)
+        # per product, keep the claimants that would lose most by moving on; the rest go to their next open product
+        by = np.lexsort((claim, -current, -regret, product[claim]))
+        group = product[claim[by]]
+        start = np.searchsorted(group, group, side="left")
+        rejected = by[np.arange(len(by)) - start >= caps[group]]
+        ptr[claim[rejected]] = nxt[rejected]
+    picked = np.where(ptr < m, order[idx, np.minimum(ptr, m - 1)], -1)
+    out[rows] = _exchange(score[rows], picked, caps)
+    return out
+
+def _exchange(score, allocated, caps, passes=EXCHANGE_PASSES):
+    # local search after the greedy pass: move clients into spare capacity, then swap clients between each pair
+    # of products (and "no product") while that raises the total; each step is one sort over a product's clients
+    n, m = score.shape
+    ext = np.column_stack([score, np.zeros(n)])
+    limit = np.append(caps, np.inf)
+    a = np.where(allocated < 0, m, allocated)
+    idx = np.arange(n)
+    for _ in range(passes):
+        before = ext[idx, a].sum()
+        for b in range(m):
+            spare = limit[b] - np.count_nonzero(a == b)
+            if spare <= 0:
+                continue
+            gain = ext[:, b] - ext[idx, a]
+            movers = np.flatnonzero((gain > 0) | (a == m))
+            if len(movers) > spare:
+                movers = movers[np.argsort(-gain[movers], kind="stable")[:int(spare)]]
+            a[movers] = b
+        for x in range(m + 1):
+            for y in range(x + 1, m + 1):
+                i = np.flatnonzero(a == x)
+                j = np.flatnonzero(a == y)
+                if not len(i) or not len(j):
+                    continue
+                gi = ext[i, y] - ext[i, x]
+                gj = ext[j, x] - ext[j, y]
+                # a client can only be in a profitable swap if its gain beats the other side's best loss
+                keep_i, keep_j = gi > -gj.max(), gj > -gi.max()
+                i, gi, j, gj = i[keep_i], gi[keep_i], j[keep_j], gj[keep_j]
+                if not len(i) or not len(j):
+                    continue
+                oi = np.argsort(-gi, kind="stable")
+                oj = np.argsort(-gj, kind="stable")
+                k = min(len(i), len(j))
+                # both gain lists are sorted, so pair sums fall and the profitable swaps are a prefix
+                swap = int(np.count_nonzero(gi[oi[:k]] + gj[oj[:k]] > 1e-12))
+                i, j = i[oi], j[oj]
+                a[i[:swap]], a[j[:swap]] = y, x
+        if ext[idx, a].sum() - before <= 1e-6 * abs(before):
+            break
+    return np.where(a < m, a, -1)
+
+def allocate_exact(score, caps):
+    # transportation problem over the contested clients; its constraint matrix is totally unimodular, so the LP optimum is integral
+    best, rows = _contested(score, caps)
+    out = best.copy()
+    if not len(rows):
+        return out
+    capped = np.flatnonzero(np.isfinite(caps))
+    free = np.flatnonzero(~np.isfinite(caps))
+    if len(free):
+        # uncapped products are interchangeable capacity-wise, so each client only needs its best one
+        fallback = free[top_k_products(score[rows][:, free], 1)[:, 0]]
+        last = score[rows, fallback]
+    else:
+        # no product left for the client; costs more than any reshuffle can gain, so as many clients as possible are placed
+        fallback = np.full(len(rows), -1)
+        last = np.full(len(rows), -(np.ptp(score) + 1) * (len(capped) + 1))
+    options = np.column_stack([score[rows][:, capped], last])
+    n, k = options.shape
+    var = np.arange(n * k).reshape(n, k)
+    per_client = sparse.csr_matrix((np.ones(n * k), (np.repeat(np.arange(n), k), var.ravel())), shape=(n, n * k))
+    per_product = sparse.csr_matrix((np.ones(n * (k - 1)), (np.tile(np.arange(k - 1), n), var[:, :-1].ravel())), shape=(k - 1, n * k))
+    res = linprog(-options.ravel(), A_ub=per_product, b_ub=caps[capped], A_eq=per_client, b_eq=np.ones(n), bounds=(0, 1), method="highs")
+    if res.x is None:
+        raise RuntimeError(f"allocation solver failed: {res.message}")
+    pick = res.x.reshape(n, k).argmax(axis=1)
+    out[rows] = np.where(pick < k - 1, capped[np.minimum(pick, k - 2)], fallback)
+    return out
+
+def exact_variables(score, caps):
+    return len(_contested(score, caps)[1]) * (int(np.isfinite(caps).sum()) + 1)
+
+def allocate(score, caps, mode="auto"):
+    if mode == "auto":
+        mode = "exact" if exact_variables(score, caps) <= EXACT_MAX_VARIABLES else "greedy"
+    return (allocate_exact if mode == "exact" else allocate_greedy)(score, caps), mode
+
+def allocation_totals(score, allocated):
+    placed = allocated >= 0
+    return float(score[np.flatnonzero(placed), allocated[placed]].sum())
+
+def allocate_table(table, caps, mode="auto"):
+    t = time.perf_counter()
+    score = table.scores["score"]
+    limits = cap_array(caps)
+    allocated, method = allocate(score, limits, mode)
+    table.allocated = allocated.astype(np.int8)
+    top = table.top4[:, 0]
+    placed = allocated[allocated >= 0]
+    ALLOCATION_REPORT.clear()
+    ALLOCATION_REPORT.update({
+        "method": method,
+        "clients": len(table),
+        "caps": dict(caps),
+        "demand": {p: int(n) for p, n in zip(PRODUCTS, np.bincount(top, minlength=len(PRODUCTS))) if n},
+        "allocated": {p: int(n) for p, n in zip(PRODUCTS, np.bincount(placed, minlength=len(PRODUCTS))) if n},
+        "moved": int(((allocated != top) & (allocated >= 0)).sum()),
+        "unassigned": int((allocated < 0).sum()),
+        "score_total": allocation_totals(score, allocated),
+        "score_total_uncapped": allocation_totals(score, top),
+        "seconds": time.perf_counter() - t,
+    })
+    return table
@@ -1,5 +1,7 @@
 import numpy as np
+import pandas as pd
 from collections import Counter
+from src.utils.io import missing_client_codes
 
 TRAVEL_CATS = {"Путешествия","Отели","Такси"}
 
@@ -52,6 +54,23 @@ def compute_signals_for_client(client):
         fx_amount = float(fx["amount"].abs().sum())
     signals["fx_count"] = int(fx_count)
     signals["fx_amount"] = float(fx_amount)
+    foreign_count = 0
+    foreign_amount = 0.0
+    by_currency = Counter()
+    for t in (tr, transfers):
+        if t is not None and not t.empty and "fx_currency" in t.columns:
+            f = t[t["fx_currency"].notna()]
+            foreign_count += f.shape[0]
+            foreign_amount = foreign_amount + float(f["amount"].abs().sum())
+            part = Counter()
+            for cur, amt in zip(f["fx_currency"], f["amount"].abs()):
+                part[cur] += amt
+            for cur, amt in part.items():
+                by_currency[cur] += amt
+    signals["foreign_count"] = int(foreign_count)
+    signals["foreign_amount"] = float(foreign_amount)
+    signals["foreign_currencies"] = len(by_currency)
+    signals["top_foreign_currency"] = max(sorted(by_currency), key=by_currency.get) if by_currency else None
     monthly_spend = float(client.get("monthly_spend", 0))
     signals["monthly_spend"] = monthly_spend
     avg_bal = signals["avg_monthly_balance_KZT"]
@@ -68,3 +87,207 @@ def compute_all_signals(clients_agg):
     for cid, c in clients_agg.items():
         signals[cid] = compute_signals_for_client(c)
     return signals
+
+CASH_OUT_DIRECTIONS = ["out","p2p_out","card_out"]
+SIGNAL_COLUMNS = [
+    "avg_monthly_balance_KZT", "status", "name", "month_reference",
+    "top3_cat_1", "top3_cat_2", "top3_cat_3", "top3_spend",
+    "trips_sum", "trips_count", "taxi_sum", "restaurant_sum", "jewelry_sum", "remont_sum", "mebel_sum",
+    "cash_out_count", "cash_out_sum", "fx_count", "fx_amount", "monthly_spend", "spare_cash", "invest_in_count",
+    "foreign_count", "foreign_amount", "foreign_currencies", "top_foreign_currency",
+]
+_NOT_SEEN = np.iinfo(np.int64).max
+
+def _pairwise_group_sum(values, groups, n):
+    # same association order as pandas Series.sum() on each group's rows
+    order = np.argsort(groups, kind="stable")
+    v = values[order]
+    counts = np.bincount(groups, minlength=n)
+    starts = np.cumsum(counts) - counts
+    out = np.zeros(n)
+    for length in np.unique(counts[counts > 0]):
+        sel = np.flatnonzero(counts == length)
+        out[sel] = v[starts[sel][:, None] + np.arange(length)].sum(axis=1)
+    return out
+
+def _map_uniques(values, fn):
+    # evaluate a string predicate once per distinct value instead of once per row
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return np.asarray(fn(pd.Series(uniques, dtype=object)), dtype=bool)[codes]
+
+def present_client_codes(profiles, missing=None):
+    codes = profiles["client_code"].astype(int).to_numpy()
+    if not missing:
+        return codes
+    absent = missing_client_codes(missing, "transactions") & missing_client_codes(missing, "transfers")
+    return codes[~np.isin(codes, list(absent))]
+
+def foreign_exposure(parts, n, currencies):
+    # parts: (client index, absolute base amount, currency code) per table
+    n_cur = len(currencies)
+    count = np.zeros((n, n_cur), dtype=np.int64)
+    by_currency = np.zeros((n, n_cur))
+    total = np.zeros(n)
+    for ci, amount, cur in parts:
+        f = cur >= 0
+        key = ci[f] * n_cur + cur[f]
+        count += np.bincount(key, minlength=n * n_cur).reshape(n, n_cur)
+        by_currency += np.bincount(key, weights=amount[f], minlength=n * n_cur).reshape(n, n_cur)
+        total = total + _pairwise_group_sum(amount[f], ci[f], n)
+    return {"currencies": list(currencies), "foreign_count": count, "foreign_by_currency": by_currency, "foreign_amount": total}
+
+def aggregate_tables(transactions, transfers, index, rates=None):
+    n = len(index)
+    ci = index.get_indexer(transactions["client_code"].astype(int))
+    keep = ci >= 0
+    ci = ci[keep]
+    amount = pd.to_numeric(transactions["amount"], errors="coerce").fillna(0).to_numpy(dtype=float)[keep]
+    cur = np.full(len(ci), -1)
+    if rates is not None and "currency" in transactions.columns:
+        amount, cur = rates.convert(amount, transactions["currency"].to_numpy(dtype=object)[keep], transactions["date"].to_numpy()[keep])
+    cat_codes, cat_labels = pd.factorize(transactions["category"].to_numpy(dtype=object)[keep], use_na_sentinel=False)
+    cat_labels = list(cat_labels)
+    ncat = len(cat_labels)
+    key = ci * ncat + cat_codes
+    first_seen = np.full(n * ncat, -1, dtype=np.int64)
+    seen_keys, seen_at = np.unique(key, return_index=True)
+    first_seen[seen_keys] = seen_at
+    last_date = transactions["date"][keep].groupby(ci).max()
+    pos = amount > 0
+
+    ti = index.get_indexer(transfers["client_code"].astype(int))
+    tkeep = ti >= 0
+    ti = ti[tkeep]
+    tamount = pd.to_numeric(transfers["amount"], errors="coerce").fillna(0).to_numpy(dtype=float)[tkeep]
+    tcur = np.full(len(ti), -1)
+    if rates is not None and "currency" in transfers.columns:
+        tamount, tcur = rates.convert(tamount, transfers["currency"].to_numpy(dtype=object)[tkeep], transfers["date"].to_numpy()[tkeep])
+    tamount = np.abs(tamount)
+    cash = _map_uniques(transfers["direction"].to_numpy(dtype=object)[tkeep], lambda u: u.astype(str).str.lower().isin(CASH_OUT_DIRECTIONS))
+    ttype = transfers["type"].to_numpy(dtype=object)[tkeep]
+    fx = _map_uniques(ttype, lambda u: u.str.contains("fx", case=False, na=False))
+    return {
+        **foreign_exposure([(ci, np.abs(amount), cur), (ti, tamount, tcur)], n, rates.currencies if rates is not None else []),
+        "cat_labels": cat_labels,
+        "spend": np.bincount(key, weights=amount, minlength=n * ncat).reshape(n, ncat),
+        "count": np.bincount(key, minlength=n * ncat).reshape(n, ncat),
+        "first_seen": first_seen.reshape(n, ncat),
+        "last_date": pd.Series(last_date.to_numpy(), index=last_date.index.to_numpy()),
+        "positive_sum": _pairwise_group_sum(amount[pos], ci[pos], n),
+        "cash_out_count": np.bincount(ti[cash], minlength=n),
+        "cash_out_sum": _pairwise_group_sum(tamount[cash], ti[cash], n),
+        "fx_count": np.bincount(ti[fx], minlength=n),
+        "fx_amount": _pairwise_group_sum(tamount[fx], ti[fx], n),
+        "invest_in_count": np.bincount(ti[_map_uniques(ttype, lambda u: u == "invest_in")], minlength=n),
+    }
+
+def signals_from_aggregates(profiles, index, agg, months=3):
+    n = len(index)
+    prof = profiles.assign(client_code=profiles["client_code"].astype(int)).set_index("client_code").reindex(index)
+    # columns collected first and framed once; inserting them one by one dominates small batches
+    out = {}
+    if "avg_monthly_balance_KZT" in prof.columns:
+        out["avg_monthly_balance_KZT"] = prof["avg_monthly_balance_KZT"].astype(float)
+    else:
+        out["avg_monthly_balance_KZT"] = 0.0
+    out["status"] = prof["status"] if "status" in prof.columns else None
+    out["name"] = prof["name"] if "name" in prof.columns else None
+
+    cat_labels = agg["cat_labels"]
+    ncat = len(cat_labels)
+    spend = agg["spend"]
+    first_seen = agg["first_seen"]
+    present = first_seen >= 0
+    seen_order = np.where(present, first_seen, _NOT_SEEN)
+
+    top_order = np.lexsort((seen_order, -np.where(present, spend, -np.inf)), axis=1)[:, :3]
+    labels = np.array(cat_labels + [None], dtype=object)
+    top_idx = np.where(np.take_along_axis(present, top_order, axis=1), top_order, ncat)
+    for k in range(3):
+        out[f"top3_cat_{k+1}"] = pd.Series(labels[top_idx[:, k]] if k < ncat else None, index=index, dtype=object)
+    top_vals = np.take_along_axis(np.where(present, spend, 0.0), top_order, axis=1)
+    top3_spend = np.zeros(n)
+    for k in range(top_vals.shape[1]):
+        top3_spend = top3_spend + top_vals[:, k]
+    out["top3_spend"] = top3_spend
+
+    col = {c: j for j, c in enumerate(cat_labels)}
+    travel = [col[c] for c in cat_labels if c in TRAVEL_CATS]
+    trips_sum = np.zeros(n)
+    if travel:
+        order = np.argsort(seen_order[:, travel], axis=1, kind="stable")
+        parts = np.take_along_axis(np.where(present, spend, 0.0)[:, travel], order, axis=1)
+        trips_sum = parts[:, 0]
+        for k in range(1, len(travel)):
+            trips_sum = trips_sum + parts[:, k]
+    out["trips_sum"] = trips_sum
+    out["trips_count"] = agg["count"][:, travel].sum(axis=1).astype(np.int64)
+    for name, cat in (("taxi_sum", "Такси"), ("restaurant_sum", "Кафе и рестораны"), ("jewelry_sum", "Ювелирные украшения"), ("remont_sum", "Ремонт дома"), ("mebel_sum", "Мебель")):
+        out[name] = spend[:, col[cat]] if cat in col else 0.0
+
+    last = agg["last_date"].dropna().dt.strftime("%m.%Y")
+    month_reference = np.full(n, None, dtype=object)
+    month_reference[last.index.to_numpy()] = last.to_numpy(dtype=object)
+    out["month_reference"] = pd.Series(month_reference, index=index, dtype=object)
+    out["monthly_spend"] = agg["positive_sum"] / months
+    for c in ("cash_out_count", "cash_out_sum", "fx_count", "fx_amount", "invest_in_count"):
+        out[c] = agg[c]
+    count = agg["foreign_count"]
+    by_currency = agg["foreign_by_currency"]
+    out["foreign_count"] = count.sum(axis=1).astype(np.int64)
+    out["foreign_amount"] = agg["foreign_amount"]
+    out["foreign_currencies"] = (count > 0).sum(axis=1).astype(np.int64)
+    cur_labels = np.array(list(agg["currencies"]) + [None], dtype=object)
+    top = np.argmax(by_currency, axis=1) if count.shape[1] else np.zeros(n, dtype=np.int64)
+    out["top_foreign_currency"] = pd.Series(cur_labels[np.where(out["foreign_count"] > 0, top, count.shape[1])], index=index, dtype=object)
+
+    spare = np.asarray(out["avg_monthly_balance_KZT"], dtype=float) - np.asarray(out["monthly_spend"], dtype=float)
+    out["spare_cash"] = np.where(spare > 0, spare, 0.0)
+    spend_frame = pd.DataFrame(spend, index=index, columns=cat_labels)
+    first_seen_frame = pd.DataFrame(first_seen, index=index, columns=cat_labels)
+    return pd.DataFrame(out, index=index)[SIGNAL_COLUMNS], spend_frame, first_seen_frame
+
+def compute_signals_frame(transactions, transfers, profiles, missing=None, rates=None, months=3):
+    index = pd.Index(present_client_codes(profiles, missing), name="client_code")
+    return signals_from_aggregates(profiles, index, aggregate_tables(transactions, transfers, index, rates), months)
+
+def signal_dict(cid, row, spend_by_category):
+    return {
+        "avg_monthly_balance_KZT": float(row["avg_monthly_balance_KZT"]),
+        "status": row["status"],
+        "name": row["name"],
+        "client_code": int(cid),
+        "month_reference": row["month_reference"],
+        "spend_by_category": spend_by_category,
+        "top3_cats": [row["top3_cat_1"], row["top3_cat_2"], row["top3_cat_3"]],
+        "trips_sum": float(row["trips_sum"]),
+        "trips_count": int(row["trips_count"]),
+        "taxi_sum": float(row["taxi_sum"]),
+        "restaurant_sum": float(row["restaurant_sum"]),
+        "jewelry_sum": float(row["jewelry_sum"]),
+        "remont_sum": float(row["remont_sum"]),
+        "mebel_sum": float(row["mebel_sum"]),
+        "cash_out_sum": float(row["cash_out_sum"]) if row["cash_out_count"] else 0,
+        "fx_count": int(row["fx_count"]),
+        "fx_amount": float(row["fx_amount"]),
+        "monthly_spend": float(row["monthly_spend"]),
+        "spare_cash": float(row["spare_cash"]),
+        "invest_in_count": int(row["invest_in_count"]),
+        "foreign_count": int(row["foreign_count"]),
+        "foreign_amount": float(row["foreign_amount"]),
+        "foreign_currencies": int(row["foreign_currencies"]),
+        "top_foreign_currency": row["top_foreign_currency"],
+    }
+
+def iter_signal_dicts(signals, spend, first_seen):
+    labels = list(spend.columns)
+    sp = spend.to_numpy().tolist()
+    fs = first_seen.to_numpy()
+    order = np.argsort(np.where(fs >= 0, fs, _NOT_SEEN), axis=1, kind="stable").tolist()
+    n_seen = (fs >= 0).sum(axis=1).tolist()
+    cols = {c: signals[c].tolist() for c in SIGNAL_COLUMNS}
+    for i, cid in enumerate(signals.index.tolist()):
+        yield cid, signal_dict(cid, {c: cols[c][i] for c in SIGNAL_COLUMNS}, {labels[j]: sp[i][j] for j in order[i][:n_seen[i]]})
+
+def compute_all_signals_from_tables(transactions, transfers, profiles, missing=None, rates=None):
+    return dict(iter_signal_dicts(*compute_signals_frame(transactions, transfers, profiles, missing, rates)))
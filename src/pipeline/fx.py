@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from collections import Counter
+
+BASE_CURRENCY = "KZT"
+RATE_COLUMNS = ["date", "currency", "rate"]
+# converted rows, plus rows per currency with no rate at all or dated before the currency's first rate
+FX_STATS = Counter()
+_DAY_BIAS = 2 ** 31
+_NO_DATE = 2 ** 31 - 1
+_LOADED = {}
+
+def rate_keys(codes, days):
+    # one sortable int64 per (currency, day): a single searchsorted does the as-of lookup for every currency at once
+    return np.asarray(codes, dtype=np.int64) * 2 ** 32 + (np.asarray(days, dtype=np.int64) + _DAY_BIAS)
+
+def _days(dates):
+    d = pd.to_datetime(pd.Series(dates, copy=False), errors="coerce").to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    # undated rows take the latest rate
+    return np.where(np.isnat(d), _NO_DATE, d.astype(np.int64))
+
+class FxRates:
+    """Daily rates to the base currency (base units per 1 unit of the currency), as flat arrays sorted by (currency, day).
+
+    A row converts at the last rate on or before its date; rows dated before a currency's first rate use that first rate.
+    """
+
+    def __init__(self, currencies, keys, rates):
+        self.currencies = list(currencies)
+        self.keys = keys
+        self.rates = rates
+        self._codes = {c: j for j, c in enumerate(self.currencies)}
+        self.starts = np.searchsorted(keys, rate_keys(np.arange(len(self.currencies)), np.full(len(self.currencies), -_DAY_BIAS)))
+        self._signature = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def signature(self):
+        if self._signature is None:
+            h = hashlib.sha1(json.dumps(self.currencies).encode())
+            h.update(np.ascontiguousarray(self.keys).tobytes())
+            h.update(np.ascontiguousarray(self.rates).tobytes())
+            self._signature = h.hexdigest()
+        return self._signature
+
+    def currency_codes(self, currency):
+        # index into self.currencies per row, -1 for the base currency, missing or unrated currencies
+        codes, uniques = pd.factorize(np.asarray(currency, dtype=object), use_na_sentinel=True)
+        labels = [str(u).strip().upper() for u in uniques]
+        mapping = np.array([self._codes.get(u, -1) for u in labels] + [-1], dtype=np.int64)
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        for u, n in zip(labels, counts.tolist()):
+            if u not in self._codes and u != BASE_CURRENCY and n:
+                FX_STATS[f"unrated:{u}"] += n
+        return mapping[np.where(codes < 0, len(labels), codes)]
+
+    def lookup(self, currency, dates):
+        cur = self.currency_codes(currency)
+        rate = np.ones(len(cur))
+        rated = np.flatnonzero(cur >= 0)
+        if rated.size:
+            c = cur[rated]
+            # dates are parsed only for the (few) foreign rows
+            dates = dates.to_numpy() if isinstance(dates, pd.Series) else np.asarray(dates)
+            idx = np.searchsorted(self.keys, rate_keys(c, _days(dates[rated])), side="right") - 1
+            early = idx < self.starts[c]
+            if early.any():
+                for j, n in zip(*np.unique(c[early], return_counts=True)):
+                    FX_STATS[f"before_first_rate:{self.currencies[j]}"] += int(n)
+            rate[rated] = self.rates[np.maximum(idx, self.starts[c])]
+            FX_STATS["converted"] += int(rated.size)
+        return rate, cur
+
+    def convert(self, amount, currency, dates):
+        rate, cur = self.lookup(currency, dates)
+        return np.asarray(amount, dtype=float) * rate, cur
+
+def convert_table(table, rates):
+    # amounts to the base currency in place; fx_currency names the currency of converted rows, None otherwise
+    if rates is None or table is None or not {"amount", "currency", "date"} <= set(table.columns):
+        return table
+    amount, cur = rates.convert(table["amount"].to_numpy(dtype=float), table["currency"].to_numpy(dtype=object), table["date"])
+    table["amount"] = amount
+    table["fx_currency"] = np.array(rates.currencies + [None], dtype=object)[cur]
+    return table
+
+def read_rate_table(path):
+    df = pd.read_csv(path, dtype={"currency": str})
+    absent = [c for c in RATE_COLUMNS if c not in df.columns]
+    if absent:
+        raise ValueError(f"{path}: rate table needs columns {RATE_COLUMNS}, missing {absent}")
+    currency = df["currency"].str.strip().str.upper()
+    date = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    rate = pd.to_numeric(df["rate"], errors="coerce")
+    bad = currency.isna() | date.isna() | ~(rate > 0)
+    if bad.any():
+        raise ValueError(f"{path}: {int(bad.sum())} rows without a currency, a YYYY-MM-DD date or a positive rate")
+    keep = (currency != BASE_CURRENCY).to_numpy()
+    currencies = sorted(currency[keep].unique())
+    codes = pd.Categorical(currency[keep], categories=currencies).codes
+    keys = rate_keys(codes, date[keep].to_numpy(dtype="datetime64[D]").astype(np.int64))
+    values = rate[keep].to_numpy(dtype=float)
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    # a repeated (currency, day) keeps the row listed last
+    last = np.r_[keys[1:] != keys[:-1], True] if len(keys) else np.zeros(0, dtype=bool)
+    return FxRates(currencies, keys[last], values[last])
+
+def _file_signature(path):
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+def _read_compiled(cache_dir, signature):
+    meta_path = os.path.join(cache_dir, "fx_rates.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("signature") != signature:
+        return None
+    # memory-mapped: long histories are paged in on lookup and shared between worker processes through the page cache
+    keys = np.load(os.path.join(cache_dir, "fx_rate_keys.npy"), mmap_mode="r")
+    values = np.load(os.path.join(cache_dir, "fx_rate_values.npy"), mmap_mode="r")
+    return FxRates(meta["currencies"], keys, values)
+
+def _write_compiled(cache_dir, signature, rates):
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, "fx_rate_keys.npy"), rates.keys)
+    np.save(os.path.join(cache_dir, "fx_rate_values.npy"), rates.rates)
+    with open(os.path.join(cache_dir, "fx_rates.json"), "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "currencies": rates.currencies}, f, ensure_ascii=False)
+
+def load_fx_rates(path, cache_dir=None):
+    # parsed once per process and file version; with cache_dir the sorted arrays are kept on disk and memory-mapped
+    signature = _file_signature(path)
+    rates = _LOADED.get(signature)
+    if rates is not None:
+        return rates
+    rates = _read_compiled(cache_dir, signature) if cache_dir else None
+    if rates is None:
+        rates = read_rate_table(path)
+        if cache_dir:
+            _write_compiled(cache_dir, signature, rates)
+            rates = _read_compiled(cache_dir, signature)
+    _LOADED[signature] = rates
+    return rates
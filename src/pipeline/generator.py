@@ -1,9 +1,12 @@
 import os
 import math
-import requests
-import json
+import string
+import numpy as np
+import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
+from src.pipeline.paraphrase import ParaphraseEngine, AI_CONCURRENCY, AI_RATE
+from src.utils.metrics import stage
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_URL = os.getenv("OPENROUTER_URL")
@@ -30,39 +33,137 @@ def fmt_currency(amount):
         s = "-" + s
     return f"{s} ₸"
 
-def make_template(product, signals, benefit):
-    name = signals.get("name")
-    month = signals.get("month_reference") or datetime.now().strftime("%m.%Y")
+def fmt_currency_column(values):
+    amt = np.asarray(values)
+    if amt.dtype.kind not in "fiub":
+        amt = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+    amt = np.nan_to_num(amt.astype(float), nan=0.0)
+    neg = amt < 0
+    amt = np.abs(amt)
+    whole = np.floor(amt)
+    frac = np.rint((amt - whole) * 100).astype(np.int64)
+    whole = whole.astype(np.int64)
+    # thousands groups from the right: each step zero-pads what was built so far and prepends the next group
+    s = (whole % 1000).astype(str)
+    rest = whole // 1000
+    width = 3
+    while rest.any():
+        s = np.where(rest > 0, np.char.add(np.char.add((rest % 1000).astype(str), " "), np.char.zfill(s, width)), s)
+        rest //= 1000
+        width += 4
+    s = np.where(frac > 0, np.char.add(np.char.add(s, ","), np.char.zfill(frac.astype(str), 2)), s)
+    s = np.where(neg, np.char.add("-", s), s)
+    return np.char.add(s, " ₸")
+
+def fmt_month(month):
     month_parts = month.split('.')
-    month_str = month
     if len(month_parts)==2 and month_parts[0] in MONTH_NAMES:
-        month_str = f"{MONTH_NAMES.get(month_parts[0])} {month_parts[1]}"
-    b = int(round(benefit))
-    if product=="Карта для путешествий":
-        trips_count = int(signals.get("trips_count",0))
-        trips_sum = fmt_currency(signals.get("trips_sum",0)+signals.get("taxi_sum",0))
-        return f"{name}, в {month_str} у вас {trips_count} поездок/такси на {trips_sum}. С картой для путешествий вернулись бы ≈{fmt_currency(b)}. Открыть"
-    if product=="Премиальная карта":
-        avg = fmt_currency(signals.get("avg_monthly_balance_KZT",0))
-        rest = fmt_currency(signals.get("restaurant_sum",0))
-        return f"{name}, у вас средний остаток {avg} и траты в ресторанах {rest}. Премиальная карта даст до 4% на рестораны и бесплатные снятия. Оформить"
-    if product=="Кредитная карта":
-        cats = signals.get("top3_cats",[])
-        c1 = cats[0] or "разное"
-        c2 = cats[1] or "разное"
-        c3 = cats[2] or "разное"
-        return f"{name}, ваши топ-категории: {c1}, {c2}, {c3}. Кредитная карта даёт до 10% в любимых категориях и рассрочку 3–24 мес. Оформить карту"
-    if product=="Обмен валют":
-        return f"{name}, вы часто проводите валютные операции. В приложении выгодный обмен 24/7 и авто-покупка по целевому курсу. Настроить обмен"
-    if product=="Кредит наличными":
-        return f"{name}, если нужны деньги на большие покупки — есть выгодные предложения по наличному кредиту. Оформить"
-    if product.startswith("Депозит"):
-        return f"{name}, у вас свободные средства {fmt_currency(signals.get('spare_cash',0))}. Депозит даст стабильный доход, можно выбрать срок и валюту. Посмотреть"
-    if product=="Инвестиции":
-        return f"{name}, у вас доступно {fmt_currency(signals.get('spare_cash',0))} для инвестиций. Диверсифицируйте портфель и начните с малого. Настроить"
-    if product=="Золотые слитки":
-        return f"{name}, в запасе {fmt_currency(signals.get('spare_cash',0))}. Покупка золотых слитков — способ диверсификации. Посмотреть"
-    return f"{name}, у нас есть предложение по {product}. Посмотреть"
+        return f"{MONTH_NAMES.get(month_parts[0])} {month_parts[1]}"
+    return month
+
+def map_text_column(values, fn):
+    # format each distinct value once; NA rows go one by one so None and NaN keep their own str()
+    values = np.asarray(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    out = np.array([fn(v) for v in uniques] + [""], dtype=str)[codes]
+    na = np.flatnonzero(codes < 0)
+    if len(na):
+        out = out.astype(object)
+        out[na] = [fn(v) for v in values[na]]
+        out = out.astype(str)
+    return out
+
+def fmt_month_column(values):
+    now = datetime.now().strftime("%m.%Y")
+    return map_text_column(values, lambda m: fmt_month(m or now))
+
+def _num(cols, field):
+    return np.asarray(cols[field], dtype=float)
+
+# field -> (columns it reads, column formatter, single-client formatter)
+TEMPLATE_FIELDS = {
+    "name": (["name"], lambda c: map_text_column(c["name"], str),
+             lambda s, b: f"{s.get('name')}"),
+    "month": (["month_reference"], lambda c: fmt_month_column(c["month_reference"]),
+              lambda s, b: fmt_month(s.get("month_reference") or datetime.now().strftime("%m.%Y"))),
+    "trips_count": (["trips_count"], lambda c: np.trunc(_num(c, "trips_count")).astype(np.int64).astype(str),
+                    lambda s, b: str(int(s.get("trips_count",0)))),
+    "trips_total": (["trips_sum", "taxi_sum"], lambda c: fmt_currency_column(_num(c, "trips_sum") + _num(c, "taxi_sum")),
+                    lambda s, b: fmt_currency(s.get("trips_sum",0)+s.get("taxi_sum",0))),
+    "benefit": (["benefit"], lambda c: fmt_currency_column(np.rint(_num(c, "benefit"))),
+                lambda s, b: fmt_currency(int(round(b)))),
+    "avg_balance": (["avg_monthly_balance_KZT"], lambda c: fmt_currency_column(c["avg_monthly_balance_KZT"]),
+                    lambda s, b: fmt_currency(s.get("avg_monthly_balance_KZT",0))),
+    "restaurant": (["restaurant_sum"], lambda c: fmt_currency_column(c["restaurant_sum"]),
+                   lambda s, b: fmt_currency(s.get("restaurant_sum",0))),
+    "spare_cash": (["spare_cash"], lambda c: fmt_currency_column(c["spare_cash"]),
+                   lambda s, b: fmt_currency(s.get("spare_cash",0))),
+}
+for _k in range(3):
+    TEMPLATE_FIELDS[f"cat{_k+1}"] = ([f"top3_cat_{_k+1}"], lambda c, k=_k: map_text_column(c[f"top3_cat_{k+1}"], lambda v: f"{v or 'разное'}"),
+                                     lambda s, b, k=_k: f"{s.get('top3_cats',[])[k] or 'разное'}")
+PUSH_TEMPLATES = {
+    "Карта для путешествий": "{name}, в {month} у вас {trips_count} поездок/такси на {trips_total}. С картой для путешествий вернулись бы ≈{benefit}. Открыть",
+    "Премиальная карта": "{name}, у вас средний остаток {avg_balance} и траты в ресторанах {restaurant}. Премиальная карта даст до 4% на рестораны и бесплатные снятия. Оформить",
+    "Кредитная карта": "{name}, ваши топ-категории: {cat1}, {cat2}, {cat3}. Кредитная карта даёт до 10% в любимых категориях и рассрочку 3–24 мес. Оформить карту",
+    "Обмен валют": "{name}, вы часто проводите валютные операции. В приложении выгодный обмен 24/7 и авто-покупка по целевому курсу. Настроить обмен",
+    "Кредит наличными": "{name}, если нужны деньги на большие покупки — есть выгодные предложения по наличному кредиту. Оформить",
+    "Депозит": "{name}, у вас свободные средства {spare_cash}. Депозит даст стабильный доход, можно выбрать срок и валюту. Посмотреть",
+    "Инвестиции": "{name}, у вас доступно {spare_cash} для инвестиций. Диверсифицируйте портфель и начните с малого. Настроить",
+    "Золотые слитки": "{name}, в запасе {spare_cash}. Покупка золотых слитков — способ диверсификации. Посмотреть",
+}
+FALLBACK_TEMPLATE = "{name}, у нас есть предложение по {product}. Посмотреть"
+TEMPLATE_COLUMNS = ["name", "month_reference", "trips_count", "trips_sum", "taxi_sum", "avg_monthly_balance_KZT",
+                    "restaurant_sum", "spare_cash", "top3_cat_1", "top3_cat_2", "top3_cat_3", "benefit"]
+_COMPILED = {}
+
+def compile_template(product):
+    if product not in _COMPILED:
+        if product in PUSH_TEMPLATES:
+            text = PUSH_TEMPLATES[product]
+        elif product.startswith("Депозит"):
+            text = PUSH_TEMPLATES["Депозит"]
+        else:
+            text = FALLBACK_TEMPLATE.replace("{product}", product.replace("{", "{{").replace("}", "}}"))
+        _COMPILED[product] = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+    return _COMPILED[product]
+
+def template_columns(signals_list, benefits):
+    cols = {c: [] for c in TEMPLATE_COLUMNS}
+    for s, b in zip(signals_list, benefits):
+        cats = s.get("top3_cats", [])
+        cols["name"].append(s.get("name"))
+        cols["month_reference"].append(s.get("month_reference"))
+        for c in ("trips_count", "trips_sum", "taxi_sum", "avg_monthly_balance_KZT", "restaurant_sum", "spare_cash"):
+            cols[c].append(s.get(c, 0))
+        for k in range(3):
+            cols[f"top3_cat_{k+1}"].append(cats[k])
+        cols["benefit"].append(b)
+    return cols
+
+def render_templates(products, cols):
+    products = np.asarray(products, dtype=object)
+    out = np.empty(len(products), dtype=object)
+    if not len(products):
+        return out
+    cols = {c: np.asarray(v, dtype=object) if isinstance(v, list) else np.asarray(v) for c, v in cols.items()}
+    codes, uniques = pd.factorize(products)
+    for k, product in enumerate(uniques):
+        rows = np.flatnonzero(codes == k) if len(uniques) > 1 else slice(None)
+        text = None
+        for literal, field in compile_template(product):
+            if literal:
+                text = literal if text is None else np.char.add(text, literal)
+            if field is not None:
+                needs, column, _ = TEMPLATE_FIELDS[field]
+                value = column({c: cols[c][rows] for c in needs})
+                text = value if text is None else np.char.add(text, value)
+        out[rows] = text
+    return out
+
+def make_template(product, signals, benefit):
+    return "".join(literal + (TEMPLATE_FIELDS[field][2](signals, benefit) if field is not None else "")
+                   for literal, field in compile_template(product))
 
 def validate_push_text(text):
     if text is None:
@@ -76,68 +177,76 @@ def validate_push_text(text):
         return False
     return True
 
+SYSTEM_PROMPT = "Вы — помощник, который преобразует шаблон в пуш уведомление строго 180–220 символов, по-русски, обращение по имени и 'вы' маленькими буквами, одна мысль, одна CTA (один глагол). Не менять выбранный продукт. Без CAPS. Не более 1 эмодзи."
+_ENGINE = None
+
+def make_paraphrase_engine(cache_path=None, concurrency=AI_CONCURRENCY, rate=AI_RATE):
+    return ParaphraseEngine(OPENROUTER_URL, OPENROUTER_MODEL, OPENROUTER_API_KEY, cache_path=cache_path, concurrency=concurrency, rate=rate,
+                            validate=validate_push_texts)
+
+def default_engine():
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = make_paraphrase_engine()
+    return _ENGINE
+
+def validate_push_texts(texts):
+    texts = pd.Series(texts, dtype=object)
+    ok = texts.notna().to_numpy(copy=True)
+    if not ok.any():
+        return ok
+    s = texts[ok].astype(str)
+    l = s.str.len()
+    ok[ok] = ((l >= 180) & (l <= 220) & (s.str.count("!") <= 1) & ~s.str.contains(":", regex=False)).to_numpy()
+    return ok
+
 def call_ai_paraphrase(system_prompt, user_prompt):
-    if not OPENROUTER_API_KEY or not OPENROUTER_URL or not OPENROUTER_MODEL:
-        return None
-    headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type": "application/json"}
-    body = {"model": OPENROUTER_MODEL, "input": f"{system_prompt}\n\n{user_prompt}"}
-    try:
-        r = requests.post(f"{OPENROUTER_URL}/chat/completions", headers=headers, json=body, timeout=15)
-        if r.status_code==200:
-            j = r.json()
-            if "output" in j and isinstance(j["output"], list) and len(j["output"])>0:
-                return j["output"][0].get("content", "").strip()
-            if "choices" in j and len(j["choices"])>0:
-                return j["choices"][0].get("message",{}).get("content","").strip()
-        return None
-    except Exception:
-        return None
-
-def generate_push_for_client(client_scores, per_client_benefits, signals, use_ai=False):
+    return default_engine().paraphrase(system_prompt, user_prompt)
+
+def paraphrase_pushes(templates, use_ai=False, engine=None):
+    if not use_ai:
+        return list(templates)
+    with stage("ai", rows=len(templates)):
+        ai = (engine or default_engine()).paraphrase_many(SYSTEM_PROMPT, templates)
+        candidates = [ai.get(t) or None for t in templates]
+        return [c if ok else t for t, c, ok in zip(templates, candidates, validate_push_texts(candidates))]
+
+def generate_push_for_client(client_scores, per_client_benefits, signals, use_ai=False, engine=None):
     product = client_scores["chosen"]
     benefit = per_client_benefits[signals["client_code"]][product]
     template = make_template(product, signals, benefit)
-    final = template
-    if use_ai:
-        system = "Вы — помощник, который преобразует шаблон в пуш уведомление строго 180–220 символов, по-русски, обращение по имени и 'вы' маленькими буквами, одна мысль, одна CTA (один глагол). Не менять выбранный продукт. Без CAPS. Не более 1 эмодзи."
-        ai = call_ai_paraphrase(system, template)
-        if ai and validate_push_text(ai):
-            final = ai
-    if not validate_push_text(final):
-        final = template
-    return {"product": product, "push": final}
-
-def generate_pushes_batch(scores_dict, per_client_benefits, profiles_df, use_ai=False):
-    results = {}
+    return {"product": product, "push": paraphrase_pushes([template], use_ai, engine)[0]}
+
+def generate_pushes(scores_dict, per_client_benefits, signals_by_client, use_ai=False, engine=None):
+    cids = list(scores_dict)
+    products = [scores_dict[cid]["chosen"] for cid in cids]
+    cols = template_columns([signals_by_client[cid] for cid in cids], [per_client_benefits[cid][p] for cid, p in zip(cids, products)])
+    pushes = paraphrase_pushes(render_templates(products, cols).tolist(), use_ai, engine)
+    return {cid: {"product": p, "push": push} for cid, p, push in zip(cids, products, pushes)}
+
+def generate_pushes_table(table, use_ai=False, engine=None):
+    products = table.chosen_products()
+    cols = {c: table.column(c) for c in TEMPLATE_COLUMNS if c != "benefit"}
+    cols["benefit"] = table.chosen_benefit()
+    return products, paraphrase_pushes(render_templates(products, cols).tolist(), use_ai, engine)
+
+def generate_pushes_batch(scores_dict, per_client_benefits, profiles_df, use_ai=False, engine=None):
+    profiles_df = profiles_df.drop_duplicates("client_code")
+    names = dict(zip(profiles_df["client_code"].astype(int), profiles_df["name"]))
+    signals_by_client = {}
     for cid, sc in scores_dict.items():
-        debug_p = os.path.join("debug", f"client_{cid}_scores.json")
-        client_profile = None
-        if os.path.exists(debug_p):
-            with open(debug_p, "r", encoding="utf-8") as f:
-                client_profile = json.load(f)
-        name = None
-        try:
-            prof_row = profiles_df.loc[profiles_df["client_code"]==cid].iloc[0].to_dict()
-            name = prof_row.get("name")
-        except Exception:
-            name = f"Клиент {cid}"
-        signals = {"name": name}
-        if client_profile:
-            raw = client_profile.get("raw_signals", {})
-            signals.update({
-                "trips_count": raw.get("trips_count", 0),
-                "trips_sum": raw.get("trips_sum", 0),
-                "taxi_sum": raw.get("taxi_sum", 0),
-                "avg_monthly_balance_KZT": raw.get("avg_monthly_balance_KZT", 0),
-                "restaurant_sum": raw.get("restaurant_sum", 0),
-                "spare_cash": raw.get("spare_cash", 0),
-                "top3_cats": raw.get("top3_cats", []),
-                "month_reference": raw.get("month_reference")
-            })
-        for k in ["trips_count","trips_sum","taxi_sum","avg_monthly_balance_KZT","restaurant_sum","spare_cash","top3_cats","month_reference"]:
-            if k not in signals:
-                signals[k]=0
+        raw = sc.get("raw_signals", {})
+        signals = {"name": names.get(cid, f"Клиент {cid}")}
+        signals.update({
+            "trips_count": raw.get("trips_count", 0),
+            "trips_sum": raw.get("trips_sum", 0),
+            "taxi_sum": raw.get("taxi_sum", 0),
+            "avg_monthly_balance_KZT": raw.get("avg_monthly_balance_KZT", 0),
+            "restaurant_sum": raw.get("restaurant_sum", 0),
+            "spare_cash": raw.get("spare_cash", 0),
+            "top3_cats": raw.get("top3_cats", [None, None, None]),
+            "month_reference": raw.get("month_reference")
+        })
         signals["client_code"]=cid
-        out = generate_push_for_client(sc, per_client_benefits, signals, use_ai=use_ai)
-        results[cid] = out
-    return results
+        signals_by_client[cid] = signals
+    return generate_pushes(scores_dict, per_client_benefits, signals_by_client, use_ai=use_ai, engine=engine)
@@ -0,0 +1,378 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.io import scan_client_files, match_client_files, read_tail_bytes, read_client_rows, _parse_table_dates, write_result_columns, write_missing_report, write_date_format_report, write_fx_report
+from src.pipeline.preprocess import DATE_FORMAT_HITS
+from src.pipeline.fx import FX_STATS
+from src.pipeline.features import signals_from_aggregates, present_client_codes, CASH_OUT_DIRECTIONS, _map_uniques
+from src.pipeline.ir import ClientTable
+from src.pipeline.scorer import score_table
+from src.pipeline.generator import generate_pushes_table
+from src.eval.evaluate import evaluate_columns
+from src.utils.metrics import stage
+
+WINDOW_MONTHS = 3
+PREFIX_BYTES = 4096
+# per (client, day, category) for transactions and per (client, day) for transfers
+TX_BUCKETS = {"client": np.int64, "day": np.int32, "cat": np.int32, "sum": np.float64, "positive_sum": np.float64,
+              "count": np.int64, "first_row": np.int64, "last_ns": np.int64}
+TR_BUCKETS = {"client": np.int64, "day": np.int32, "cash_out_count": np.int64, "cash_out_sum": np.float64,
+              "fx_count": np.int64, "fx_amount": np.float64, "invest_in_count": np.int64}
+# per (client, day, currency) for rows converted from a foreign currency, one set per file kind
+FX_BUCKETS = {"client": np.int64, "day": np.int32, "cur": np.int32, "count": np.int64, "amount": np.float64}
+TX_KEYS = ["client", "day", "cat"]
+TR_KEYS = ["client", "day"]
+FX_KEYS = ["client", "day", "cur"]
+_MIN = {"first_row"}
+_MAX = {"last_ns"}
+
+def empty_buckets(spec):
+    return {c: np.zeros(0, dtype=t) for c, t in spec.items()}
+
+def empty_state():
+    return {"files": {}, "categories": [], "as_of": None, "tx": empty_buckets(TX_BUCKETS), "tr": empty_buckets(TR_BUCKETS),
+            "fx_tx": empty_buckets(FX_BUCKETS), "fx_tr": empty_buckets(FX_BUCKETS), "fx_rates": None, "currencies": [], "chosen": {}}
+
+def load_state(state_dir):
+    meta_path = os.path.join(state_dir, "state.json")
+    if not os.path.exists(meta_path):
+        return empty_state()
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    with np.load(os.path.join(state_dir, "buckets.npz")) as z:
+        tx = {c: z[f"tx_{c}"] for c in TX_BUCKETS}
+        tr = {c: z[f"tr_{c}"] for c in TR_BUCKETS}
+        fx = {k: {c: z[f"{k}_{c}"] for c in FX_BUCKETS} if f"{k}_client" in z.files else empty_buckets(FX_BUCKETS) for k in ("fx_tx", "fx_tr")}
+        chosen = dict(zip(z["chosen_client"].tolist(), z["chosen_product"].tolist()))
+    categories = [np.nan if c is None else c for c in meta["categories"]]
+    return {"files": meta["files"], "categories": categories, "as_of": meta["as_of"], "tx": tx, "tr": tr, **fx,
+            "fx_rates": meta.get("fx_rates"), "currencies": meta.get("currencies", []), "chosen": {cid: meta["products"][j] for cid, j in chosen.items()}}
+
+def save_state(state_dir, state):
+    os.makedirs(state_dir, exist_ok=True)
+    products = sorted(set(state["chosen"].values()))
+    index = {p: j for j, p in enumerate(products)}
+    arrays = {f"tx_{c}": v for c, v in state["tx"].items()}
+    arrays.update({f"tr_{c}": v for c, v in state["tr"].items()})
+    for k in ("fx_tx", "fx_tr"):
+        arrays.update({f"{k}_{c}": v for c, v in state[k].items()})
+    arrays["chosen_client"] = np.fromiter(state["chosen"].keys(), dtype=np.int64, count=len(state["chosen"]))
+    arrays["chosen_product"] = np.fromiter((index[p] for p in state["chosen"].values()), dtype=np.int16, count=len(state["chosen"]))
+    tmp = os.path.join(state_dir, "buckets.tmp.npz")
+    np.savez(tmp, **arrays)
+    os.replace(tmp, os.path.join(state_dir, "buckets.npz"))
+    meta = {"as_of": state["as_of"], "files": state["files"], "products": products, "fx_rates": state["fx_rates"], "currencies": state["currencies"],
+            "categories": [None if pd.isna(c) else c for c in state["categories"]]}
+    tmp = os.path.join(state_dir, "state.tmp.json")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps(meta, ensure_ascii=False))
+    os.replace(tmp, os.path.join(state_dir, "state.json"))
+
+def window_cutoff(as_of, months=WINDOW_MONTHS):
+    # days <= cutoff are outside the window
+    return int((pd.Timestamp(as_of) - pd.DateOffset(months=months)).normalize().value // 86_400_000_000_000)
+
+def _prefix_hash(path, n):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(n)).hexdigest()
+
+def _read_tail(path, entry):
+    # resume after the last consumed byte unless the file was truncated or rewritten
+    size = os.path.getsize(path)
+    if entry and entry["offset"] <= size and _prefix_hash(path, entry["prefix_len"]) == entry["prefix"]:
+        if entry["offset"] == size:
+            return None, None, entry, False
+        offset, rows = entry["offset"], entry["rows"]
+    else:
+        offset, rows = 0, 0
+    header, body, end = read_tail_bytes(path, offset)
+    prefix_len = min(end, PREFIX_BYTES)
+    entry_new = {"offset": end, "rows": rows, "prefix_len": prefix_len, "prefix": _prefix_hash(path, prefix_len)}
+    return header, body, entry_new, entry is not None and offset == 0
+
+def read_new_rows(files, state, workers=None):
+    new = {}
+    reset = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for kind in ("transactions", "transfers"):
+            tails = pool.map(lambda item: (item[0], _read_tail(item[1], state["files"].get(f"{kind}:{item[0]}"))), files[kind].items())
+            groups = {}
+            reset[kind] = []
+            for cid, (header, body, entry, rewritten) in tails:
+                state["files"][f"{kind}:{cid}"] = entry
+                if rewritten:
+                    reset[kind].append(cid)
+                if body:
+                    groups.setdefault(header, {})[cid] = body
+            gone = [k for k in state["files"] if k.startswith(kind + ":") and int(k.split(":")[1]) not in files[kind]]
+            for k in gone:
+                del state["files"][k]
+                reset[kind].append(int(k.split(":")[1]))
+            frames = list(pool.map(lambda g: read_client_rows(g[0], g[1], kind), groups.items()))
+            if not frames:
+                new[kind] = None
+                continue
+            table = _parse_table_dates(pd.concat(frames, ignore_index=True))
+            # row numbers continue per file so first-seen order matches a read of the whole file
+            before = pd.Series({cid: state["files"][f"{kind}:{cid}"]["rows"] for body in groups.values() for cid in body})
+            table["row"] = before.reindex(table["client_code"]).to_numpy(dtype=np.int64) + table.groupby("client_code").cumcount().to_numpy()
+            counts = table["client_code"].value_counts()
+            for cid, n in counts.items():
+                state["files"][f"{kind}:{cid}"]["rows"] += int(n)
+            new[kind] = table
+    return new["transactions"], new["transfers"], reset
+
+def _day(dates):
+    ns = dates.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    valid = ~np.isnat(dates.to_numpy(dtype="datetime64[ns]"))
+    return ns, np.where(valid, ns // 86_400_000_000_000, -1).astype(np.int32), valid
+
+def _convert(table, amount, rates):
+    if rates is None or "currency" not in table.columns:
+        return amount, np.full(len(amount), -1)
+    return rates.convert(amount, table["currency"].to_numpy(dtype=object), table["date"])
+
+def foreign_rows(client, day, amount, cur, valid):
+    keep = valid & (cur >= 0)
+    return {"client": client[keep], "day": day[keep], "cur": cur[keep].astype(np.int32),
+            "count": np.ones(int(keep.sum()), dtype=np.int64), "amount": np.abs(amount[keep])}
+
+def tx_rows(transactions, state, rates=None):
+    ns, day, valid = _day(transactions["date"])
+    labels = state["categories"]
+    codes, uniques = pd.factorize(transactions["category"].to_numpy(dtype=object), use_na_sentinel=False)
+    lookup = {(None if pd.isna(c) else c): j for j, c in enumerate(labels)}
+    mapping = []
+    for u in uniques:
+        k = None if pd.isna(u) else u
+        if k not in lookup:
+            lookup[k] = len(labels)
+            labels.append(u)
+        mapping.append(lookup[k])
+    amount, cur = _convert(transactions, pd.to_numeric(transactions["amount"], errors="coerce").fillna(0).to_numpy(dtype=float), rates)
+    rows = {
+        "client": transactions["client_code"].to_numpy(dtype=np.int64),
+        "day": day,
+        "cat": np.asarray(mapping, dtype=np.int32)[codes] if len(codes) else np.zeros(0, dtype=np.int32),
+        "sum": amount,
+        "positive_sum": np.where(amount > 0, amount, 0.0),
+        "count": np.ones(len(amount), dtype=np.int64),
+        "first_row": transactions["row"].to_numpy(dtype=np.int64),
+        "last_ns": ns,
+    }
+    return {c: v[valid] for c, v in rows.items()}, foreign_rows(rows["client"], day, amount, cur, valid), int((~valid).sum())
+
+def tr_rows(transfers, rates=None):
+    ns, day, valid = _day(transfers["date"])
+    amount, cur = _convert(transfers, pd.to_numeric(transfers["amount"], errors="coerce").fillna(0).to_numpy(dtype=float), rates)
+    amount = np.abs(amount)
+    cash = _map_uniques(transfers["direction"].to_numpy(dtype=object), lambda u: u.astype(str).str.lower().isin(CASH_OUT_DIRECTIONS))
+    ttype = transfers["type"].to_numpy(dtype=object)
+    fx = _map_uniques(ttype, lambda u: u.str.contains("fx", case=False, na=False))
+    rows = {
+        "client": transfers["client_code"].to_numpy(dtype=np.int64),
+        "day": day,
+        "cash_out_count": cash.astype(np.int64),
+        "cash_out_sum": np.where(cash, amount, 0.0),
+        "fx_count": fx.astype(np.int64),
+        "fx_amount": np.where(fx, amount, 0.0),
+        "invest_in_count": _map_uniques(ttype, lambda u: u == "invest_in").astype(np.int64),
+    }
+    return {c: v[valid] for c, v in rows.items()}, foreign_rows(rows["client"], day, amount, cur, valid), int((~valid).sum())
+
+def _take(buckets, mask):
+    return {c: v[mask] for c, v in buckets.items()}
+
+def _concat(parts, spec):
+    return {c: np.concatenate([p[c] for p in parts]).astype(t, copy=False) for c, t in spec.items()}
+
+def _group(rows, keys, spec):
+    # rows are in accumulation order (existing bucket first), so float sums continue from the stored value
+    if not len(rows["client"]):
+        return empty_buckets(spec)
+    uniq, inverse = np.unique(np.column_stack([rows[k] for k in keys]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    out = {k: uniq[:, j].astype(spec[k]) for j, k in enumerate(keys)}
+    for c, t in spec.items():
+        if c in keys:
+            continue
+        if c in _MIN:
+            v = np.full(len(uniq), np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(v, inverse, rows[c])
+        elif c in _MAX:
+            v = np.full(len(uniq), np.iinfo(np.int64).min, dtype=np.int64)
+            np.maximum.at(v, inverse, rows[c])
+        else:
+            v = np.bincount(inverse, weights=rows[c], minlength=len(uniq))
+        out[c] = v.astype(t)
+    return out
+
+def merge_buckets(buckets, rows, keys, spec, reset):
+    if reset:
+        buckets = _take(buckets, ~np.isin(buckets["client"], reset))
+    if rows is None or not len(rows["client"]):
+        return buckets
+    touched_key = buckets["client"] * 100_000 + buckets["day"]
+    touched = np.isin(touched_key, np.unique(rows["client"] * 100_000 + rows["day"]))
+    merged = _group(_concat([_take(buckets, touched), rows], spec), keys, spec)
+    return _concat([_take(buckets, ~touched), merged], spec)
+
+def expire_buckets(buckets, cutoff):
+    keep = buckets["day"] > cutoff
+    return _take(buckets, keep), int((~keep).sum())
+
+def _label_rank(labels):
+    # category codes follow first appearance, so states built in different steps order buckets by label instead
+    order = sorted(range(len(labels)), key=lambda j: (pd.isna(labels[j]), str(labels[j])))
+    rank = np.empty(len(labels), dtype=np.int64)
+    rank[order] = np.arange(len(labels))
+    return rank
+
+def _day_ordered(buckets, index, cat_rank=None):
+    # fixed accumulation order (day, then category label or currency) so a rebuilt state sums to the same bits
+    ci = index.get_indexer(buckets["client"])
+    keep = ci >= 0
+    sort_keys = {"cat": lambda v: cat_rank[v], "cur": lambda v: v, "day": lambda v: v}
+    order = np.lexsort([f(buckets[k][keep]) for k, f in sort_keys.items() if k in buckets])
+    b = {c: v[keep][order] for c, v in buckets.items()}
+    return ci[keep][order], b
+
+def state_aggregates(state, index):
+    # same shape as features.aggregate_tables; sums run over day buckets in day order
+    n = len(index)
+    labels = list(state["categories"])
+    ncat = len(labels)
+    ci, tx = _day_ordered(state["tx"], index, _label_rank(labels))
+    key = ci * ncat + tx["cat"]
+    first = np.full(n * ncat, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, key, tx["first_row"])
+    first[first == np.iinfo(np.int64).max] = -1
+    last = np.full(n, np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(last, ci, tx["last_ns"])
+    has = np.flatnonzero(last > np.iinfo(np.int64).min)
+    ti, tr = _day_ordered(state["tr"], index)
+    agg = {
+        "cat_labels": labels,
+        "spend": np.bincount(key, weights=tx["sum"], minlength=n * ncat).reshape(n, ncat),
+        "count": np.bincount(key, weights=tx["count"], minlength=n * ncat).astype(np.int64).reshape(n, ncat),
+        "first_seen": first.reshape(n, ncat),
+        "last_date": pd.Series(last[has].astype("datetime64[ns]"), index=has),
+        "positive_sum": np.bincount(ci, weights=tx["positive_sum"], minlength=n),
+    }
+    for c in ("cash_out_count", "fx_count", "invest_in_count"):
+        agg[c] = np.bincount(ti, weights=tr[c], minlength=n).astype(np.int64)
+    for c in ("cash_out_sum", "fx_amount"):
+        agg[c] = np.bincount(ti, weights=tr[c], minlength=n)
+    n_cur = len(state["currencies"])
+    count = np.zeros((n, n_cur), dtype=np.int64)
+    by_currency = np.zeros((n, n_cur))
+    total = np.zeros(n)
+    for k in ("fx_tx", "fx_tr"):
+        fi, fx = _day_ordered(state[k], index)
+        key = fi * n_cur + fx["cur"]
+        count += np.bincount(key, weights=fx["count"], minlength=n * n_cur).astype(np.int64).reshape(n, n_cur)
+        by_currency += np.bincount(key, weights=fx["amount"], minlength=n * n_cur).reshape(n, n_cur)
+        total = total + np.bincount(fi, weights=fx["amount"], minlength=n)
+    agg.update({"currencies": list(state["currencies"]), "foreign_count": count, "foreign_by_currency": by_currency, "foreign_amount": total})
+    return agg
+
+def run_incremental(data_dir, profiles, state_dir, output, debug_dir, as_of=None, window_months=WINDOW_MONTHS,
+                    use_ai=False, engine=None, debug_sink=None, ranks=None, fit_ranks=True, rates=None, caps=None, allocation="auto",
+                    archive=None, run=None, suppress_days=None):
+    os.makedirs(debug_dir, exist_ok=True)
+    timings = {}
+    with stage("load") as rec:
+        state = load_state(state_dir)
+        fx_signature = rates.signature() if rates is not None else None
+        if state["fx_rates"] != fx_signature:
+            # stored amounts were converted with another rate table: rebuild the buckets from the full files
+            state = {**empty_state(), "chosen": state["chosen"], "fx_rates": fx_signature,
+                     "currencies": list(rates.currencies) if rates is not None else []}
+        files, missing = match_client_files(data_dir, profiles, scan_client_files(data_dir))
+        write_missing_report(missing, debug_dir)
+    timings["load_state"] = rec["seconds"]
+
+    with stage("load") as rec:
+        transactions, transfers, reset = read_new_rows(files, state)
+        write_date_format_report(DATE_FORMAT_HITS, debug_dir)
+        undated = 0
+        tx_new = tr_new = tx_fx_new = tr_fx_new = None
+        if transactions is not None:
+            tx_new, tx_fx_new, n = tx_rows(transactions, state, rates)
+            undated += n
+        if transfers is not None:
+            tr_new, tr_fx_new, n = tr_rows(transfers, rates)
+            undated += n
+        if rates is not None:
+            write_fx_report(FX_STATS, debug_dir)
+        new_rows = rec["rows"] = sum(len(t) for t in (transactions, transfers) if t is not None)
+    timings["read_new_rows"] = rec["seconds"]
+
+    with stage("preprocess", rows=new_rows) as rec:
+        state["tx"] = merge_buckets(state["tx"], tx_new, TX_KEYS, TX_BUCKETS, reset["transactions"])
+        state["tr"] = merge_buckets(state["tr"], tr_new, TR_KEYS, TR_BUCKETS, reset["transfers"])
+        state["fx_tx"] = merge_buckets(state["fx_tx"], tx_fx_new, FX_KEYS, FX_BUCKETS, reset["transactions"])
+        state["fx_tr"] = merge_buckets(state["fx_tr"], tr_fx_new, FX_KEYS, FX_BUCKETS, reset["transfers"])
+        if as_of is None:
+            last = [b["day"].max() for b in (state["tx"], state["tr"]) if len(b["day"])]
+            as_of = str(np.datetime64(int(max(last)), "D")) if last else state["as_of"]
+        state["as_of"] = as_of
+        cutoff = window_cutoff(as_of, window_months) if as_of else -1
+        state["tx"], expired_tx = expire_buckets(state["tx"], cutoff)
+        state["tr"], expired_tr = expire_buckets(state["tr"], cutoff)
+        state["fx_tx"], expired_tx_fx = expire_buckets(state["fx_tx"], cutoff)
+        state["fx_tr"], expired_tr_fx = expire_buckets(state["fx_tr"], cutoff)
+    timings["apply"] = rec["seconds"]
+
+    index = pd.Index(present_client_codes(profiles, missing), name="client_code")
+    with stage("features", clients=len(index)) as rec:
+        table = ClientTable.from_frames(*signals_from_aggregates(profiles, index, state_aggregates(state, index), window_months))
+    timings["score"] = rec["seconds"]
+    with stage("scoring", clients=len(table)) as rec:
+        table = score_table(table, debug_sink, ranks=ranks, fit_ranks=fit_ranks, caps=caps, allocation=allocation)
+    timings["score"] += rec["seconds"]
+
+    previous = state["chosen"]
+    chosen = dict(zip(table.client_code.tolist(), table.chosen_products()))
+    changed = table.take([i for i, (cid, p) in enumerate(chosen.items()) if previous.get(cid) != p])
+    suppressed = 0
+    if archive is not None:
+        from src.utils.archive import suppress_repeats
+        changed, suppressed = suppress_repeats(changed, archive, suppress_days)
+    with stage("generation", clients=len(changed)) as rec:
+        products, pushes = generate_pushes_table(changed, use_ai=use_ai, engine=engine)
+    timings["push_and_save"] = rec["seconds"]
+    with stage("write", clients=len(changed)) as rec:
+        write_result_columns(changed.client_code, products, pushes, output)
+        if archive is not None:
+            archive.append(run, changed.client_code, products, pushes, changed.chosen_score())
+        state["chosen"] = chosen
+        save_state(state_dir, state)
+    timings["push_and_save"] += rec["seconds"]
+    with stage("evaluation", clients=len(changed)) as rec:
+        evaluate_columns(changed.client_code.tolist(), products, pushes, changed.column("name").tolist(), debug_dir)
+    timings["push_and_save"] += rec["seconds"]
+
+    report = {
+        "as_of": as_of,
+        "window_months": window_months,
+        "new_transactions": 0 if tx_new is None else len(tx_new["client"]),
+        "new_transfers": 0 if tr_new is None else len(tr_new["client"]),
+        "undated_rows_skipped": undated,
+        "rewritten_files": sum(len(v) for v in reset.values()),
+        "expired_buckets": expired_tx + expired_tr + expired_tx_fx + expired_tr_fx,
+        "transaction_buckets": len(state["tx"]["client"]),
+        "transfer_buckets": len(state["tr"]["client"]),
+        "foreign_currency_buckets": len(state["fx_tx"]["client"]) + len(state["fx_tr"]["client"]),
+        "state_bytes": os.path.getsize(os.path.join(state_dir, "buckets.npz")),
+        "clients_scored": len(table),
+        "clients_changed": len(changed) + suppressed,
+        "suppressed_repeats": suppressed,
+        "seconds": timings,
+    }
+    with open(os.path.join(debug_dir, "incremental_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report, table
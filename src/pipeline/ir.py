@@ -0,0 +1,195 @@
+import sys
+import numpy as np
+import pandas as pd
+from src.pipeline.features import SIGNAL_COLUMNS, signal_dict
+from src.pipeline.scorer import PRODUCTS
+
+TEXT_COLUMNS = ["status", "name", "month_reference", "top3_cat_1", "top3_cat_2", "top3_cat_3", "top_foreign_currency"]
+INT_COLUMNS = ["trips_count", "cash_out_count", "fx_count", "invest_in_count", "foreign_count", "foreign_currencies"]
+FLOAT_COLUMNS = [c for c in SIGNAL_COLUMNS if c not in TEXT_COLUMNS and c not in INT_COLUMNS]
+# value restored for missing entries; profile fields come from pandas (NaN), derived ones are None
+TEXT_NA = {"status": np.nan, "name": np.nan}
+SCORE_ARRAYS = ["raw_signal", "norm_signal", "benefit", "norm_benefit", "score"]
+SPEND_DTYPE = np.float32
+
+def encode_objects(values):
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    return codes.astype(np.int32), list(uniques)
+
+def decode_objects(codes, uniques, na=None):
+    table = np.array(list(uniques) + [na], dtype=object)
+    return table[np.where(codes < 0, len(uniques), codes)]
+
+def _seen_order(first_seen):
+    # position of each category in the client's first-seen order, -1 where the client has none
+    first_seen = np.asarray(first_seen, dtype=np.int64)
+    seen = first_seen >= 0
+    order = np.argsort(np.where(seen, first_seen, np.iinfo(first_seen.dtype).max), axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(order.shape[1]), axis=1)
+    return np.where(seen, rank, -1).astype(np.int8 if order.shape[1] < 128 else np.int16)
+
+class ClientTable:
+    """Signals, per-category spend and product scores of a population as arrays, one row per client."""
+
+    __slots__ = ("client_code", "numeric", "codes", "labels", "categories", "spend", "seen", "scores", "top4", "allocated", "_positions")
+
+    def __init__(self, client_code, numeric, codes, labels, categories, spend, seen):
+        self.client_code = np.asarray(client_code, dtype=np.int64)
+        self.numeric = numeric
+        self.codes = codes
+        self.labels = labels
+        self.categories = list(categories)
+        self.spend = spend
+        self.seen = seen
+        self.scores = {}
+        self.top4 = None
+        # product per client under campaign caps (-1: none left), see allocation.py
+        self.allocated = None
+        self._positions = None
+
+    @classmethod
+    def from_frames(cls, signals, spend, first_seen):
+        numeric = {c: signals[c].to_numpy(dtype=np.int32 if c in INT_COLUMNS else float) for c in INT_COLUMNS + FLOAT_COLUMNS}
+        codes, labels = {}, {}
+        for c in TEXT_COLUMNS:
+            codes[c], labels[c] = encode_objects(signals[c].to_numpy(dtype=object))
+        return cls(signals.index.to_numpy(), numeric, codes, labels, spend.columns,
+                   spend.to_numpy(dtype=SPEND_DTYPE), _seen_order(first_seen.to_numpy()))
+
+    @classmethod
+    def from_signal_dicts(cls, all_signals):
+        # per-client dicts of the legacy path; category order and top3_spend follow score_inputs_from_dicts
+        rows = list(all_signals.values())
+        categories = list(dict.fromkeys(k for s in rows for k in s.get("spend_by_category", {})))
+        col = {k: j for j, k in enumerate(categories)}
+        spend = np.zeros((len(rows), len(categories)), dtype=SPEND_DTYPE)
+        first_seen = np.full((len(rows), len(categories)), -1, dtype=np.int64)
+        top3_spend = np.zeros(len(rows))
+        for i, s in enumerate(rows):
+            by_cat = s.get("spend_by_category", {})
+            for k, (cat, amount) in enumerate(by_cat.items()):
+                spend[i, col[cat]] = amount
+                first_seen[i, col[cat]] = k
+            top3_spend[i] = sum([by_cat.get(k, 0) for k in s.get("top3_cats", [])])
+        numeric = {}
+        for c in INT_COLUMNS + FLOAT_COLUMNS:
+            if c == "top3_spend":
+                numeric[c] = top3_spend
+            elif c == "cash_out_count":
+                # the legacy path leaves an int 0 in cash_out_sum when a client has no cash-out rows
+                numeric[c] = np.array([isinstance(s.get("cash_out_sum", 0), float) for s in rows], dtype=np.int32)
+            else:
+                numeric[c] = np.array([s.get(c, 0) for s in rows], dtype=np.int32 if c in INT_COLUMNS else float)
+        codes, labels = {}, {}
+        for c in TEXT_COLUMNS:
+            if c.startswith("top3_cat_"):
+                values = [(s.get("top3_cats") or [None] * 3)[int(c[-1]) - 1] for s in rows]
+            else:
+                values = [s.get(c) for s in rows]
+            codes[c], labels[c] = encode_objects(values)
+        return cls(list(all_signals), numeric, codes, labels, categories, spend, _seen_order(first_seen))
+
+    def __len__(self):
+        return len(self.client_code)
+
+    def position(self, cid):
+        if self._positions is None:
+            self._positions = {c: i for i, c in enumerate(self.client_code.tolist())}
+        return self._positions[cid]
+
+    def column(self, name):
+        if name in self.codes:
+            return decode_objects(self.codes[name], self.labels[name], TEXT_NA.get(name))
+        return self.numeric[name]
+
+    def frame(self, columns):
+        return pd.DataFrame({c: self.column(c) for c in columns}, index=self.client_code)
+
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        out = ClientTable(self.client_code[rows], {c: v[rows] for c, v in self.numeric.items()}, {c: v[rows] for c, v in self.codes.items()},
+                          self.labels, self.categories, self.spend[rows], self.seen[rows])
+        out.scores = {k: v[rows] for k, v in self.scores.items()}
+        out.top4 = None if self.top4 is None else self.top4[rows]
+        out.allocated = None if self.allocated is None else self.allocated[rows]
+        return out
+
+    def attach_scores(self, matrix):
+        for k in SCORE_ARRAYS:
+            self.scores[k] = matrix[k]
+        self.top4 = matrix["top4"].astype(np.int8)
+        return self
+
+    @property
+    def chosen(self):
+        return self.top4[:, 0] if self.allocated is None else self.allocated
+
+    def chosen_products(self):
+        return [PRODUCTS[j] for j in self.chosen.tolist()]
+
+    def chosen_benefit(self):
+        return self.scores["benefit"][np.arange(len(self)), self.chosen]
+
+    def chosen_score(self):
+        return self.scores["score"][np.arange(len(self)), self.chosen]
+
+    def row(self, i):
+        return ClientRow(self, i)
+
+    def rows(self):
+        return (ClientRow(self, i) for i in range(len(self)))
+
+    def nbytes(self):
+        arrays = [self.client_code, self.spend, self.seen, *self.numeric.values(), *self.codes.values(), *self.scores.values()]
+        if self.top4 is not None:
+            arrays.append(self.top4)
+        labels = sum(sys.getsizeof(v) for values in self.labels.values() for v in values)
+        return sum(a.nbytes for a in arrays) + labels
+
+class ClientRow:
+    """Per-client view of a ClientTable for code that still works one client at a time."""
+
+    __slots__ = ("table", "i")
+
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+    @property
+    def client_code(self):
+        return int(self.table.client_code[self.i])
+
+    def __getitem__(self, name):
+        t = self.table
+        if name in t.codes:
+            code = t.codes[name][self.i]
+            return t.labels[name][code] if code >= 0 else TEXT_NA.get(name)
+        return t.numeric[name][self.i].item()
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def spend_by_category(self):
+        seen = self.table.seen[self.i]
+        order = np.argsort(np.where(seen >= 0, seen, np.iinfo(seen.dtype).max), kind="stable")[:int((seen >= 0).sum())]
+        spend = self.table.spend[self.i]
+        return {self.table.categories[j]: round(float(spend[j]), 2) for j in order.tolist()}
+
+    def signals(self):
+        return signal_dict(self.client_code, self, self.spend_by_category())
+
+    def product_scores(self):
+        s = {k: v[self.i].tolist() for k, v in self.table.scores.items()}
+        return {p: {k: s[k][j] for k in SCORE_ARRAYS} for j, p in enumerate(PRODUCTS)}
+
+    def top4(self):
+        return [PRODUCTS[j] for j in self.table.top4[self.i].tolist()]
+
+    def score_record(self):
+        chosen = int(self.table.chosen[self.i])
+        return {"client_code": self.client_code, "raw_signals": self.signals(), "product_scores": self.product_scores(),
+                "top4": self.top4(), "chosen": PRODUCTS[chosen] if chosen >= 0 else None}
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+import pandas as pd
+from collections import Counter
+from multiprocessing import get_context, shared_memory
+from src.utils.io import load_profiles, scan_client_files, load_client_tables
+from src.pipeline.preprocess import DATE_FORMAT_HITS
+from src.pipeline.features import compute_signals_frame, SIGNAL_COLUMNS
+from src.pipeline.fx import load_fx_rates, FX_STATS
+from src.pipeline.scorer import PRODUCTS
+from src.pipeline.ir import encode_objects, decode_objects, TEXT_COLUMNS, TEXT_NA
+from src.pipeline.generator import render_templates, paraphrase_pushes
+
+NUMERIC_COLUMNS = [c for c in SIGNAL_COLUMNS if c not in TEXT_COLUMNS]
+TEMPLATE_NUMERIC = ["trips_count", "trips_sum", "taxi_sum", "avg_monthly_balance_KZT", "restaurant_sum", "spare_cash"]
+TEMPLATE_OBJECTS = ["name", "month_reference", "top3_cat_1", "top3_cat_2", "top3_cat_3"]
+
+def make_pool(workers):
+    if os.name == "posix":
+        # one tracker shared by all workers, otherwise each worker's tracker unlinks segments it saw on exit
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+    return get_context().Pool(processes=workers)
+
+def share_arrays(arrays):
+    layout = []
+    offset = 0
+    for name, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        layout.append((name, a.dtype.str, a.shape, offset))
+        offset += (a.nbytes + 7) // 8 * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 8))
+    for (name, dtype, shape, off), a in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=off)[...] = a
+    return shm, layout
+
+def attach_arrays(shm_name, layout):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, {name: np.ndarray(shape, dtype, buffer=shm.buf, offset=off) for name, dtype, shape, off in layout}
+
+def read_shared(shm_name, layout, unlink=False):
+    shm, arrays = attach_arrays(shm_name, layout)
+    arrays = {k: v.copy() for k, v in arrays.items()}
+    shm.close()
+    if unlink:
+        shm.unlink()
+    return arrays
+
+def shard_bounds(n, workers):
+    edges = np.linspace(0, n, max(1, min(workers, n)) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+def _signals_worker(task):
+    data_dir, profiles_path, start, stop, files, fx_rates, fx_cache = task
+    DATE_FORMAT_HITS.clear()
+    FX_STATS.clear()
+    profiles = load_profiles(profiles_path).iloc[start:stop]
+    tx, tr, missing = load_client_tables(data_dir, profiles, workers=1, found=files)
+    # with a cache dir every worker maps the same compiled rate arrays instead of parsing the table again
+    rates = load_fx_rates(fx_rates, fx_cache) if fx_rates else None
+    signals, spend, first_seen = compute_signals_frame(tx, tr, profiles, missing, rates)
+    arrays = {c: signals[c].to_numpy() for c in NUMERIC_COLUMNS}
+    arrays["client_code"] = signals.index.to_numpy()
+    arrays["spend"] = spend.to_numpy()
+    arrays["first_seen"] = first_seen.to_numpy()
+    uniques = {}
+    for c in TEXT_COLUMNS:
+        arrays[c], uniques[c] = encode_objects(signals[c].to_numpy(dtype=object))
+    shm, layout = share_arrays(arrays)
+    shm.close()
+    return shm.name, layout, uniques, list(spend.columns), missing, dict(DATE_FORMAT_HITS), dict(FX_STATS)
+
+def compute_signals_parallel(data_dir, profiles_path, workers, fx_rates=None, fx_cache=None):
+    profiles = load_profiles(profiles_path)
+    found = scan_client_files(data_dir)
+    tasks = []
+    for start, stop in shard_bounds(len(profiles), workers):
+        codes = set(profiles["client_code"].iloc[start:stop].astype(int))
+        files = {kind: {cid: p for cid, p in paths.items() if cid in codes} for kind, paths in found.items()}
+        tasks.append((data_dir, profiles_path, start, stop, files, fx_rates, fx_cache))
+    with make_pool(workers) as pool:
+        parts = []
+        for shm_name, layout, *rest in pool.map(_signals_worker, tasks):
+            parts.append((read_shared(shm_name, layout, unlink=True), *rest))
+    frames, spends, seens = [], [], []
+    missing = {}
+    for arrays, uniques, labels, part_missing, hits, fx_stats in parts:
+        index = pd.Index(arrays["client_code"], name="client_code")
+        frame = pd.DataFrame({c: arrays[c] for c in NUMERIC_COLUMNS}, index=index)
+        for c in TEXT_COLUMNS:
+            frame[c] = pd.Series(decode_objects(arrays[c], uniques[c], TEXT_NA.get(c)), index=index, dtype=object)
+        frames.append(frame[SIGNAL_COLUMNS])
+        spends.append(pd.DataFrame(arrays["spend"], index=index, columns=labels))
+        seens.append(pd.DataFrame(arrays["first_seen"], index=index, columns=labels))
+        missing.update(part_missing)
+        DATE_FORMAT_HITS.update(Counter(hits))
+        FX_STATS.update(Counter(fx_stats))
+    signals = pd.concat(frames)
+    spend = pd.concat(spends).fillna(0.0)
+    first_seen = pd.concat(seens).fillna(-1).astype(np.int64)
+    return signals, spend, first_seen, missing
+
+def _generate_worker(task):
+    shm_name, layout, labels, start, stop = task
+    shm, arrays = attach_arrays(shm_name, layout)
+    try:
+        cols = {c: arrays[c][start:stop] for c in TEMPLATE_NUMERIC + ["benefit"]}
+        cols.update({c: decode_objects(arrays[c][start:stop], labels[c], TEXT_NA.get(c)) for c in TEMPLATE_OBJECTS})
+        products = [PRODUCTS[j] for j in arrays["product"][start:stop].tolist()]
+        return render_templates(products, cols).tolist()
+    finally:
+        shm.close()
+
+def generate_pushes_parallel(table, workers, use_ai=False, engine=None):
+    # the table's text columns are already integer codes, so they go into shared memory as they are
+    arrays = {c: table.numeric[c] for c in TEMPLATE_NUMERIC}
+    arrays.update({c: table.codes[c] for c in TEMPLATE_OBJECTS})
+    arrays["product"] = table.chosen.astype(np.int16)
+    arrays["benefit"] = table.chosen_benefit()
+    shm, layout = share_arrays(arrays)
+    try:
+        tasks = [(shm.name, layout, {c: table.labels[c] for c in TEMPLATE_OBJECTS}, start, stop) for start, stop in shard_bounds(len(table), workers)]
+        with make_pool(workers) as pool:
+            parts = pool.map(_generate_worker, tasks)
+    finally:
+        shm.close()
+        shm.unlink()
+    # workers only fill templates; paraphrasing is network-bound and shares one session and cache here
+    return table.chosen_products(), paraphrase_pushes([t for part in parts for t in part], use_ai, engine)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+AI_CONCURRENCY = 8
+AI_RATE = 5.0
+AI_TIMEOUT = 15
+AI_RETRIES = 3
+AI_BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def cache_key(model, system_prompt, template):
+    return hashlib.sha256(json.dumps([model, system_prompt, template], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def parse_completion(j):
+    if "output" in j and isinstance(j["output"], list) and len(j["output"])>0:
+        return j["output"][0].get("content", "").strip()
+    if "choices" in j and len(j["choices"])>0:
+        return j["choices"][0].get("message",{}).get("content","").strip()
+    return None
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class ParaphraseCache:
+    """Content-addressed paraphrase cache, persisted as an append-only JSONL file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._data = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._data[row["key"]] = row["text"]
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def put(self, key, text):
+        with self._lock:
+            if key in self._data:
+                return
+            self._data[key] = text
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "text": text}, ensure_ascii=False) + "\n")
+
+class ParaphraseEngine:
+    """Sends paraphrase requests over one keep-alive session from a bounded thread pool."""
+
+    def __init__(self, url, model, api_key, cache_path=None, concurrency=AI_CONCURRENCY, rate=AI_RATE,
+                 timeout=AI_TIMEOUT, retries=AI_RETRIES, backoff=AI_BACKOFF, validate=None):
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # validate(texts) -> bool mask; replies it rejects are not cached, so a later run asks again
+        self.validate = validate
+        self.cache = ParaphraseCache(cache_path)
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        self.latencies = []
+        self.counts = {"cache_hits": 0, "cache_misses": 0, "requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.url and self.model and self.api_key)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def _post(self, system_prompt, template):
+        body = {"model": self.model, "input": f"{system_prompt}\n\n{template}"}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count("retries")
+            self.bucket.acquire()
+            t = time.perf_counter()
+            delay = None
+            try:
+                r = self.session.post(f"{self.url}/chat/completions", json=body, timeout=self.timeout)
+            except requests.RequestException:
+                r = None
+            with self._lock:
+                self.counts["requests"] += 1
+                self.latencies.append(time.perf_counter() - t)
+            if r is not None and r.status_code == 200:
+                try:
+                    return parse_completion(r.json())
+                except (ValueError, TypeError, AttributeError, KeyError, IndexError):
+                    # an unexpected body shape is a failed paraphrase, the template is used instead
+                    return None
+            if r is not None and r.status_code not in RETRY_STATUSES:
+                return None
+            if r is not None and r.headers.get("Retry-After", "").isdigit():
+                # capped at the longest backoff, one huge Retry-After must not park a worker
+                delay = min(float(r.headers["Retry-After"]), self.backoff * 2 ** self.retries)
+            if attempt < self.retries:
+                time.sleep(delay if delay is not None else self.backoff * 2 ** attempt * (1 + random.random()))
+        return None
+
+    def _fetch(self, system_prompt, template, key):
+        text = self._post(system_prompt, template)
+        if not text:
+            self._count("failures")
+        elif self.validate is not None and not self.validate([text])[0]:
+            self._count("rejected")
+        else:
+            self.cache.put(key, text)
+        return text
+
+    def paraphrase(self, system_prompt, template):
+        return self.paraphrase_many(system_prompt, [template]).get(template)
+
+    def paraphrase_many(self, system_prompt, templates):
+        if not self.enabled:
+            return {}
+        out = {}
+        todo = {}
+        for t in dict.fromkeys(templates):
+            key = cache_key(self.model, system_prompt, t)
+            hit = self.cache.get(key)
+            if hit is not None:
+                out[t] = hit
+            else:
+                todo[t] = key
+        self._count("cache_hits", len(templates) - len(todo))
+        self._count("cache_misses", len(todo))
+        if len(todo) == 1:
+            (t, key), = todo.items()
+            out[t] = self._fetch(system_prompt, t, key)
+        elif todo:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(todo))) as ex:
+                futures = {t: ex.submit(self._fetch, system_prompt, t, key) for t, key in todo.items()}
+                for t, fut in futures.items():
+                    out[t] = fut.result()
+        return out
+
+    def stats(self):
+        lat = np.array(self.latencies) * 1000
+        lookups = self.counts["cache_hits"] + self.counts["cache_misses"]
+        return {
+            **self.counts,
+            "cache_size": len(self.cache),
+            "cache_hit_rate": self.counts["cache_hits"] / lookups if lookups else 0.0,
+            "latency_p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+            "latency_p99_ms": float(np.percentile(lat, 99)) if len(lat) else None,
+        }
+
+    def close(self):
+        self.session.close()
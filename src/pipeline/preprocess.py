@@ -1,4 +1,21 @@
+import threading
+import numpy as np
 import pandas as pd
+from collections import Counter
+from src.pipeline.fx import convert_table
+
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y",
+    "%d/%m/%Y",
+    "%Y/%m/%d",
+]
+DATE_SNIFF_SAMPLE = 1000
+DATE_FORMAT_HITS = Counter()
+_hits_lock = threading.Lock()
 
 def try_parsers(s):
     if pd.isna(s):
@@ -40,10 +57,67 @@ def try_parsers(s):
         pass
     return pd.NaT
 
-def parse_date_column(series):
-    return series.apply(try_parsers)
+def _count_hit(fmt, n):
+    with _hits_lock:
+        DATE_FORMAT_HITS[fmt] += n
+
+def sniff_date_formats(values, sample_size=DATE_SNIFF_SAMPLE):
+    sample = pd.Series(values[:sample_size])
+    hits = {}
+    for fmt in DATE_FORMATS:
+        n = int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum())
+        if n:
+            hits[fmt] = n
+        if n == len(sample):
+            break
+    return sorted(hits, key=lambda f: -hits[f])
+
+def parse_date_column(series, formats=None):
+    if series.empty:
+        return series.apply(try_parsers)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # already parsed, e.g. a frame from the client cache; try_parsers would return every value as it is
+        return series
+    null = series.isna().to_numpy()
+    if pd.api.types.is_string_dtype(series.dtype) and series.dtype != object:
+        is_str = ~null
+    else:
+        is_str = series.map(lambda x: isinstance(x, str)).to_numpy(dtype=bool)
+    todo = is_str.copy()
+    if not todo.any():
+        return series.apply(try_parsers)
+    values = series.to_numpy(dtype=object)
+    parsed = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]", name=series.name)
+    if formats is None:
+        formats = sniff_date_formats(values[todo])
+    for fmt in formats:
+        idx = np.flatnonzero(todo)
+        if idx.size == 0:
+            break
+        res = pd.to_datetime(pd.Series(values[idx]), format=fmt, errors="coerce")
+        ok = res.notna().to_numpy()
+        if ok.any():
+            if parsed.dtype != res.dtype:
+                parsed = parsed.astype(res.dtype)
+            parsed.iloc[idx[ok]] = res.to_numpy()[ok]
+            todo[idx[ok]] = False
+            _count_hit(fmt, int(ok.sum()))
+    rest = todo | ~(is_str | null)
+    if not rest.any() and not null.all():
+        return parsed
+    _count_hit("fallback", int(rest.sum()))
+    out = parsed.to_numpy(dtype=object, copy=True)
+    out[rest] = [try_parsers(v) for v in values[rest]]
+    return pd.Series(list(out), index=series.index, name=series.name)
+
+def prepare_client_table(table, kind):
+    table = table.copy()
+    table["date"] = parse_date_column(table["date"])
+    if kind == "transactions" or "amount" in table.columns:
+        table["amount"] = pd.to_numeric(table["amount"], errors="coerce").fillna(0)
+    return table
 
-def build_clients_agg(clients_raw, profiles):
+def build_clients_agg(clients_raw, profiles, rates=None):
     all_clients = {}
     for _, row in profiles.iterrows():
         cid = int(row["client_code"])
@@ -52,14 +126,9 @@ def build_clients_agg(clients_raw, profiles):
         tr = clients_raw[cid].get("transactions")
         transfers = clients_raw[cid].get("transfers")
         if tr is not None and "date" in tr.columns:
-            tr = tr.copy()
-            tr["date"] = parse_date_column(tr["date"])
-            tr["amount"] = pd.to_numeric(tr["amount"], errors="coerce").fillna(0)
+            tr = convert_table(prepare_client_table(tr, "transactions"), rates)
         if transfers is not None and "date" in transfers.columns:
-            transfers = transfers.copy()
-            transfers["date"] = parse_date_column(transfers["date"])
-            if "amount" in transfers.columns:
-                transfers["amount"] = pd.to_numeric(transfers["amount"], errors="coerce").fillna(0)
+            transfers = convert_table(prepare_client_table(transfers, "transfers"), rates)
         agg = {}
         agg["transactions"] = tr
         agg["transfers"] = transfers
@@ -0,0 +1,189 @@
+import json
+import numpy as np
+
+RANK_MODES = ["exact", "approx"]
+SKETCH_K = 1000
+# the five deposit/investment/gold products all rank spare_cash, so only 6 distinct columns are ranked
+RANK_COLUMNS = [0, 1, 2, 3, 4, 5, 5, 5, 5, 5]
+N_RANK_COLUMNS = 6
+
+def rank_inputs(raw):
+    raw = np.asarray(raw, dtype=float)[:, :N_RANK_COLUMNS]
+    # NaN ranks above every number, as before
+    return np.where(np.isnan(raw), np.inf, raw)
+
+def _below_to_norm(below, n):
+    if n <= 1:
+        return np.ones(below.shape)
+    return np.clip(below / (n - 1), 0.0, 1.0)
+
+class ExactRanks:
+    """Percentile of each value among the fitted population: share of values strictly below it, so ties share a rank."""
+
+    mode = "exact"
+
+    def __init__(self, n_cols=N_RANK_COLUMNS):
+        self.n_cols = n_cols
+        self.n = 0
+        self._parts = []
+        self._sorted = np.zeros((0, n_cols))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).reshape(-1, self.n_cols)
+        if len(values):
+            self._parts.append(values)
+            self.n += len(values)
+        return self
+
+    def merge(self, other):
+        self._parts += [other.sorted_values()]
+        self.n += other.n
+        return self
+
+    def sorted_values(self):
+        if self._parts:
+            self._sorted = np.sort(np.concatenate([self._sorted] + self._parts), axis=0)
+            self._parts = []
+        return self._sorted
+
+    def rank_below(self, values):
+        values = np.asarray(values, dtype=float)
+        vals = self.sorted_values()
+        out = np.zeros((len(values), self.n_cols))
+        for j in range(self.n_cols):
+            # sorted needles keep the binary searches cache friendly
+            order = np.argsort(values[:, j])
+            out[order, j] = np.searchsorted(vals[:, j], values[order, j], side="left")
+        return out
+
+    def normalize(self, values):
+        return _below_to_norm(self.rank_below(values), self.n)
+
+    def fit_normalize(self, values):
+        # update + normalize of the same values from one argsort: each value's rank is where its run of equals starts
+        values = np.asarray(values, dtype=float).reshape(-1, self.n_cols)
+        if self.n or self._parts:
+            return self.update(values).normalize(values)
+        n = len(values)
+        order = np.argsort(values, axis=0)
+        ordered = np.take_along_axis(values, order, axis=0)
+        starts = np.ones((n, self.n_cols), dtype=bool)
+        starts[1:] = ordered[1:] != ordered[:-1]
+        below = np.maximum.accumulate(np.where(starts, np.arange(n)[:, None], 0), axis=0)
+        out = np.empty((n, self.n_cols))
+        np.put_along_axis(out, order, below, axis=0)
+        self._sorted = ordered
+        self.n = n
+        return _below_to_norm(out, n)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, meta=json.dumps({"mode": self.mode, "n": self.n, "n_cols": self.n_cols}), values=self.sorted_values())
+
+class QuantileSketch:
+    """KLL-style mergeable quantile sketch over several columns at once.
+
+    Level h holds items of weight 2**h. An overfull level is sorted per column and every other item (random offset)
+    moves up with doubled weight, so total weight stays exactly n and a rank query is off by roughly n/k at most.
+    All columns see the same number of items, so their levels stay the same size and compact together.
+    """
+
+    mode = "approx"
+
+    def __init__(self, n_cols=N_RANK_COLUMNS, k=SKETCH_K, seed=0):
+        self.n_cols = n_cols
+        self.k = k
+        self.n = 0
+        self.levels = [np.zeros((0, n_cols))]
+        self.rng = np.random.default_rng(seed)
+        self._cdf = None
+
+    def _capacity(self, h):
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - h))))
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) <= self._capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.zeros((0, self.n_cols)))
+            level = np.sort(level, axis=0)
+            odd = len(level) % 2
+            self.levels[h] = level[len(level) - odd:]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], level[int(self.rng.integers(2)):len(level) - odd:2]])
+            # a new top level shrinks every capacity below it
+            h = 0
+        self._cdf = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).reshape(-1, self.n_cols)
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self.n += len(values)
+            self._compress()
+        return self
+
+    def merge(self, other):
+        if other.k != self.k or other.n_cols != self.n_cols:
+            raise ValueError("sketches with different k or columns cannot be merged")
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros((0, self.n_cols)))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def size(self):
+        return sum(len(level) for level in self.levels)
+
+    def _weighted(self):
+        if self._cdf is None:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+            order = np.argsort(items, axis=0, kind="stable")
+            self._cdf = (np.take_along_axis(items, order, axis=0), np.cumsum(weights[order], axis=0))
+        return self._cdf
+
+    def rank_below(self, values):
+        values = np.asarray(values, dtype=float)
+        items, cum = self._weighted()
+        out = np.zeros((len(values), self.n_cols))
+        for j in range(self.n_cols):
+            idx = np.searchsorted(items[:, j], values[:, j], side="left")
+            out[:, j] = np.where(idx > 0, cum[np.maximum(idx - 1, 0), j], 0.0) if len(items) else 0.0
+        return out
+
+    def normalize(self, values):
+        return _below_to_norm(self.rank_below(values), self.n)
+
+    def fit_normalize(self, values):
+        return self.update(values).normalize(values)
+
+    def save(self, path):
+        meta = {"mode": self.mode, "n": self.n, "n_cols": self.n_cols, "k": self.k, "rng": self.rng.bit_generator.state}
+        with open(path, "wb") as f:
+            np.savez(f, meta=json.dumps(meta), **{f"level_{h}": level for h, level in enumerate(self.levels)})
+
+def make_rank_engine(mode="exact", k=SKETCH_K, seed=0, n_cols=N_RANK_COLUMNS):
+    if mode == "exact":
+        return ExactRanks(n_cols)
+    if mode == "approx":
+        return QuantileSketch(n_cols, k, seed)
+    raise ValueError(f"unknown rank mode {mode!r}, expected one of {RANK_MODES}")
+
+def load_rank_engine(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta["mode"] == "exact":
+            engine = ExactRanks(meta["n_cols"])
+            engine._sorted = data["values"]
+        else:
+            engine = QuantileSketch(meta["n_cols"], meta["k"])
+            engine.levels = [data[f"level_{h}"] for h in range(sum(key.startswith("level_") for key in data.files))]
+            engine.rng.bit_generator.state = meta["rng"]
+    engine.n = meta["n"]
+    return engine
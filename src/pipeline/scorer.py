@@ -1,6 +1,6 @@
-import os
-import json
 import numpy as np
+import pandas as pd
+from src.pipeline.ranking import ExactRanks, rank_inputs, RANK_COLUMNS
 
 PRODUCTS = [
 "Карта для путешествий",
@@ -15,102 +15,246 @@ PRODUCTS = [
 "Золотые слитки",
 ]
 
-def estimate_benefits(signals):
+# benefit model parameters; benefit_columns also takes (configs, 1) arrays of them to evaluate many configurations at once
+BENEFIT_RATES = {
+    "travel_cashback": 0.04,
+    "premium_base": 0.02,
+    "premium_tier1": 0.01,
+    "premium_tier2": 0.02,
+    "premium_tier1_balance": 1_000_000,
+    "premium_tier2_balance": 6_000_000,
+    "premium_cap": 100000,
+    "premium_min_balance": 200_000,
+    "credit_card": 0.10,
+    "fx_fee": 0.001,
+    "cash_loan_need": 500_000,
+    "cash_loan_benefit": 100000,
+    "deposit_multi": 0.1450,
+    "deposit_savings": 0.1650,
+    "deposit_accum": 0.1550,
+    "investments": 0.01,
+    "gold": 0.005,
+}
+
+def estimate_benefits(signals, rates=BENEFIT_RATES):
+    r = rates
     benefits = {}
-    benefits["Карта для путешествий"] = 0.04 * (signals.get("trips_sum",0) + signals.get("taxi_sum",0))
+    benefits["Карта для путешествий"] = r["travel_cashback"] * (signals.get("trips_sum",0) + signals.get("taxi_sum",0))
     avgbal = signals.get("avg_monthly_balance_KZT",0)
     spend = signals.get("monthly_spend",0)
     balance_bonus = 0
-    if 1_000_000 <= avgbal <= 6_000_000:
-        balance_bonus = 0.01 * spend
-    elif avgbal > 6_000_000:
-        balance_bonus = 0.02 * spend
-    prem = min(100000, 0.02 * spend + balance_bonus)
-    if signals.get("status") == "Студент" or avgbal < 200_000:
+    if r["premium_tier1_balance"] <= avgbal <= r["premium_tier2_balance"]:
+        balance_bonus = r["premium_tier1"] * spend
+    elif avgbal > r["premium_tier2_balance"]:
+        balance_bonus = r["premium_tier2"] * spend
+    prem = min(r["premium_cap"], r["premium_base"] * spend + balance_bonus)
+    if signals.get("status") == "Студент" or avgbal < r["premium_min_balance"]:
         prem = 0
     benefits["Премиальная карта"] = prem
     top3 = sum([signals.get("spend_by_category", {}).get(k,0) for k in signals.get("top3_cats",[]) if k])
-    benefits["Кредитная карта"] = 0.10 * top3
+    benefits["Кредитная карта"] = r["credit_card"] * top3
     fx_count = signals.get("fx_count",0)
     fx_amount = signals.get("fx_amount",0)
     avg_amount = fx_amount / max(1, fx_count)
-    benefits["Обмен валют"] = 0.001 * fx_count * avg_amount
-    needs_cash = (signals.get("remont_sum",0) + signals.get("mebel_sum",0) + signals.get("cash_out_sum",0))>500_000
-    benefits["Кредит наличными"] = 100000 if needs_cash else 0
+    # card spend and transfers in foreign currency (in KZT) is volume the client converts anyway
+    foreign_amount = signals.get("foreign_amount",0)
+    benefits["Обмен валют"] = r["fx_fee"] * fx_count * avg_amount + r["fx_fee"] * foreign_amount
+    needs_cash = (signals.get("remont_sum",0) + signals.get("mebel_sum",0) + signals.get("cash_out_sum",0))>r["cash_loan_need"]
+    benefits["Кредит наличными"] = r["cash_loan_benefit"] if needs_cash else 0
     spare = signals.get("spare_cash",0)
-    benefits["Депозит Мультивалютный"] = spare * 0.1450/12
-    benefits["Депозит Сберегательный"] = spare * 0.1650/12
-    benefits["Депозит Накопительный"] = spare * 0.1550/12
-    benefits["Инвестиции"] = spare * 0.01
-    benefits["Золотые слитки"] = spare * 0.005
+    benefits["Депозит Мультивалютный"] = spare * r["deposit_multi"]/12 + r["fx_fee"] * foreign_amount
+    benefits["Депозит Сберегательный"] = spare * r["deposit_savings"]/12
+    benefits["Депозит Накопительный"] = spare * r["deposit_accum"]/12
+    benefits["Инвестиции"] = spare * r["investments"]
+    benefits["Золотые слитки"] = spare * r["gold"]
     return benefits
 
+SIGNAL_WEIGHT = 0.7
+BENEFIT_WEIGHT = 0.3
+SCORE_CHUNK_SIZE = 1_000_000
+SCORE_INPUTS = [
+    "trips_sum", "taxi_sum", "avg_monthly_balance_KZT", "monthly_spend", "top3_spend",
+    "fx_count", "fx_amount", "remont_sum", "mebel_sum", "cash_out_sum", "spare_cash",
+    "foreign_count", "foreign_amount",
+]
+
+def percentile_norm_matrix(raw):
+    raw = np.asarray(raw, dtype=float)
+    values = np.where(np.isnan(raw), np.inf, raw)
+    return ExactRanks(raw.shape[1]).fit_normalize(values)
+
 def percentile_norm(arr):
     arr = np.array(arr, dtype=float)
     if arr.size==0:
         return arr
-    ranks = np.argsort(np.argsort(arr))
-    if arr.size==1:
-        return np.array([1.0])
-    return ranks/(arr.size-1)
-
-def compute_scores_and_select(all_signals, debug_dir):
-    os.makedirs(debug_dir, exist_ok=True)
-    per_product_raw_signal = {p:[] for p in PRODUCTS}
-    per_client_benefits = {}
-    client_ids = list(all_signals.keys())
-    for cid in client_ids:
-        s = all_signals[cid]
-        b = estimate_benefits(s)
-        per_client_benefits[cid] = b
-        per_product_raw_signal["Карта для путешествий"].append(s.get("trips_sum",0)+s.get("taxi_sum",0))
-        per_product_raw_signal["Премиальная карта"].append(s.get("avg_monthly_balance_KZT",0))
-        per_product_raw_signal["Кредитная карта"].append(sum([s.get("spend_by_category",{}).get(k,0) for k in s.get("top3_cats",[])]))
-        per_product_raw_signal["Обмен валют"].append(s.get("fx_count",0))
-        per_product_raw_signal["Кредит наличными"].append((s.get("remont_sum",0)+s.get("mebel_sum",0)+s.get("cash_out_sum",0)))
-        per_product_raw_signal["Депозит Мультивалютный"].append(s.get("spare_cash",0))
-        per_product_raw_signal["Депозит Сберегательный"].append(s.get("spare_cash",0))
-        per_product_raw_signal["Депозит Накопительный"].append(s.get("spare_cash",0))
-        per_product_raw_signal["Инвестиции"].append(s.get("spare_cash",0))
-        per_product_raw_signal["Золотые слитки"].append(s.get("spare_cash",0))
-    product_norms = {}
-    for p, arr in per_product_raw_signal.items():
-        product_norms[p] = percentile_norm(np.array(arr))
+    return percentile_norm_matrix(arr.reshape(-1, 1))[:, 0]
+
+def score_inputs_from_dicts(all_signals):
+    cols = {c: [] for c in SCORE_INPUTS}
+    status = []
+    for s in all_signals.values():
+        for c in SCORE_INPUTS:
+            if c != "top3_spend":
+                cols[c].append(s.get(c,0))
+        cols["top3_spend"].append(sum([s.get("spend_by_category",{}).get(k,0) for k in s.get("top3_cats",[])]))
+        status.append(s.get("status"))
+    inputs = pd.DataFrame({c: np.array(v, dtype=float) for c, v in cols.items()}, index=list(all_signals.keys()))
+    inputs["status"] = pd.Series(status, index=inputs.index, dtype=object)
+    return inputs
+
+def raw_signal_matrix(inputs):
+    spare = inputs["spare_cash"].to_numpy(dtype=float)
+    return np.column_stack([
+        inputs["trips_sum"].to_numpy(dtype=float) + inputs["taxi_sum"].to_numpy(dtype=float),
+        inputs["avg_monthly_balance_KZT"].to_numpy(dtype=float),
+        inputs["top3_spend"].to_numpy(dtype=float),
+        inputs["fx_count"].to_numpy(dtype=float) + inputs["foreign_count"].to_numpy(dtype=float),
+        inputs["remont_sum"].to_numpy(dtype=float) + inputs["mebel_sum"].to_numpy(dtype=float) + inputs["cash_out_sum"].to_numpy(dtype=float),
+        spare, spare, spare, spare, spare,
+    ])
+
+def benefit_inputs(inputs):
+    col = lambda c: inputs[c].to_numpy(dtype=float)
+    fx_count = col("fx_count")
+    return {
+        "travel": col("trips_sum") + col("taxi_sum"),
+        "avgbal": col("avg_monthly_balance_KZT"),
+        "spend": col("monthly_spend"),
+        "student": inputs["status"].to_numpy(dtype=object) == "Студент",
+        "top3_spend": col("top3_spend"),
+        "fx_count": fx_count,
+        "fx_avg": col("fx_amount") / np.maximum(1, fx_count),
+        "foreign_amount": col("foreign_amount"),
+        "cash_need": col("remont_sum") + col("mebel_sum") + col("cash_out_sum"),
+        "spare": col("spare_cash"),
+    }
+
+def benefit_column_list(x, rates=BENEFIT_RATES):
+    # x from benefit_inputs; one array per product, clients long, or configs x clients with (configs, 1) rates
+    r = rates
+    avgbal, spend = x["avgbal"], x["spend"]
+    tier1 = (avgbal >= r["premium_tier1_balance"]) & (avgbal <= r["premium_tier2_balance"])
+    balance_bonus = np.where(tier1, r["premium_tier1"] * spend, np.where(avgbal > r["premium_tier2_balance"], r["premium_tier2"] * spend, 0.0))
+    prem = r["premium_base"] * spend + balance_bonus
+    prem = np.where(prem < r["premium_cap"], prem, r["premium_cap"] * 1.0)
+    prem = np.where(x["student"] | (avgbal < r["premium_min_balance"]), 0.0, prem)
+    foreign = r["fx_fee"] * x["foreign_amount"]
+    spare = x["spare"]
+    cols = [
+        r["travel_cashback"] * x["travel"],
+        prem,
+        r["credit_card"] * x["top3_spend"],
+        r["fx_fee"] * x["fx_count"] * x["fx_avg"] + foreign,
+        np.where(x["cash_need"] > r["cash_loan_need"], r["cash_loan_benefit"] * 1.0, 0.0),
+        spare * r["deposit_multi"]/12 + foreign,
+        spare * r["deposit_savings"]/12,
+        spare * r["deposit_accum"]/12,
+        spare * r["investments"],
+        spare * r["gold"],
+    ]
+    return np.broadcast_arrays(*cols)
+
+def benefit_columns(x, rates=BENEFIT_RATES):
+    return np.stack(benefit_column_list(x, rates), axis=-1)
+
+def benefit_matrix(inputs, rates=BENEFIT_RATES):
+    return benefit_columns(benefit_inputs(inputs), rates)
+
+def normalize_benefit(benefit):
+    # per client min-max over products; a client with equal benefits everywhere gets 1.0
+    maxb = benefit.max(axis=-1, keepdims=True)
+    minb = benefit.min(axis=-1, keepdims=True)
+    flat = maxb == minb
+    return np.where(flat, 1.0, (benefit - minb) / np.where(flat, 1.0, maxb - minb))
+
+def top_k_products(scores, k=4):
+    # argpartition finds the k-th best score; ties on it go to the earlier product like a stable sort would
+    k = min(k, scores.shape[1])
+    kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1:k]
+    above = scores > kth
+    tied = scores == kth
+    need = k - above.sum(axis=1, keepdims=True)
+    picked = above | (tied & (np.cumsum(tied, axis=1) <= need))
+    idx = np.flatnonzero(picked.ravel()).reshape(-1, k) % scores.shape[1]
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+def iter_score_chunks(inputs, norm_signal, chunk_size=SCORE_CHUNK_SIZE):
+    for start in range(0, len(inputs), chunk_size):
+        part = inputs.iloc[start:start + chunk_size]
+        benefit = benefit_matrix(part)
+        norm_benefit = normalize_benefit(benefit)
+        score = SIGNAL_WEIGHT * norm_signal[start:start + chunk_size] + BENEFIT_WEIGHT * norm_benefit
+        yield {
+            "client_code": part.index.to_numpy(),
+            "benefit": benefit,
+            "norm_benefit": norm_benefit,
+            "score": score,
+            "top4": top_k_products(score, 4),
+        }
+
+def norm_signal_matrix(raw, ranks=None, fit_ranks=True):
+    # ranks: rank engine to normalize with; fitted on this population unless fit_ranks is False (e.g. loaded from disk)
+    ranks = ranks if ranks is not None else ExactRanks()
+    values = rank_inputs(raw)
+    return (ranks.fit_normalize(values) if fit_ranks else ranks.normalize(values))[:, RANK_COLUMNS]
+
+def score_matrix(inputs, chunk_size=SCORE_CHUNK_SIZE, ranks=None, fit_ranks=True):
+    raw = raw_signal_matrix(inputs)
+    norm_signal = norm_signal_matrix(raw, ranks, fit_ranks)
+    out = {"client_code": inputs.index.to_numpy(), "raw_signal": raw, "norm_signal": norm_signal}
+    chunks = list(iter_score_chunks(inputs, norm_signal, chunk_size))
+    for key in ("benefit", "norm_benefit", "score", "top4"):
+        out[key] = np.concatenate([c[key] for c in chunks]) if chunks else np.zeros((0, 4 if key == "top4" else len(PRODUCTS)))
+    return out
+
+def score_dicts(matrix, all_signals):
+    raw = matrix["raw_signal"].tolist()
+    norm_signal = matrix["norm_signal"].tolist()
+    benefit = matrix["benefit"].tolist()
+    norm_benefit = matrix["norm_benefit"].tolist()
+    score = matrix["score"].tolist()
+    top4 = matrix["top4"].tolist()
     results = {}
-    for idx, cid in enumerate(client_ids):
-        s = all_signals[cid]
-        b = per_client_benefits[cid]
+    per_client_benefits = {}
+    for i, cid in enumerate(matrix["client_code"].tolist()):
+        per_client_benefits[cid] = dict(zip(PRODUCTS, benefit[i]))
         prod_data = {}
-        benefits_list = [b[p] for p in PRODUCTS]
-        maxb = max(benefits_list) if benefits_list else 0
-        minb = min(benefits_list) if benefits_list else 0
-        if maxb==minb:
-            norm_benefits = [1.0 for _ in benefits_list]
-        else:
-            norm_benefits = [(x-minb)/(maxb-minb) for x in benefits_list]
-        for i,p in enumerate(PRODUCTS):
-            raw_signal = per_product_raw_signal[p][idx]
-            norm_signal = float(product_norms[p][idx]) if idx < len(product_norms[p]) else 0.0
-            norm_benefit = float(norm_benefits[i])
-            score = 0.7 * norm_signal + 0.3 * norm_benefit
+        for j, p in enumerate(PRODUCTS):
             prod_data[p] = {
-                "raw_signal": raw_signal,
-                "norm_signal": norm_signal,
-                "benefit": b[p],
-                "norm_benefit": norm_benefit,
-                "score": score,
+                "raw_signal": raw[i][j],
+                "norm_signal": norm_signal[i][j],
+                "benefit": benefit[i][j],
+                "norm_benefit": norm_benefit[i][j],
+                "score": score[i][j],
             }
-        sorted_products = sorted(prod_data.items(), key=lambda x: x[1]["score"], reverse=True)
-        top4 = [p for p,_ in sorted_products[:4]]
-        chosen = top4[0]
-        out = {
+        names = [PRODUCTS[j] for j in top4[i]]
+        results[cid] = {
             "client_code": cid,
-            "raw_signals": s,
+            "raw_signals": all_signals[cid],
             "product_scores": prod_data,
-            "top4": top4,
-            "chosen": chosen,
+            "top4": names,
+            "chosen": names[0],
         }
-        results[cid] = out
-        with open(os.path.join(debug_dir, f"client_{cid}_scores.json"), "w", encoding="utf-8") as f:
-            json.dump(out, f, ensure_ascii=False, indent=2)
     return results, per_client_benefits
+
+def compute_scores_and_select(all_signals, debug_sink=None, chunk_size=SCORE_CHUNK_SIZE, ranks=None, fit_ranks=True):
+    matrix = score_matrix(score_inputs_from_dicts(all_signals), chunk_size, ranks, fit_ranks)
+    results, per_client_benefits = score_dicts(matrix, all_signals)
+    if debug_sink is not None:
+        for out in results.values():
+            debug_sink.write(out)
+    return results, per_client_benefits
+
+def score_table(table, debug_sink=None, chunk_size=SCORE_CHUNK_SIZE, ranks=None, fit_ranks=True, caps=None, allocation="auto"):
+    # with caps, products are allocated across the population and clients left without one are dropped
+    table.attach_scores(score_matrix(table.frame(SCORE_INPUTS + ["status"]), chunk_size, ranks, fit_ranks))
+    if caps is not None:
+        from src.pipeline.allocation import allocate_table
+        allocate_table(table, caps, allocation)
+    if debug_sink is not None:
+        for row in table.rows():
+            debug_sink.write(row.score_record())
+    if caps is not None and (table.allocated < 0).any():
+        table = table.take(np.flatnonzero(table.allocated >= 0))
+    return table
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import queue
+import stat
+import signal
+import socketserver
+import threading
+import pandas as pd
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.utils.io import scan_client_files, load_client_tables, empty_client_table, _read_client_table, _parse_table_dates, TABLE_SCHEMAS
+from src.pipeline.features import compute_signals_frame
+from src.pipeline.ir import ClientTable
+from src.pipeline.scorer import raw_signal_matrix, score_table
+from src.pipeline.ranking import rank_inputs
+from src.pipeline.generator import generate_pushes_table
+from src.pipeline.stream import _chunks, STREAM_CHUNK_SIZE
+from src.utils.metrics import LatencyHistogram, histogram_lines, METRIC_PREFIX
+
+BATCH_MAX = 256
+BATCH_WAIT_MS = 2.0
+MAX_BODY_BYTES = 64 << 20
+SERVICE_STAGES = ["request", "queue", "features", "scoring", "generation"]
+
+def fit_service_ranks(data_dir, profiles, ranks, rates=None, found=None, chunk_size=STREAM_CHUNK_SIZE):
+    # the population distribution every on-demand client is ranked against, built once in bounded-memory chunks
+    found = found if found is not None else scan_client_files(data_dir)
+    for chunk in _chunks(profiles, chunk_size):
+        tx, tr, missing = load_client_tables(data_dir, chunk, found=found)
+        ranks.update(rank_inputs(raw_signal_matrix(compute_signals_frame(tx, tr, chunk, missing, rates)[0])))
+    return ranks
+
+def _request_table(rows, pos, kind):
+    df = pd.DataFrame(rows or [], columns=list(TABLE_SCHEMAS[kind]))
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
+    df.insert(0, "client_code", pos)
+    return df
+
+class ScoringService:
+    """Profiles, the fitted rank engine, FX rates and the file index kept in memory between requests."""
+
+    def __init__(self, data_dir, profiles, ranks, rates=None, found=None, use_ai=False, engine=None):
+        self.data_dir = data_dir
+        self.columns = list(profiles.columns)
+        self.profiles = {int(r["client_code"]): r for r in profiles.to_dict("records")}
+        self.ranks = ranks
+        self.rates = rates
+        self.found = found if found is not None else scan_client_files(data_dir)
+        self.use_ai = use_ai
+        self.engine = engine
+        self.started = time.time()
+        self.latency = {name: LatencyHistogram() for name in SERVICE_STAGES}
+        self.batch_sizes = Counter()
+
+    def _rows(self, item, cid, pos, kind):
+        # rows sent with the request win; without them the client's file in the data dir is read
+        if kind in item:
+            return _request_table(item[kind], pos, kind)
+        path = self.found[kind].get(cid)
+        return _read_client_table(path, pos, kind) if path else None
+
+    def _prepare(self, items):
+        # positions stand in for client codes so one batch may hold the same client twice
+        profile_rows, tables, errors = [], {"transactions": [], "transfers": []}, {}
+        for pos, item in enumerate(items):
+            try:
+                cid = int(item["client_code"])
+            except (KeyError, TypeError, ValueError, IndexError):
+                errors[pos] = "client_code is required"
+                continue
+            if cid not in self.profiles and not isinstance(item.get("profile"), dict):
+                errors[pos] = "unknown client, send a profile"
+                continue
+            try:
+                parts = {kind: self._rows(item, cid, pos, kind) for kind in tables}
+            except (TypeError, ValueError) as e:
+                errors[pos] = f"bad rows: {e}"
+                continue
+            if all(p is None for p in parts.values()):
+                errors[pos] = "no transactions or transfers for client"
+                continue
+            for kind, part in parts.items():
+                if part is not None:
+                    tables[kind].append(part)
+            profile_rows.append({**self.profiles.get(cid, {}), **(item.get("profile") or {}), "client_code": pos})
+        tx, tr = (_parse_table_dates(pd.concat(frames, ignore_index=True)) if frames else empty_client_table(kind)
+                  for kind, frames in tables.items())
+        return pd.DataFrame(profile_rows, columns=self.columns), tx, tr, errors
+
+    def score_batch(self, items):
+        t = time.perf_counter()
+        profiles, tx, tr, errors = self._prepare(items)
+        results = [None] * len(items)
+        for pos, msg in errors.items():
+            results[pos] = {"client_code": items[pos].get("client_code") if isinstance(items[pos], dict) else None, "error": msg}
+        self.batch_sizes[len(items)] += 1
+        if profiles.empty:
+            return results
+        table = ClientTable.from_frames(*compute_signals_frame(tx, tr, profiles, None, self.rates))
+        t_features = time.perf_counter()
+        score_table(table, ranks=self.ranks, fit_ranks=False)
+        t_scoring = time.perf_counter()
+        products, pushes = generate_pushes_table(table, self.use_ai, self.engine)
+        benefit = table.chosen_benefit().tolist()
+        t_generation = time.perf_counter()
+        for name, seconds in (("features", t_features - t), ("scoring", t_scoring - t_features), ("generation", t_generation - t_scoring)):
+            self.latency[name].observe(seconds)
+        for row in table.rows():
+            pos = row.client_code
+            results[pos] = {"client_code": items[pos]["client_code"], "product": products[row.i], "push": pushes[row.i],
+                            "top4": row.top4(), "benefit": benefit[row.i]}
+        return results
+
+    def stats(self):
+        return {"clients": len(self.profiles), "rank_mode": self.ranks.mode, "fx_rates": self.rates is not None,
+                "uptime_s": time.time() - self.started, "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "latency": {name: h.snapshot() for name, h in self.latency.items()}}
+
+    def prometheus_lines(self):
+        lines = histogram_lines("service_latency_seconds", "Latency of the scoring service per stage.", self.latency)
+        lines.append(f"# TYPE {METRIC_PREFIX}_service_batches_total counter")
+        lines.append(f"{METRIC_PREFIX}_service_batches_total {sum(self.batch_sizes.values())}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_service_batched_requests_total counter")
+        lines.append(f"{METRIC_PREFIX}_service_batched_requests_total {sum(k * v for k, v in self.batch_sizes.items())}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_service_clients gauge")
+        lines.append(f"{METRIC_PREFIX}_service_clients {len(self.profiles)}")
+        return lines
+
+class Batcher:
+    """Single scoring thread; requests arriving within max_wait of each other are scored as one batch."""
+
+    def __init__(self, service, max_batch=BATCH_MAX, max_wait_ms=BATCH_WAIT_MS):
+        self.service = service
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="scoring", daemon=True)
+        self._thread.start()
+
+    def submit(self, items):
+        future = Future()
+        self._queue.put((items, future, time.perf_counter()))
+        return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        slots = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            wait = deadline - time.perf_counter()
+            try:
+                slot = self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if slot is None:
+                self._queue.put(None)
+                break
+            slots.append(slot)
+            size += len(slot[0])
+        return slots
+
+    def _run(self):
+        while True:
+            slots = self._collect()
+            if slots is None:
+                return
+            now = time.perf_counter()
+            for _, _, queued in slots:
+                self.service.latency["queue"].observe(now - queued)
+            try:
+                results = self.service.score_batch([item for items, _, _ in slots for item in items])
+            except Exception as e:
+                if len(slots) == 1:
+                    slots[0][1].set_exception(e)
+                    continue
+                # one request broke the batch: score them apart so only that one fails
+                for items, future, _ in slots:
+                    try:
+                        future.set_result(self.service.score_batch(items))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            start = 0
+            for items, future, _ in slots:
+                future.set_result(results[start:start + len(items)])
+                start += len(items)
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in two writes; with Nagle on, delayed ACKs add ~40 ms to every keep-alive reply
+    disable_nagle_algorithm = True
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8"):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.batcher.service
+        if self.path == "/health":
+            self._send(200, {"status": "ok", "clients": len(service.profiles), "rank_mode": service.ranks.mode})
+        elif self.path == "/stats":
+            self._send(200, service.stats())
+        elif self.path == "/metrics":
+            self._send(200, ("\n".join(service.prometheus_lines()) + "\n").encode(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        t = time.perf_counter()
+        if self.path != "/score":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": "request body too large"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"null")
+        except ValueError as e:
+            self._send(400, {"error": f"invalid JSON: {e}"})
+            return
+        # {"requests": [...]} is an explicit batch, anything else one request
+        batch = isinstance(body, dict) and isinstance(body.get("requests"), list)
+        items = body["requests"] if batch else [body]
+        if not isinstance(body, dict) or not items:
+            self._send(400, {"error": "expected a request object or {\"requests\": [...]}"})
+            return
+        try:
+            results = self.server.batcher.submit(items)
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send(200, {"results": results} if batch else results[0])
+        self.server.batcher.service.latency["request"].observe(time.perf_counter() - t)
+
+class UnixServiceHandler(ServiceHandler):
+    disable_nagle_algorithm = False
+
+def _remove_socket(path):
+    # a stale socket from an earlier run is replaced; any other file at the path is left alone
+    if not os.path.exists(path):
+        return
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    os.unlink(path)
+
+def make_server(address, batcher, verbose=False):
+    # "unix:/path/to.sock" or "host:port"
+    if address.startswith("unix:"):
+        # UnixStreamServer only exists where AF_UNIX does
+        class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        path = address[len("unix:"):]
+        _remove_socket(path)
+        server = UnixHTTPServer(path, UnixServiceHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), ServiceHandler)
+        server.daemon_threads = True
+    server.batcher = batcher
+    server.verbose = verbose
+    return server
+
+def serve(service, address, max_batch=BATCH_MAX, max_wait_ms=BATCH_WAIT_MS, verbose=False):
+    batcher = Batcher(service, max_batch, max_wait_ms)
+    server = make_server(address, batcher, verbose)
+    # SIGTERM stops the loop like Ctrl-C; shutdown() must come from another thread than serve_forever()
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"Serving {len(service.profiles)} clients on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        if address.startswith("unix:"):
+            _remove_socket(address[len("unix:"):])
@@ -0,0 +1,106 @@
+import json
+import time
+import itertools
+from functools import reduce
+import numpy as np
+import pandas as pd
+from src.pipeline.scorer import (PRODUCTS, SCORE_INPUTS, SIGNAL_WEIGHT, BENEFIT_WEIGHT, BENEFIT_RATES, raw_signal_matrix,
+                                 norm_signal_matrix, benefit_inputs, benefit_column_list)
+
+SIM_PARAMS = {"signal_weight": SIGNAL_WEIGHT, "benefit_weight": BENEFIT_WEIGHT, **BENEFIT_RATES}
+# clients per pass, and configs x clients x products per block; per-product temporaries are block / 10 floats
+SIM_CHUNK = 65536
+SIM_BLOCK = 1 << 20
+
+def load_grid(path):
+    # {"param": [values, ...], ...} is expanded to the full grid; a list of {"param": value} objects is taken as is
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    if isinstance(spec, dict):
+        keys = list(spec)
+        values = [v if isinstance(v, list) else [v] for v in spec.values()]
+        configs = [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+    elif isinstance(spec, list):
+        configs = spec
+    else:
+        raise ValueError(f"{path}: expected an object of value lists or a list of configurations")
+    if not configs:
+        raise ValueError(f"{path}: the grid has no configurations")
+    if not all(isinstance(c, dict) for c in configs):
+        raise ValueError(f"{path}: every configuration must be an object of parameter values")
+    bad = sorted({k for c in configs for k, v in c.items() if isinstance(v, bool) or not isinstance(v, (int, float))})
+    if bad:
+        raise ValueError(f"{path}: values of {', '.join(bad)} must be numbers")
+    unknown = sorted({k for c in configs for k in c} - set(SIM_PARAMS))
+    if unknown:
+        raise ValueError(f"{path}: unknown parameters {', '.join(unknown)}; known: {', '.join(SIM_PARAMS)}")
+    return [complete_config(c) for c in configs]
+
+def complete_config(config):
+    out = {**SIM_PARAMS, **config}
+    if "signal_weight" in config and "benefit_weight" not in config:
+        out["benefit_weight"] = 1 - config["signal_weight"]
+    return out
+
+def _rate_block(configs):
+    return {k: np.array([c[k] for c in configs], dtype=float)[:, None] for k in SIM_PARAMS}
+
+def _choose(norm_signal, x, rates):
+    # configs x clients: product with the highest score under each configuration, and its benefit. Same arithmetic as
+    # normalize_benefit and iter_score_chunks, but product by product: numpy reduces a length-10 last axis slowly
+    cols = benefit_column_list(x, rates)
+    maxb, minb = reduce(np.maximum, cols), reduce(np.minimum, cols)
+    flat = maxb == minb
+    span = np.where(flat, 1.0, maxb - minb)
+    ws, wb = rates["signal_weight"], rates["benefit_weight"]
+    for j, b in enumerate(cols):
+        score = ws * norm_signal[:, j] + wb * np.where(flat, 1.0, (b - minb) / span)
+        if not j:
+            best, chosen, benefit = score, np.zeros(score.shape, dtype=np.int8), b
+            continue
+        # strictly greater, so ties go to the earlier product like argmax
+        better = score > best
+        best = np.where(better, score, best)
+        chosen[better] = j
+        benefit = np.where(better, b, benefit)
+    return chosen, benefit
+
+def simulate(table, configs, ranks=None, fit_ranks=True, chunk=SIM_CHUNK, block=SIM_BLOCK):
+    # signals are ranked once; every configuration reuses them, and a block of configurations is scored per numpy pass
+    inputs = table.frame(SCORE_INPUTS + ["status"])
+    norm_signal = norm_signal_matrix(raw_signal_matrix(inputs), ranks, fit_ranks)
+    x = benefit_inputs(inputs)
+    n, m, c = len(inputs), len(PRODUCTS), len(configs)
+    per_block = max(1, block // (min(chunk, max(n, 1)) * m))
+    blocks = [(lo, _rate_block(configs[lo:lo + per_block])) for lo in range(0, c, per_block)]
+    baseline = _rate_block([SIM_PARAMS])
+    mix = np.zeros((c, m), dtype=np.int64)
+    flips = np.zeros(c, dtype=np.int64)
+    benefit_sum = np.zeros(c)
+    for start in range(0, n, chunk):
+        xs = {k: v[start:start + chunk] for k, v in x.items()}
+        ns = norm_signal[start:start + chunk]
+        base, _ = _choose(ns, xs, baseline)
+        for lo, rates in blocks:
+            chosen, benefit = _choose(ns, xs, rates)
+            k = len(chosen)
+            mix[lo:lo + k] += np.bincount((np.arange(k)[:, None] * m + chosen).ravel(), minlength=k * m).reshape(k, m)
+            flips[lo:lo + k] += (chosen != base).sum(axis=1)
+            benefit_sum[lo:lo + k] += benefit.sum(axis=1)
+    out = pd.DataFrame(configs)
+    out["flips"] = flips
+    out["flip_share"] = flips / max(n, 1)
+    out["avg_benefit"] = benefit_sum / max(n, 1)
+    for j, p in enumerate(PRODUCTS):
+        out[f"mix:{p}"] = mix[:, j]
+    return out
+
+def varying_columns(frame):
+    return [k for k in SIM_PARAMS if frame[k].nunique() > 1]
+
+def run_simulation(table, configs, out_path, ranks=None, fit_ranks=True):
+    t = time.perf_counter()
+    frame = simulate(table, configs, ranks, fit_ranks)
+    seconds = time.perf_counter() - t
+    frame.to_csv(out_path, index=False)
+    return frame, seconds
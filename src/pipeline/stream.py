@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import pandas as pd
+from src.utils.io import scan_client_files, load_client_tables, write_results, write_result_columns, write_missing_report, write_date_format_report, write_fx_report
+from src.pipeline.preprocess import DATE_FORMAT_HITS
+from src.pipeline.fx import FX_STATS
+from src.pipeline.features import compute_signals_frame
+from src.pipeline.ir import ClientTable
+from src.pipeline.scorer import raw_signal_matrix, score_table
+from src.pipeline.ranking import make_rank_engine, rank_inputs, SKETCH_K
+from src.pipeline.generator import generate_pushes_table
+from src.utils.metrics import stage, peak_rss_mb
+from src.eval.evaluate import score_push_columns, quality_counts, add_quality_counts, quality_summary, write_quality_summary, per_client_frame
+
+STREAM_CHUNK_SIZE = 50_000
+def _chunks(profiles, chunk_size):
+    for start in range(0, len(profiles), chunk_size):
+        yield profiles.iloc[start:start + chunk_size]
+
+def run_stream(data_dir, profiles, output, debug_dir, use_ai=False, chunk_size=STREAM_CHUNK_SIZE, rank_mode="exact", sketch_k=SKETCH_K, seed=0, debug_sink=None, engine=None, ranks=None, fit_ranks=True, rates=None,
+               archive=None, run=None, suppress_days=None):
+    os.makedirs(debug_dir, exist_ok=True)
+    found = scan_client_files(data_dir)
+    spill_dir = tempfile.mkdtemp(prefix="stream_")
+    ranks = ranks if ranks is not None else make_rank_engine(rank_mode, sketch_k, seed)
+    missing = {}
+    per_chunk = []
+    try:
+        t_start = time.perf_counter()
+        for i, chunk in enumerate(_chunks(profiles, chunk_size)):
+            t = time.perf_counter()
+            with stage("load") as rec:
+                tx, tr, chunk_missing = load_client_tables(data_dir, chunk, found=found)
+                rec["rows"] = len(tx) + len(tr)
+            missing.update(chunk_missing)
+            with stage("features", clients=len(chunk)):
+                frame = compute_signals_frame(tx, tr, chunk, chunk_missing, rates)
+                pd.to_pickle(frame, os.path.join(spill_dir, f"chunk_{i}.pkl"))
+            if fit_ranks:
+                ranks.update(rank_inputs(raw_signal_matrix(frame[0])))
+            per_chunk.append({"chunk": i, "pass": 1, "clients": len(frame[0]), "seconds": time.perf_counter() - t, "peak_rss_mb": peak_rss_mb()})
+        n_chunks = len(per_chunk)
+        write_missing_report(missing, debug_dir)
+        write_date_format_report(DATE_FORMAT_HITS, debug_dir)
+        if rates is not None:
+            write_fx_report(FX_STATS, debug_dir)
+        t_pass1 = time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        eval_path = os.path.join(debug_dir, "evaluation_per_client.csv")
+        counts = None
+        count = 0
+        suppressed = 0
+        for i in range(n_chunks):
+            t = time.perf_counter()
+            with stage("scoring") as rec:
+                table = ClientTable.from_frames(*pd.read_pickle(os.path.join(spill_dir, f"chunk_{i}.pkl")))
+                m = rec["clients"] = len(table)
+                # ranks are complete after pass 1, so every chunk is scored against the whole population
+                score_table(table, debug_sink, chunk_size=max(m, 1), ranks=ranks, fit_ranks=False)
+                if archive is not None:
+                    from src.utils.archive import suppress_repeats
+                    table, n = suppress_repeats(table, archive, suppress_days)
+                    suppressed += n
+                m = len(table)
+            if m == 0:
+                continue
+            with stage("generation", clients=m):
+                products, pushes = generate_pushes_table(table, use_ai=use_ai, engine=engine)
+            append = count > 0
+            with stage("write", clients=m):
+                write_result_columns(table.client_code, products, pushes, output, append=append)
+                if archive is not None:
+                    archive.append(run, table.client_code, products, pushes, table.chosen_score())
+            with stage("evaluation", clients=m):
+                cids = table.client_code.tolist()
+                scored = score_push_columns(pushes, table.column("name").tolist())
+                per_client_frame(cids, products, scored).to_csv(eval_path, index=False, mode="a" if append else "w", header=not append)
+                counts = add_quality_counts(counts, quality_counts(products, scored))
+            count += m
+            per_chunk.append({"chunk": i, "pass": 2, "clients": m, "seconds": time.perf_counter() - t, "peak_rss_mb": peak_rss_mb()})
+        t_pass2 = time.perf_counter() - t_start
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    if count == 0:
+        write_results({}, output)
+    write_quality_summary(quality_summary(counts), debug_dir)
+    report = {
+        "chunk_size": chunk_size,
+        "rank_mode": ranks.mode,
+        "clients": count,
+        "chunks": n_chunks,
+        "pass1_seconds": t_pass1,
+        "pass2_seconds": t_pass2,
+        "clients_per_second": count / (t_pass1 + t_pass2) if count else 0,
+        "peak_rss_mb": peak_rss_mb(),
+        "per_chunk": per_chunk,
+    }
+    if suppress_days is not None:
+        report["suppressed_repeats"] = suppressed
+    with open(os.path.join(debug_dir, "stream_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
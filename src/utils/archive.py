@@ -0,0 +1,357 @@
+import os
+import json
+import mmap
+import time
+import numpy as np
+import pandas as pd
+try:
+    import fcntl
+except ImportError:
+    # Windows: msvcrt byte-range locks stand in for flock
+    fcntl = None
+    import msvcrt
+
+RECORD_DTYPE = np.dtype([("run", "<u4"), ("product", "i1"), ("client_code", "<i8"), ("score", "<f4"),
+                         ("push_offset", "<u8"), ("push_len", "<u4")])
+INDEX_DTYPE = np.dtype([("client_code", "<i8"), ("record", "<i8")])
+INDEX_MIN_CAPACITY = 1 << 16
+ARCHIVE_BATCH = 50_000
+EXPORT_CHUNK = 100_000
+META_FILE = "archive.json"
+RECORDS_FILE = "records.bin"
+PUSHES_FILE = "pushes.bin"
+INDEX_FILE = "index.npy"
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+def _slots(keys, bits):
+    # Fibonacci hashing: the top bits of key * 2^64/phi
+    with np.errstate(over="ignore"):
+        return ((np.asarray(keys, dtype=np.int64).view(np.uint64) * _GOLDEN) >> np.uint64(64 - bits)).astype(np.int64)
+
+def _index_insert(index, keys, records):
+    # open addressing with linear probing, all keys of a batch probed together; keys must be unique in the batch
+    mask = len(index) - 1
+    pos = _slots(keys, mask.bit_length())
+    pending = np.arange(len(keys))
+    while len(pending):
+        p = pos[pending]
+        slot = index[p]
+        free = (slot["record"] < 0) | (slot["client_code"] == keys[pending])
+        # several keys may probe the same empty slot in one round: the first one takes it, the rest probe again
+        _, first = np.unique(p[free], return_index=True)
+        won = pending[free][first]
+        index["client_code"][pos[won]] = keys[won]
+        index["record"][pos[won]] = records[won]
+        taken = pending[~free]
+        pos[taken] = (pos[taken] + 1) & mask
+        done = np.zeros(len(keys), dtype=bool)
+        done[won] = True
+        pending = pending[~done[pending]]
+
+def _index_find(index, keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    out = np.full(len(keys), -1, dtype=np.int64)
+    if not len(index):
+        return out
+    mask = len(index) - 1
+    pos = _slots(keys, mask.bit_length())
+    pending = np.arange(len(keys))
+    while len(pending):
+        slot = index[pos[pending]]
+        hit = (slot["record"] >= 0) & (slot["client_code"] == keys[pending])
+        out[pending[hit]] = slot["record"][hit]
+        pending = pending[~hit & (slot["record"] >= 0)]
+        pos[pending] = (pos[pending] + 1) & mask
+    return out
+
+def _last_per_key(keys):
+    # position of the last occurrence of each distinct key
+    rev = np.unique(keys[::-1], return_index=True)[1]
+    return np.sort(len(keys) - 1 - rev)
+
+def _lock_exclusive(f):
+    # non-blocking; False when another process holds the lock
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+class PushArchive:
+    """Append-only archive of sent pushes with a memory-mapped index of each client's last record; one writer at a time."""
+
+    def __init__(self, archive_dir, readonly=False):
+        self.dir = archive_dir
+        self.readonly = readonly
+        os.makedirs(archive_dir, exist_ok=True)
+        self._lock = None
+        if not readonly:
+            self._lock = open(os.path.join(archive_dir, ".lock"), "w")
+            if not _lock_exclusive(self._lock):
+                self._lock.close()
+                raise RuntimeError(f"archive {archive_dir} is open for writing in another process")
+        try:
+            with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            self.meta = {"records": 0, "push_bytes": 0, "products": [], "runs": [], "dirty": False}
+        self._records = self._pushes = self._push_map = None
+        self.index = None
+        if not readonly:
+            self._recover()
+        self._open_index()
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _write_meta(self):
+        tmp = self._path(META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(META_FILE))
+
+    def _recover(self):
+        # an append that did not commit leaves bytes past the committed sizes and possibly index entries pointing there
+        for name, size in ((RECORDS_FILE, self.meta["records"] * RECORD_DTYPE.itemsize), (PUSHES_FILE, self.meta["push_bytes"])):
+            with open(self._path(name), "ab") as f:
+                if f.tell() != size:
+                    f.truncate(size)
+                    self.meta["dirty"] = True
+        if self.meta["dirty"] or (self.meta["records"] and not os.path.exists(self._path(INDEX_FILE))):
+            self._rebuild_index()
+            self.meta["dirty"] = False
+            self._write_meta()
+
+    def _open_index(self):
+        path = self._path(INDEX_FILE)
+        if os.path.exists(path):
+            self.index = np.load(path, mmap_mode="r" if self.readonly else "r+")
+        elif not self.readonly:
+            self.index = self._new_index(path, INDEX_MIN_CAPACITY)
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+    def _new_index(self, path, capacity):
+        index = np.lib.format.open_memmap(path, mode="w+", dtype=INDEX_DTYPE, shape=(capacity,))
+        index["record"] = -1
+        return index
+
+    def _rebuild_index(self, capacity=INDEX_MIN_CAPACITY):
+        # streamed over the records file, so the archive is never held in memory at once; kept at most half full
+        n = self.meta["records"]
+        while capacity < 2 * self.meta.get("clients", 0):
+            capacity *= 2
+        tmp = self._path(INDEX_FILE + ".tmp.npy")
+        index = self._new_index(tmp, capacity)
+        records = self.records()
+        clients = 0
+        for start in range(0, n, EXPORT_CHUNK):
+            keys = np.asarray(records["client_code"][start:start + EXPORT_CHUNK])
+            last = _last_per_key(keys)
+            clients += int((_index_find(index, keys[last]) < 0).sum())
+            if 2 * clients > capacity:
+                del index
+                return self._rebuild_index(capacity * 2)
+            _index_insert(index, keys[last], start + last)
+        index.flush()
+        del index
+        os.replace(tmp, self._path(INDEX_FILE))
+        self.meta["clients"] = clients
+        self._open_index()
+
+    def records(self):
+        n = self.meta["records"]
+        if self._records is None or len(self._records) != n:
+            self._records = np.memmap(self._path(RECORDS_FILE), dtype=RECORD_DTYPE, mode="r", shape=(n,)) if n else np.zeros(0, RECORD_DTYPE)
+        return self._records
+
+    def _push_bytes(self):
+        size = self.meta["push_bytes"]
+        if not size:
+            return b""
+        if self._push_map is None or len(self._push_map) < size:
+            self._close_pushes()
+            self._pushes = open(self._path(PUSHES_FILE), "rb")
+            self._push_map = mmap.mmap(self._pushes.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._push_map
+
+    def _close_pushes(self):
+        if self._push_map is not None:
+            self._push_map.close()
+            self._pushes.close()
+        self._push_map = self._pushes = None
+
+    def _push_texts(self, offsets, lengths):
+        buf = self._push_bytes()
+        return [buf[o:o + n].decode("utf-8") for o, n in zip(offsets.tolist(), lengths.tolist())]
+
+    def begin_run(self, run_id=None, now=None):
+        now = time.time() if now is None else now
+        ids = {r["run_id"] for r in self.meta["runs"]}
+        if run_id is None:
+            base = run_id = time.strftime("%Y%m%dT%H%M%S", time.localtime(now))
+            k = 1
+            while run_id in ids:
+                k += 1
+                run_id = f"{base}-{k}"
+        elif run_id in ids:
+            raise ValueError(f"run {run_id} is already in the archive")
+        self.meta["runs"].append({"run_id": run_id, "time": now, "first": self.meta["records"], "count": 0})
+        self._write_meta()
+        return len(self.meta["runs"]) - 1
+
+    def _product_codes(self, products):
+        names = self.meta["products"]
+        code = {p: i for i, p in enumerate(names)}
+        for p in dict.fromkeys(products):
+            if p not in code:
+                code[p] = len(names)
+                names.append(p)
+        return np.array([code[p] for p in products], dtype=np.int8)
+
+    def append(self, run, client_codes, products, pushes, scores):
+        # rows are durable (and visible to lookups) once this returns; a crash in between is rolled back on the next open
+        client_codes = np.asarray(client_codes, dtype=np.int64)
+        for start in range(0, len(client_codes), ARCHIVE_BATCH):
+            end = start + ARCHIVE_BATCH
+            self._append_batch(run, client_codes[start:end], products[start:end], pushes[start:end], np.asarray(scores)[start:end])
+
+    def _append_batch(self, run, client_codes, products, pushes, scores):
+        if not len(client_codes):
+            return
+        if not self.meta["dirty"]:
+            self.meta["dirty"] = True
+            self._write_meta()
+        encoded = [p.encode("utf-8") for p in pushes]
+        lengths = np.fromiter(map(len, encoded), dtype=np.uint64, count=len(encoded))
+        rows = np.zeros(len(client_codes), dtype=RECORD_DTYPE)
+        rows["run"] = run
+        rows["product"] = self._product_codes(products)
+        rows["client_code"] = client_codes
+        rows["score"] = scores
+        rows["push_offset"] = self.meta["push_bytes"] + np.cumsum(lengths) - lengths
+        rows["push_len"] = lengths
+        for name, data in ((PUSHES_FILE, b"".join(encoded)), (RECORDS_FILE, rows.tobytes())):
+            with open(self._path(name), "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        first = self.meta["records"]
+        last = _last_per_key(client_codes)
+        new = int((_index_find(self.index, client_codes[last]) < 0).sum())
+        if 2 * (self.meta.get("clients", 0) + new) > len(self.index):
+            self.meta["records"] += len(rows)
+            self._rebuild_index(len(self.index) * 2)
+        else:
+            _index_insert(self.index, client_codes[last], first + last)
+            self.index.flush()
+            self.meta["clients"] = self.meta.get("clients", 0) + new
+            self.meta["records"] += len(rows)
+        self.meta["push_bytes"] += int(lengths.sum())
+        self.meta["runs"][run]["count"] += len(rows)
+        self.meta["dirty"] = False
+        self._write_meta()
+
+    def last_records(self, client_codes):
+        # record number of each client's latest push, -1 if never pushed; a few probes in the mapped index per client
+        rec = _index_find(self.index, client_codes)
+        # a reader can see index entries of an append that has not committed yet
+        return np.where(rec < self.meta["records"], rec, -1)
+
+    def last(self, client_code):
+        rec = int(self.last_records([client_code])[0])
+        if rec < 0:
+            return None
+        row = self.records()[rec]
+        run = self.meta["runs"][int(row["run"])]
+        return {"run_id": run["run_id"], "time": run["time"], "client_code": int(row["client_code"]),
+                "product": self.meta["products"][int(row["product"])], "score": float(row["score"]),
+                "push": self._push_texts(np.array([row["push_offset"]]), np.array([row["push_len"]]))[0]}
+
+    def repeats(self, client_codes, products, days, now=None):
+        # clients whose last push (within `days`, if given) was the same product
+        now = time.time() if now is None else now
+        rec = self.last_records(client_codes)
+        out = np.zeros(len(rec), dtype=bool)
+        seen = np.flatnonzero(rec >= 0)
+        if not len(seen):
+            return out
+        rows = self.records()[rec[seen]]
+        names = np.array(self.meta["products"], dtype=object)[rows["product"]]
+        same = names == np.asarray(products, dtype=object)[seen]
+        if days is not None:
+            times = np.array([r["time"] for r in self.meta["runs"]])[rows["run"]]
+            same &= times >= now - days * 86400
+        out[seen] = same
+        return out
+
+    def iter_frames(self, run_id=None, chunk_rows=EXPORT_CHUNK):
+        runs = self.meta["runs"]
+        if run_id is not None:
+            spans = [(r["first"], r["first"] + r["count"]) for r in runs if r["run_id"] == run_id]
+            if not spans:
+                raise ValueError(f"run {run_id} is not in the archive")
+        else:
+            spans = [(0, self.meta["records"])]
+        run_ids = np.array([r["run_id"] for r in runs], dtype=object)
+        products = np.array(self.meta["products"], dtype=object)
+        records = self.records()
+        for lo, hi in spans:
+            for start in range(lo, hi, chunk_rows):
+                rows = np.asarray(records[start:min(start + chunk_rows, hi)])
+                yield pd.DataFrame({"run_id": run_ids[rows["run"]], "client_code": rows["client_code"],
+                                    "product": products[rows["product"]],
+                                    "push_notification": self._push_texts(rows["push_offset"], rows["push_len"]),
+                                    "score": rows["score"]})
+
+    def export(self, path, run_id=None, chunk_rows=EXPORT_CHUNK):
+        # written chunk by chunk, so exporting never holds more than chunk_rows records
+        frames = self.iter_frames(run_id, chunk_rows)
+        if path.endswith(".parquet"):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("Parquet export needs pyarrow; export to a .csv path instead")
+            writer = None
+            try:
+                for df in frames:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    writer = writer or pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+            return
+        header = True
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for df in frames:
+                df.to_csv(f, index=False, header=header)
+                header = False
+            if header:
+                f.write("run_id,client_code,product,push_notification,score\n")
+
+    def stats(self):
+        return {"records": self.meta["records"], "clients": self.meta.get("clients", 0), "runs": len(self.meta["runs"]),
+                "push_bytes": self.meta["push_bytes"], "index_slots": len(self.index)}
+
+    def close(self):
+        self._close_pushes()
+        self._records = self.index = None
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+def suppress_repeats(table, archive, days):
+    # drop clients whose last archived push was the product they would get now
+    if archive is None or days is None:
+        return table, 0
+    repeat = archive.repeats(table.client_code, table.chosen_products(), days if days > 0 else None)
+    if not repeat.any():
+        return table, 0
+    return table.take(np.flatnonzero(~repeat)), int(repeat.sum())
@@ -0,0 +1,72 @@
+import os
+import json
+import queue
+import threading
+
+DEBUG_LEVELS = ["none", "summary", "full"]
+DEBUG_BATCH_SIZE = 1000
+
+def summarize_scores(record):
+    return {
+        "client_code": record["client_code"],
+        "chosen": record["chosen"],
+        "top4": record["top4"],
+        "scores": {p: v["score"] for p, v in record["product_scores"].items()},
+    }
+
+class DebugSink:
+    """Writes per-client debug records to one JSONL file from a background thread."""
+
+    def __init__(self, debug_dir, level="full", batch_size=DEBUG_BATCH_SIZE, filename="client_scores.jsonl"):
+        os.makedirs(debug_dir, exist_ok=True)
+        self.path = os.path.join(debug_dir, filename)
+        self.level = level
+        self.batch_size = batch_size
+        self.written = 0
+        self._batch = []
+        self._queue = queue.Queue(maxsize=16)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="debug-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                while True:
+                    batch = self._queue.get()
+                    if batch is None:
+                        break
+                    if self.level == "summary":
+                        batch = [summarize_scores(r) for r in batch]
+                    f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch))
+                    self.written += len(batch)
+        except Exception as e:
+            self._error = e
+            while self._queue.get() is not None:
+                pass
+
+def open_debug_sink(debug_dir, level):
+    return DebugSink(debug_dir, level) if level != "none" else None
@@ -1,12 +1,25 @@
+import io
 import os
+import re
 import json
+import hashlib
+import numpy as np
 import pandas as pd
-from typing import Tuple, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, Optional
+
+CLIENT_FILE_RE = re.compile(r"^client_(\d+)_(transactions|transfers)_3m\.csv$")
+TABLE_SCHEMAS = {
+    "transactions": {"date": "str", "category": "str", "amount": "float64", "currency": "str"},
+    "transfers": {"date": "str", "type": "str", "direction": "str", "amount": "float64", "currency": "str"},
+}
 
 def load_profiles(path: str) -> pd.DataFrame:
     return pd.read_csv(path)
 
-def load_client_files(data_dir: str, profiles: pd.DataFrame) -> Tuple[Dict[int, Dict[str, pd.DataFrame]], Dict[int, list]]:
+def load_client_files(data_dir: str, profiles: pd.DataFrame, cache=None) -> Tuple[Dict[int, Dict[str, pd.DataFrame]], Dict[int, list]]:
+    # with a ClientFileCache, unchanged files come back already parsed and typed
+    read = (lambda path, kind: cache.read(path, kind)) if cache is not None else (lambda path, kind: pd.read_csv(path))
     clients = {}
     missing = {}
     for _, row in profiles.iterrows():
@@ -16,11 +29,11 @@ def load_client_files(data_dir: str, profiles: pd.DataFrame) -> Tuple[Dict[int,
         clients[cid] = {}
         missing[cid] = []
         if os.path.exists(tx_file):
-            clients[cid]["transactions"] = pd.read_csv(tx_file)
+            clients[cid]["transactions"] = read(tx_file, "transactions")
         else:
             missing[cid].append(tx_file)
         if os.path.exists(tr_file):
-            clients[cid]["transfers"] = pd.read_csv(tr_file)
+            clients[cid]["transfers"] = read(tr_file, "transfers")
         else:
             missing[cid].append(tr_file)
         if not clients[cid]:
@@ -28,14 +41,170 @@ def load_client_files(data_dir: str, profiles: pd.DataFrame) -> Tuple[Dict[int,
     missing = {k:v for k,v in missing.items() if v}
     return clients, missing
 
-def write_results(results: Dict[int, dict], path: str):
-    rows = []
-    for cid, r in results.items():
-        rows.append({"client_code": cid, "product": r["product"], "push_notification": r["push"]})
-    df = pd.DataFrame(rows)
-    df.to_csv(path, index=False)
+def scan_client_files(data_dir: str) -> Dict[str, Dict[int, str]]:
+    found = {"transactions": {}, "transfers": {}}
+    with os.scandir(data_dir) as it:
+        for entry in it:
+            m = CLIENT_FILE_RE.match(entry.name)
+            if m and entry.is_file():
+                found[m.group(2)][int(m.group(1))] = os.path.join(data_dir, entry.name)
+    return found
+
+def empty_client_table(kind: str) -> pd.DataFrame:
+    cols = {"client_code": pd.Series(dtype="int64")}
+    for c, dtype in TABLE_SCHEMAS[kind].items():
+        cols[c] = pd.Series(dtype="datetime64[ns]" if c == "date" else dtype)
+    return pd.DataFrame(cols)
+
+def _read_client_table(path, cid: int, kind: str) -> pd.DataFrame:
+    schema = TABLE_SCHEMAS[kind]
+    try:
+        df = pd.read_csv(path, usecols=lambda c: c in schema, dtype=schema)
+    except ValueError:
+        if hasattr(path, "seek"):
+            path.seek(0)
+        df = pd.read_csv(path, usecols=lambda c: c in schema, dtype={c: t for c, t in schema.items() if t == "str"})
+        if "amount" in df.columns:
+            df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
+    df.insert(0, "client_code", cid)
+    return df
+
+def _scan_signature(files: Dict[str, Dict[int, str]]) -> str:
+    h = hashlib.sha1()
+    for kind in sorted(files):
+        for cid, path in sorted(files[kind].items()):
+            st = os.stat(path)
+            h.update(f"{kind}:{cid}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+def _read_table_cache(cache_dir: str, signature: str):
+    meta_path = os.path.join(cache_dir, "client_tables.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("signature") != signature:
+        return None
+    tables = []
+    for kind in ("transactions", "transfers"):
+        path = os.path.join(cache_dir, f"{kind}.{meta['format']}")
+        if not os.path.exists(path):
+            return None
+        tables.append(pd.read_parquet(path) if meta["format"] == "parquet" else pd.read_pickle(path))
+    return tables
+
+def _write_table_cache(cache_dir: str, signature: str, tables):
+    os.makedirs(cache_dir, exist_ok=True)
+    fmt = "parquet"
+    try:
+        for kind, df in zip(("transactions", "transfers"), tables):
+            df.to_parquet(os.path.join(cache_dir, f"{kind}.parquet"), index=False)
+    except ImportError:
+        fmt = "pkl"
+        for kind, df in zip(("transactions", "transfers"), tables):
+            df.to_pickle(os.path.join(cache_dir, f"{kind}.pkl"))
+    with open(os.path.join(cache_dir, "client_tables.json"), "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "format": fmt}, f)
+
+def _parse_table_dates(table: pd.DataFrame) -> pd.DataFrame:
+    from src.pipeline.preprocess import parse_date_column, DATE_FORMATS
+    if "date" in table.columns and not table.empty:
+        # the known formats in try_parsers order, each pass only over rows the previous ones left unparsed
+        table["date"] = parse_date_column(table["date"], formats=DATE_FORMATS)
+    return table
+
+def read_tail_bytes(path: str, offset: int = 0) -> Tuple[bytes, bytes, int]:
+    # complete lines appended after byte `offset`; a trailing line without a newline is left for the next read
+    with open(path, "rb") as f:
+        header = f.readline()
+        start = max(offset, len(header))
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    return header, data[:end], start + end
+
+def read_client_rows(header: bytes, bodies: Dict[int, bytes], kind: str) -> pd.DataFrame:
+    # rows of many clients whose files share one header, parsed in a single read_csv call
+    counts = [b.count(b"\n") for b in bodies.values()]
+    df = _read_client_table(io.BytesIO(header + b"".join(bodies.values())), 0, kind)
+    if len(df) != sum(counts):
+        # blank lines or quoted newlines: line counts can't attribute rows, parse per client
+        return pd.concat([_read_client_table(io.BytesIO(header + b), cid, kind) for cid, b in bodies.items()], ignore_index=True)
+    df["client_code"] = np.repeat(np.fromiter(bodies, dtype=np.int64, count=len(bodies)), counts)
+    return df
+
+def match_client_files(data_dir: str, profiles: pd.DataFrame, found: Dict[str, Dict[int, str]]) -> Tuple[Dict[str, Dict[int, str]], Dict[int, list]]:
+    files = {"transactions": {}, "transfers": {}}
+    missing = {}
+    for cid in profiles["client_code"].astype(int):
+        gone = []
+        for kind in ("transactions", "transfers"):
+            if cid in found[kind]:
+                files[kind][cid] = found[kind][cid]
+            else:
+                gone.append(os.path.join(data_dir, f"client_{cid}_{kind}_3m.csv"))
+        if gone:
+            missing[cid] = gone
+    return files, missing
+
+def load_client_tables(data_dir: str, profiles: pd.DataFrame, workers: Optional[int] = None, cache_dir: Optional[str] = None, found: Optional[Dict[str, Dict[int, str]]] = None) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[int, list]]:
+    if found is None:
+        found = scan_client_files(data_dir)
+    files, missing = match_client_files(data_dir, profiles, found)
+    signature = _scan_signature(files)
+    if cache_dir:
+        cached = _read_table_cache(cache_dir, signature)
+        if cached is not None:
+            return cached[0], cached[1], missing
+    tables = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for kind in ("transactions", "transfers"):
+            jobs = [pool.submit(_read_client_table, path, cid, kind) for cid, path in files[kind].items()]
+            frames = [j.result() for j in jobs]
+            tables.append(_parse_table_dates(pd.concat(frames, ignore_index=True)) if frames else empty_client_table(kind))
+    if cache_dir:
+        _write_table_cache(cache_dir, signature, tables)
+    return tables[0], tables[1], missing
+
+def missing_client_codes(missing: Dict[int, list], kind: str) -> set:
+    suffix = f"_{kind}_3m.csv"
+    return {cid for cid, paths in missing.items() if any(p.endswith(suffix) for p in paths)}
+
+def write_results(results: Dict[int, dict], path: str, append: bool = False):
+    cids = list(results)
+    write_result_columns(cids, [results[c]["product"] for c in cids], [results[c]["push"] for c in cids], path, append)
+
+def write_result_columns(client_codes, products: list, pushes: list, path: str, append: bool = False):
+    df = pd.DataFrame({"client_code": pd.Series(client_codes, dtype="int64"), "product": pd.Series(products, dtype=object),
+                       "push_notification": pd.Series(pushes, dtype=object)})
+    df.to_csv(path, index=False, mode="a" if append else "w", header=not append)
 
 def write_missing_report(missing: dict, debug_dir: str):
     os.makedirs(debug_dir, exist_ok=True)
     with open(os.path.join(debug_dir, "missing_files.json"), "w", encoding="utf-8") as f:
         json.dump(missing, f, ensure_ascii=False, indent=2)
+
+def write_date_format_report(hits: dict, debug_dir: str):
+    os.makedirs(debug_dir, exist_ok=True)
+    with open(os.path.join(debug_dir, "date_formats.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(hits), f, ensure_ascii=False, indent=2)
+
+def write_fx_report(stats: dict, debug_dir: str):
+    os.makedirs(debug_dir, exist_ok=True)
+    with open(os.path.join(debug_dir, "fx_report.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(stats), f, ensure_ascii=False, indent=2)
+
+def write_client_cache_report(stats: dict, debug_dir: str):
+    os.makedirs(debug_dir, exist_ok=True)
+    with open(os.path.join(debug_dir, "client_cache.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+
+def write_allocation_report(report: dict, debug_dir: str):
+    os.makedirs(debug_dir, exist_ok=True)
+    with open(os.path.join(debug_dir, "allocation_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+def write_paraphrase_report(stats: dict, debug_dir: str):
+    os.makedirs(debug_dir, exist_ok=True)
+    with open(os.path.join(debug_dir, "paraphrase_report.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
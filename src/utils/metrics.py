@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import bisect
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+STAGES = ["load", "preprocess", "features", "scoring", "generation", "ai", "write", "evaluation"]
+PROFILE_KINDS = ["cpu", "memory", "both"]
+PROFILE_TOP = 30
+METRIC_PREFIX = "push_pipeline"
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def parse_profile_stages(value):
+    if not value:
+        return set()
+    stages = set(STAGES) if value == "all" else {s.strip() for s in value.split(",") if s.strip()}
+    unknown = stages - set(STAGES)
+    if unknown:
+        raise ValueError(f"unknown stages for --profile: {sorted(unknown)} (choose from {STAGES} or all)")
+    return stages
+
+class RunMetrics:
+    """Wall time, CPU time, peak RSS and row counts per pipeline stage, summed over repeated calls."""
+
+    def __init__(self, profile=(), profile_kind="cpu", profile_dir=None):
+        self.profile = set(profile)
+        self.cpu = profile_kind in ("cpu", "both")
+        self.memory = profile_kind in ("memory", "both")
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self._profilers = {}
+        self._snapshots = {}
+        self._stack = []
+        self._start = (time.perf_counter(), time.process_time())
+        self.started_at = time.time()
+
+    def _fold_traced_peak(self):
+        # tracemalloc has a single peak counter; carry it into every open traced stage before resetting it
+        peak = tracemalloc.get_traced_memory()[1]
+        for call in self._stack:
+            if call.get("traced"):
+                call["traced_peak"] = max(call["traced_peak"], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name, rows=None, clients=None):
+        call = {"rows": rows, "clients": clients}
+        profiled = name in self.profile
+        profiler = None
+        if profiled and self.cpu and not any(c.get("profiler") for c in self._stack):
+            # cProfile cannot nest; an enclosing profiled stage already covers this one
+            profiler = call["profiler"] = self._profilers.setdefault(name, cProfile.Profile())
+        if profiled and self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                call["started_tracing"] = True
+            self._fold_traced_peak()
+            call["traced"] = True
+            call["traced_peak"] = 0
+        self._stack.append(call)
+        t, c = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield call
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            call["seconds"] = time.perf_counter() - t
+            call["cpu_seconds"] = time.process_time() - c
+            if call.get("traced"):
+                self._fold_traced_peak()
+                self._snapshots[name] = tracemalloc.take_snapshot()
+            self._stack.pop()
+            if call.get("started_tracing"):
+                tracemalloc.stop()
+            self._add(name, call)
+
+    def _add(self, name, call):
+        s = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "cpu_seconds": 0.0, "rows": None, "clients": None})
+        s["calls"] += 1
+        s["seconds"] += call["seconds"]
+        s["cpu_seconds"] += call["cpu_seconds"]
+        for k in ("rows", "clients"):
+            if call[k] is not None:
+                s[k] = (s[k] or 0) + int(call[k])
+        s["peak_rss_mb"] = peak_rss_mb()
+        if "traced_peak" in call:
+            s["traced_peak_mb"] = max(s.get("traced_peak_mb", 0), call["traced_peak"] / (1024 * 1024))
+
+    def report(self, **extra):
+        stages = {}
+        for name, s in self.stages.items():
+            s = dict(s)
+            for k in ("rows", "clients"):
+                if s[k] is not None:
+                    s[f"{k}_per_second"] = s[k] / s["seconds"] if s["seconds"] else None
+            stages[name] = s
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "seconds": time.perf_counter() - self._start[0],
+            "cpu_seconds": time.process_time() - self._start[1],
+            "peak_rss_mb": peak_rss_mb(),
+            **extra,
+            "stages": stages,
+        }
+
+    def write_profiles(self):
+        if not (self._profilers or self._snapshots):
+            return []
+        os.makedirs(self.profile_dir, exist_ok=True)
+        paths = []
+        for name, profiler in self._profilers.items():
+            path = os.path.join(self.profile_dir, f"{name}.prof")
+            profiler.dump_stats(path)
+            with open(os.path.join(self.profile_dir, f"{name}_cpu.txt"), "w", encoding="utf-8") as f:
+                pstats.Stats(path, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            paths.append(path)
+        for name, snapshot in self._snapshots.items():
+            path = os.path.join(self.profile_dir, f"{name}_memory.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"traced peak {self.stages[name]['traced_peak_mb']:.1f} MB; largest live allocations at stage end:\n")
+                f.write("".join(f"{stat}\n" for stat in snapshot.statistics("lineno")[:PROFILE_TOP]))
+            paths.append(path)
+        return paths
+
+def _labels(**labels):
+    return ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+
+def prometheus_lines(report, mode):
+    series = [
+        ("stage_seconds", "Wall time spent in a pipeline stage.", "seconds"),
+        ("stage_cpu_seconds", "Process CPU time spent in a pipeline stage.", "cpu_seconds"),
+        ("stage_calls", "Times a pipeline stage ran (one per chunk in stream mode).", "calls"),
+        ("stage_rows", "Rows processed by a pipeline stage.", "rows"),
+        ("stage_clients", "Clients processed by a pipeline stage.", "clients"),
+        ("stage_peak_rss_bytes", "Process peak RSS when a pipeline stage last finished.", "peak_rss_mb"),
+    ]
+    lines = []
+    for metric, help_text, key in series:
+        values = [(name, s[key]) for name, s in report["stages"].items() if s.get(key) is not None]
+        if not values:
+            continue
+        lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {METRIC_PREFIX}_{metric} gauge"]
+        scale = 1024 * 1024 if key == "peak_rss_mb" else 1
+        lines += [f"{METRIC_PREFIX}_{metric}{{{_labels(mode=mode, stage=name)}}} {float(v * scale)!r}" for name, v in values]
+    run = [("run_seconds", "Wall time of the whole run.", report["seconds"]),
+           ("run_cpu_seconds", "Process CPU time of the whole run.", report["cpu_seconds"]),
+           ("run_clients", "Clients in the run.", report.get("clients")),
+           ("run_peak_rss_bytes", "Process peak RSS of the run.", report["peak_rss_mb"] and report["peak_rss_mb"] * 1024 * 1024),
+           ("run_last_success_timestamp_seconds", "Unix time the run finished.", time.time())]
+    for metric, help_text, v in run:
+        if v is not None:
+            lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {METRIC_PREFIX}_{metric} gauge",
+                      f"{METRIC_PREFIX}_{metric}{{{_labels(mode=mode)}}} {float(v)!r}"]
+    return lines
+
+def write_prometheus_textfile(report, path, mode):
+    # written to a temp file and renamed, so a textfile collector never reads a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(prometheus_lines(report, mode)) + "\n")
+    os.replace(tmp, path)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram in the Prometheus layout, updated from several threads."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        # linear inside the bucket that holds the q-th observation; the overflow bucket ends at the largest one seen
+        with self._lock:
+            counts, count, top = list(self.counts), self.count, self.max
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else max(top, lo)
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return top
+
+    def snapshot(self):
+        ms = lambda v: None if v is None else v * 1000
+        with self._lock:
+            cumulative = [sum(self.counts[:i + 1]) for i in range(len(self.buckets))]
+            count, total, top = self.count, self.sum, self.max
+        return {"count": count, "mean_ms": total / count * 1000 if count else None, "max_ms": top * 1000,
+                "p50_ms": ms(self.quantile(0.5)), "p90_ms": ms(self.quantile(0.9)), "p99_ms": ms(self.quantile(0.99)),
+                "buckets_ms": {f"{le * 1000:g}": c for le, c in zip(self.buckets, cumulative)}}
+
+def histogram_lines(metric, help_text, histograms, **labels):
+    lines = [f"# HELP {METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {METRIC_PREFIX}_{metric} histogram"]
+    for name, h in histograms.items():
+        with h._lock:
+            counts, count, total = list(h.counts), h.count, h.sum
+        running = 0
+        for le, c in zip(h.buckets + ["+Inf"], counts):
+            running += c
+            lines.append(f"{METRIC_PREFIX}_{metric}_bucket{{{_labels(**labels, stage=name, le=le if isinstance(le, str) else f'{le:g}')}}} {running}")
+        lines.append(f"{METRIC_PREFIX}_{metric}_sum{{{_labels(**labels, stage=name)}}} {total!r}")
+        lines.append(f"{METRIC_PREFIX}_{metric}_count{{{_labels(**labels, stage=name)}}} {count}")
+    return lines
+
+_RUN = RunMetrics()
+
+def start_run(profile=(), profile_kind="cpu", profile_dir=None):
+    global _RUN
+    _RUN = RunMetrics(profile, profile_kind, profile_dir)
+    return _RUN
+
+def current_run():
+    return _RUN
+
+def stage(name, rows=None, clients=None):
+    return _RUN.stage(name, rows=rows, clients=clients)
+
+def finish_run(debug_dir, mode, textfile=None, **extra):
+    run = _RUN
+    report = run.report(mode=mode, **extra)
+    report["profiles"] = run.write_profiles()
+    with open(os.path.join(debug_dir, "run_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if textfile:
+        write_prometheus_textfile(report, textfile, mode)
+    return report
+
+def format_stages(report):
+    return ", ".join(f"{name} {s['seconds']:.2f}s" for name, s in report["stages"].items())
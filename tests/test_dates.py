@@ -0,0 +1,42 @@
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from src.bench.dates import make_dates, MIXED_FORMATS
+from src.pipeline.preprocess import try_parsers, parse_date_column
+
+def fuzz_corpus(n, seed):
+    # mostly formatted dates, plus the cells real exports contain: blanks, epoch numbers, junk and near-miss formats
+    rnd = random.Random(seed)
+    start = pd.Timestamp("2025-01-01").value // 10**9
+    out = []
+    for _ in range(n):
+        ts = pd.Timestamp(start + rnd.randint(0, 365 * 86400), unit="s")
+        kind = rnd.random()
+        if kind < 0.6:
+            out.append(ts.strftime(rnd.choice(MIXED_FORMATS)))
+        elif kind < 0.7:
+            out.append(rnd.choice([None, np.nan, "", " ", "n/a", "2025-13-01", "31.02.2025", "2025/06/31", "yesterday"]))
+        elif kind < 0.8:
+            out.append(rnd.choice([int(ts.value // 10**9), float(ts.value // 10**9), ts]))
+        elif kind < 0.9:
+            out.append(ts.strftime(rnd.choice(["%d-%m-%Y", "%m/%d/%Y", "%Y.%m.%d", "%d %b %Y", "%Y-%m-%d %H:%M"])))
+        else:
+            out.append(" " + ts.strftime(MIXED_FORMATS[0]) + " ")
+    return pd.Series(out, name="date", dtype=object)
+
+def test_matches_try_parsers_on_dominant_format():
+    s = make_dates(5000, mixed_share=0.05)
+    pd.testing.assert_series_equal(parse_date_column(s), s.apply(try_parsers))
+
+# the near-miss formats reach try_parsers' format-less fallback, which warns about dayfirst
+@pytest.mark.filterwarnings("ignore::UserWarning")
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_try_parsers_on_fuzz_corpus(seed):
+    s = fuzz_corpus(1500, seed)
+    pd.testing.assert_series_equal(parse_date_column(s), s.apply(try_parsers))
+
+@pytest.mark.parametrize("values", [[], [None, np.nan], ["2025-06-01"], [1751328000, "2025-06-01", None]])
+def test_matches_try_parsers_on_edge_columns(values):
+    s = pd.Series(values, name="date", dtype=object)
+    pd.testing.assert_series_equal(parse_date_column(s), s.apply(try_parsers))
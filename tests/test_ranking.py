@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from src.bench.ranking import make_signals, exact_reference, ERROR_BOUND_FACTOR
+from src.pipeline.ranking import ExactRanks, QuantileSketch, load_rank_engine
+
+@pytest.fixture(scope="module")
+def values():
+    return make_signals(100_000, np.random.default_rng(0))
+
+def test_exact_ranks_match_rankdata(values):
+    expected = exact_reference(values[:20_000])
+    assert np.array_equal(ExactRanks().fit_normalize(values[:20_000]), expected)
+    merged = ExactRanks().update(values[:7_000]).merge(ExactRanks().update(values[7_000:20_000]))
+    assert np.array_equal(merged.normalize(values[:20_000]), expected)
+
+@pytest.mark.parametrize("k,seed", [(200, 0), (200, 1), (500, 2)])
+def test_sketch_rank_error_within_bound(values, k, seed):
+    exact = exact_reference(values)
+    sketch = QuantileSketch(k=k, seed=seed).update(values)
+    assert sketch.size() < len(values)
+    assert np.abs(sketch.normalize(values) - exact).max() <= ERROR_BOUND_FACTOR / k
+
+def test_merged_sketch_rank_error_within_bound(values):
+    k = 200
+    merged = QuantileSketch(k=k)
+    for i, part in enumerate(np.array_split(values, 8)):
+        merged.merge(QuantileSketch(k=k, seed=i + 1).update(part))
+    assert merged.n == len(values)
+    assert np.abs(merged.normalize(values) - exact_reference(values)).max() <= ERROR_BOUND_FACTOR / k
+
+def test_saved_sketch_scores_the_same(values, tmp_path):
+    sketch = QuantileSketch(k=200).update(values)
+    path = str(tmp_path / "sketch.npz")
+    sketch.save(path)
+    assert np.array_equal(load_rank_engine(path).normalize(values[:1000]), sketch.normalize(values[:1000]))
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.bench.synthetic import make_tables
+from src.bench.fx import write_rate_table
+from src.bench.signals import legacy_signals
+from src.pipeline.fx import load_fx_rates
+from src.pipeline.features import compute_signals_frame, iter_signal_dicts
+
+@pytest.fixture(scope="module")
+def tables():
+    return make_tables(150, seed=3)
+
+@pytest.mark.parametrize("fx", [False, True])
+def test_batch_signals_match_per_client(tables, fx, tmp_path):
+    profiles, transactions, transfers = tables
+    rates = None
+    if fx:
+        days = pd.date_range(transactions["date"].min().normalize() + pd.Timedelta(days=7), periods=120)
+        rates = load_fx_rates(write_rate_table(str(tmp_path / "rates.csv"), days, np.random.default_rng(0)))
+    batch = dict(iter_signal_dicts(*compute_signals_frame(transactions, transfers, profiles, rates=rates)))
+    legacy = legacy_signals(profiles, transactions, transfers, rates)
+    assert list(batch) == list(legacy)
+    for cid, s in legacy.items():
+        assert batch[cid] == s, cid
@@ -0,0 +1,35 @@
+import json
+import numpy as np
+from src.bench.templates import GOLDEN_PATH, random_columns
+from src.pipeline.scorer import PRODUCTS
+from src.pipeline.generator import make_template, render_templates, template_columns, validate_push_text, validate_push_texts
+
+def load_golden():
+    # expected texts were produced by the original per-client if-chain make_template
+    with open(GOLDEN_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def test_golden_covers_every_product():
+    assert set(PRODUCTS) <= {c["product"] for c in load_golden()}
+
+def test_render_templates_matches_golden():
+    cases = load_golden()
+    texts = render_templates([c["product"] for c in cases], template_columns([c["signals"] for c in cases], [c["benefit"] for c in cases]))
+    assert [str(t) for t in texts] == [c["text"] for c in cases]
+
+def test_make_template_matches_golden():
+    for c in load_golden():
+        assert make_template(c["product"], c["signals"], c["benefit"]) == c["text"], c["product"]
+
+def test_render_templates_matches_make_template():
+    cols, products = random_columns(500, np.random.default_rng(1))
+    texts = render_templates(products, cols)
+    for i in range(len(products)):
+        signals = {k: cols[k][i] for k in ("name", "month_reference", "trips_count", "trips_sum", "taxi_sum",
+                                           "avg_monthly_balance_KZT", "restaurant_sum", "spare_cash")}
+        signals["top3_cats"] = [cols[f"top3_cat_{k + 1}"][i] for k in range(3)]
+        assert make_template(products[i], signals, cols["benefit"][i]) == texts[i]
+
+def test_bulk_validation_matches_per_text():
+    texts = [c["text"] for c in load_golden()] + [None, "x" * 200, "!" * 2 + "x" * 198, "a:" + "x" * 190, "x" * 179, "x" * 221]
+    assert validate_push_texts(texts).tolist() == [validate_push_text(t) for t in texts]